@@ -0,0 +1,348 @@
+"""
+Benchmarks for bulk Firestore operations
+
+Runs against the Firestore emulator, never a real project:
+
+    firebase emulators:start --only firestore
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmark.py bulk-delete --docs 5000
+
+In-memory benchmarks need no emulator:
+
+    python benchmark.py attendance-memory --members 50000 --weeks 260
+    python benchmark.py responses
+    python benchmark.py export-formats --members 20000 --weeks 520
+    python benchmark.py csv-import --rows 50000 --weeks 260
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from services.firebase_service import FirebaseService
+from utils.attendance_bits import AttendanceBits
+from utils.snapshot import SNAPSHOT_FORMATS, member_record, open_snapshot_writer
+
+BENCHMARK_COLLECTION = "benchmark_morphers"
+
+def make_service() -> FirebaseService:
+    """FirebaseService wired to the emulator with anonymous credentials"""
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set; refusing to benchmark against a real project")
+
+    from google.cloud import firestore
+
+    service = FirebaseService(project_id="demo-benchmark", private_key_path="", defer_init=True)
+    service.db = firestore.Client(project="demo-benchmark")
+    service._initialized = True
+    return service
+
+async def seed(service: FirebaseService, count: int) -> None:
+    """Fill the benchmark collection with member-shaped documents"""
+    members = [
+        {
+            "Name": f"Member {i}",
+            "MorphersNumber": f"77{i:07d}",
+            "School": "Benchmark High School",
+            "Class": "S1",
+            "Residence": "Lubowa",
+            "Cell": "0",
+            "attendance": {"07_01_2024": "1", "14_01_2024": "2"}
+        }
+        for i in range(count)
+    ]
+    await service.batch_create_documents(BENCHMARK_COLLECTION, members)
+
+async def sequential_delete(service: FirebaseService, batch_size: int = 500) -> int:
+    """The previous algorithm: read a full page, commit, repeat"""
+    deleted = 0
+    while True:
+        docs = await service._run_in_executor(
+            lambda **rpc: list(service.db.collection(BENCHMARK_COLLECTION).limit(batch_size).stream(**rpc))
+        )
+        if not docs:
+            return deleted
+
+        batch = service.db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        await service._run_in_executor(batch.commit)
+        deleted += len(docs)
+
+async def bench_bulk_delete(docs: int, concurrency: int) -> None:
+    service = make_service()
+
+    await seed(service, docs)
+    start = time.perf_counter()
+    deleted = await sequential_delete(service)
+    sequential = time.perf_counter() - start
+    print(f"Sequential delete:  {deleted} docs in {sequential:.2f}s")
+
+    await seed(service, docs)
+    start = time.perf_counter()
+    deleted = await service.batch_delete_collection(BENCHMARK_COLLECTION, max_concurrency=concurrency)
+    pipelined = time.perf_counter() - start
+    print(f"Pipelined delete:   {deleted} docs in {pipelined:.2f}s (concurrency {concurrency})")
+
+    print(f"Speedup: {sequential / pipelined:.1f}x")
+    service.close()
+
+def bench_attendance_memory(members: int, weeks: int, rate: float) -> None:
+    """Memory held by attendance maps vs bitsets for a simulated congregation"""
+    random.seed(0)
+    sundays = [(date(2020, 1, 5) + timedelta(weeks=week)).strftime('%d_%m_%Y') for week in range(weeks)]
+    history = [
+        {sunday: random.choice('123') for sunday in sundays if random.random() < rate}
+        for _ in range(members)
+    ]
+    records = sum(len(attendance) for attendance in history)
+
+    def measure(build):
+        # Timed untraced; tracemalloc slows allocation-heavy code severalfold
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        built = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return built, size, elapsed
+
+    _, dict_size, dict_time = measure(lambda: [dict(attendance) for attendance in history])
+    bits, bits_size, bits_time = measure(lambda: [AttendanceBits.from_dict(attendance) for attendance in history])
+    assert all(b.to_dict() == attendance for b, attendance in zip(bits, history))
+
+    print(f"{members} members, {weeks} Sundays, {records} attendance records")
+    print(f"Dicts:    {dict_size / 2**20:8.1f} MiB (built in {dict_time:.2f}s)")
+    print(f"Bitsets:  {bits_size / 2**20:8.1f} MiB (built in {bits_time:.2f}s)")
+    print(f"Reduction: {dict_size / bits_size:.1f}x")
+
+def bench_responses(weeks: int, schools: int, repeat: int) -> None:
+    """
+    Request time through a FastAPI app for typical large payloads, comparing
+    how the routes have rendered them, plus their compressed size
+    """
+    from fastapi import FastAPI
+    from fastapi.middleware.gzip import GZipMiddleware
+    from fastapi.responses import JSONResponse
+    from fastapi.testclient import TestClient
+    from models import APIResponse
+    from utils.responses import FastJSONResponse, dumps
+
+    random.seed(0)
+    now = datetime.utcnow()
+    member = {
+        "id": "a1b2c3", "name": "Member Name", "morphers_number": "+256700000000",
+        "school": "Benchmark High School", "class": "S4", "residence": "Lubowa", "cell": "1",
+        "attendance": {
+            (date(2020, 1, 5) + timedelta(weeks=week)).strftime('%d_%m_%Y'): random.choice('123')
+            for week in range(weeks)
+        },
+        "created_at": now, "last_updated": now
+    }
+    stats = {
+        "total_members": schools * 40, "active_members": schools * 30, "recent_registrations": 120,
+        "by_cell": {"Yes": schools * 10, "No": schools * 30},
+        "by_service": {"1": 52000, "2": 48000, "3": 31000},
+        "by_school": {f"School number {i}": random.randint(1, 80) for i in range(schools)},
+        "by_residence": {f"Residence {i}": random.randint(1, 80) for i in range(schools)}
+    }
+    payloads = {"member": {"member": member}, "stats": stats}
+
+    # Each app mirrors main.py's middleware and serves the payloads one way
+    def make_app(response_class, direct: bool) -> FastAPI:
+        app = FastAPI(default_response_class=response_class)
+        app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+        @app.get("/{label}", response_model=APIResponse)
+        async def payload(label: str):
+            if direct:
+                return FastJSONResponse({"success": True, "message": "Retrieved successfully", "data": payloads[label], "error": None})
+            return APIResponse(success=True, message="Retrieved successfully", data=payloads[label])
+
+        return app
+
+    variants = (
+        ("JSONResponse via response_model", make_app(JSONResponse, False)),
+        ("orjson via response_model", make_app(FastJSONResponse, False)),
+        ("orjson returned directly", make_app(FastJSONResponse, True))
+    )
+
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    for label in payloads:
+        timings = []
+        for name, app in variants:
+            with TestClient(app) as client:
+                assert client.get(f"/{label}").status_code == 200
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    client.get(f"/{label}")
+                timings.append((name, (time.perf_counter() - start) / repeat))
+
+        body = dumps({"success": True, "message": "Retrieved successfully", "data": payloads[label], "error": None})
+        print(f"{label}: {len(body)} bytes JSON, per request through the app")
+        for name, elapsed in timings:
+            print(f"  {name:33s} {elapsed * 1e6:8.0f} us ({timings[0][1] / elapsed:.2f}x)")
+        print(f"  gzip:            {len(gzip.compress(body, 9))} bytes")
+        if brotli:
+            print(f"  brotli (q4):     {len(brotli.compress(body, quality=4))} bytes")
+
+def bench_export_formats(members: int, weeks: int, rate: float, page_size: int) -> None:
+    """Size, write time and parse time of the CSV export vs NDJSON and Parquet snapshots"""
+    import csv
+    import orjson
+    from services.data_service import DataService
+
+    random.seed(0)
+    now = datetime.utcnow()
+    sundays = [(date(2020, 1, 5) + timedelta(weeks=week)).strftime('%d_%m_%Y') for week in range(weeks)]
+    documents = [
+        {
+            "id": f"member{i:06d}", "Name": f"Member {i}", "MorphersNumber": f"7{i:08d}",
+            "ParentsName": f"Parent {i}", "ParentsNumber": f"7{i + 1:08d}", "School": f"School {i % 400}",
+            "Class": "S4", "Residence": f"Residence {i % 200}", "Cell": random.choice('01'),
+            "attendance": {sunday: random.choice('123') for sunday in sundays[joined:] if random.random() < rate},
+            "createdAt": now, "lastUpdated": now
+        }
+        for i, joined in enumerate(random.randrange(weeks) for _ in range(members))
+    ]
+    print(f"{members} members, {sum(len(d['attendance']) for d in documents)} attendance records")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        csv_path = os.path.join(directory, "export.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(DataService(None).members_to_csv(documents))
+        results = [("csv", csv_path, time.perf_counter() - start)]
+
+        for fmt in SNAPSHOT_FORMATS:
+            try:
+                writer = open_snapshot_writer(fmt, os.path.join(directory, f"export{SNAPSHOT_FORMATS[fmt][0]}"))
+            except ValueError as e:
+                print(f"{fmt}: skipped ({e})")
+                continue
+            start = time.perf_counter()
+            for offset in range(0, members, page_size):
+                writer.write([member_record(document) for document in documents[offset:offset + page_size]])
+            writer.close()
+            results.append((fmt, writer.path, time.perf_counter() - start))
+
+        def parse(fmt: str, path: str) -> None:
+            if fmt == "csv":
+                with open(path, newline="", encoding="utf-8") as f:
+                    list(csv.DictReader(f))
+            elif fmt == "ndjson":
+                with gzip.open(path, "rb") as f:
+                    [orjson.loads(line) for line in f]
+            else:
+                import pyarrow.parquet as pq
+                pq.read_table(path)
+
+        csv_size = os.path.getsize(csv_path)
+        for fmt, path, write_time in results:
+            start = time.perf_counter()
+            parse(fmt, path)
+            parse_time = time.perf_counter() - start
+            size = os.path.getsize(path)
+            print(f"{fmt:8} {size / 2**20:8.2f} MiB ({csv_size / size:5.1f}x smaller)  "
+                  f"write {write_time:6.2f}s  parse {parse_time:6.2f}s")
+
+def bench_csv_import(rows: int, weeks: int, rate: float, phones: int) -> None:
+    """Row-wise vs pandas CSV import parsing on a generated file drawing from a pool of phone numbers"""
+    from services.data_service import DataService
+
+    random.seed(0)
+    sundays = [(date(2020, 1, 5) + timedelta(weeks=week)).strftime('%d_%m_%Y') for week in range(weeks)]
+    pool = [f"7{random.randint(50000000, 99999999)}" for _ in range(phones)]
+
+    def phone() -> str:
+        # Mostly the stored national format, as in an export, with some hand-typed variants
+        return random.choice(["0{}", "+256{}", "256 {}"]).format(random.choice(pool)) if random.random() < 0.2 else random.choice(pool)
+
+    documents = [
+        {
+            "id": f"member{i:06d}", "Name": f"Member {i}" if random.random() > 0.01 else "",
+            "MorphersNumber": phone(), "ParentsName": f"Parent {i}", "ParentsNumber": phone(),
+            "School": f"School {i % 400}", "Class": "S4", "Residence": f"Residence {i % 200}",
+            "Cell": random.choice(['0', '1', '']),
+            "attendance": {sunday: random.choice('123') for sunday in sundays[joined:] if random.random() < rate}
+        }
+        for i, joined in enumerate(random.randrange(weeks) for _ in range(rows))
+    ]
+    service = DataService(None)
+    content = service.members_to_csv(documents)
+    print(f"{rows} rows, {len(sundays)} attendance columns, {len(content) / 2**20:.1f} MiB CSV")
+
+    # Import libraries up front so neither path is charged for loading them
+    import pandas  # noqa: F401
+    import phonenumbers  # noqa: F401
+
+    start = time.perf_counter()
+    row_wise = service._parse_csv_rows(io.StringIO(content))
+    row_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = service._parse_csv_frames(io.StringIO(content))
+    frame_time = time.perf_counter() - start
+
+    assert row_wise == vectorized, "pandas parser disagrees with the row parser"
+    print(f"Row-wise:   {row_time:6.2f}s ({len(row_wise[0])} members, {len(row_wise[2])} errors)")
+    print(f"Vectorized: {frame_time:6.2f}s")
+    print(f"Speedup: {row_time / frame_time:.1f}x")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    bulk_delete = subparsers.add_parser("bulk-delete", help="Sequential vs pipelined batch_delete_collection")
+    bulk_delete.add_argument("--docs", type=int, default=5000)
+    bulk_delete.add_argument("--concurrency", type=int, default=4)
+
+    attendance_memory = subparsers.add_parser("attendance-memory", help="Attendance dicts vs AttendanceBits memory")
+    attendance_memory.add_argument("--members", type=int, default=50000)
+    attendance_memory.add_argument("--weeks", type=int, default=260)
+    attendance_memory.add_argument("--rate", type=float, default=0.5, help="Chance a member attends a given Sunday")
+
+    responses = subparsers.add_parser("responses", help="Default JSON vs orjson serialization and compressed sizes")
+    responses.add_argument("--weeks", type=int, default=260, help="Attendance records in the member payload")
+    responses.add_argument("--schools", type=int, default=400, help="Schools and residences in the stats payload")
+    responses.add_argument("--repeat", type=int, default=200)
+
+    export_formats = subparsers.add_parser("export-formats", help="CSV export vs NDJSON and Parquet snapshots")
+    export_formats.add_argument("--members", type=int, default=20000)
+    export_formats.add_argument("--weeks", type=int, default=520)
+    export_formats.add_argument("--rate", type=float, default=0.3, help="Chance a member attends a Sunday after joining")
+    export_formats.add_argument("--page-size", type=int, default=1000, help="Members per snapshot row group")
+
+    csv_import = subparsers.add_parser("csv-import", help="Row-wise vs pandas CSV import parsing")
+    csv_import.add_argument("--rows", type=int, default=50000)
+    csv_import.add_argument("--weeks", type=int, default=260)
+    csv_import.add_argument("--rate", type=float, default=0.3, help="Chance a member attends a Sunday after joining")
+    csv_import.add_argument("--phones", type=int, default=30000, help="Distinct phone numbers the rows draw from")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "bulk-delete":
+        asyncio.run(bench_bulk_delete(args.docs, args.concurrency))
+    elif args.benchmark == "attendance-memory":
+        bench_attendance_memory(args.members, args.weeks, args.rate)
+    elif args.benchmark == "responses":
+        bench_responses(args.weeks, args.schools, args.repeat)
+    elif args.benchmark == "export-formats":
+        bench_export_formats(args.members, args.weeks, args.rate, args.page_size)
+    elif args.benchmark == "csv-import":
+        bench_csv_import(args.rows, args.weeks, args.rate, args.phones)
+
+if __name__ == "__main__":
+    main()
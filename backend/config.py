@@ -2,7 +2,7 @@
 Configuration settings for the FastAPI application
 """
 import os
-from typing import List
+from typing import List, Dict, Tuple
 try:
     from pydantic_settings import BaseSettings
 except ImportError:
@@ -23,6 +23,36 @@ class Settings(BaseSettings):
     PORT: int = 8000
     DEBUG: bool = True
     
+    # Fast startup: initialize Firebase in the background instead of blocking
+    # startup, so scale-from-zero instances accept requests sooner
+    FAST_STARTUP: bool = False
+    
+    # Responses smaller than this many bytes are sent uncompressed
+    COMPRESSION_MIN_SIZE: int = 1000
+    # Seconds a member version or statistics result is reused for conditional GETs
+    # without re-reading Firestore; bounds staleness from other instances' writes
+    HTTP_CACHE_TTL: float = 30.0
+    
+    # Rate limiting: token buckets per client IP (all routes), plus per route for the routes listed
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_RATE: float = 20.0  # Requests per second per client IP
+    RATE_LIMIT_BURST: int = 60
+    RATE_LIMIT_ROUTES: Dict[str, Tuple[float, int]] = {
+        "POST /api/members/search": (5.0, 15),
+        "POST /api/members/search/household": (5.0, 15),
+        "POST /api/auth/login": (0.5, 5),
+    }
+    # Use the first X-Forwarded-For address as the client IP; only behind a proxy that sets it
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False
+    
+    # Data uploads (POST /api/data/import and /api/data/restore)
+    IMPORT_MAX_BYTES: int = 50 * 1024 * 1024  # Larger request bodies get a 413, checked while they arrive
+    IMPORT_MAX_ROWS: int = 100000  # CSV imports with more data rows are rejected
+    
+    # Live check-in feed (GET /api/attendance/stream)
+    LIVE_FEED_CLIENT_BUFFER: int = 100  # Messages buffered per client before it is reset to a snapshot
+    LIVE_FEED_KEEPALIVE: float = 15.0  # Seconds between keepalive comments on an idle stream
+    
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 hours
@@ -30,6 +60,28 @@ class Settings(BaseSettings):
     # Firebase settings
     FIREBASE_PROJECT_ID: str = os.getenv("FIREBASE_PROJECT_ID", "")
     FIREBASE_PRIVATE_KEY_PATH: str = os.getenv("FIREBASE_PRIVATE_KEY_PATH", "")
+    FIRESTORE_MAX_WORKERS: int = 0  # Thread pool size for Firestore calls, 0 = asyncio default
+    FIRESTORE_MAX_QUEUE: int = 100  # Calls waiting for a pool thread before new ones are shed with 503
+    FIRESTORE_QUEUE_TIMEOUT: float = 2.0  # Seconds a call may wait for a thread before it is shed
+    FIRESTORE_CALL_TIMEOUT: float = 10.0  # Deadline per Firestore call, including retries
+    FIRESTORE_SCAN_TIMEOUT: float = 60.0  # Deadline for reads of a whole collection in one call
+    FIRESTORE_RETRY_ATTEMPTS: int = 3  # Attempts for calls failing with transient errors (UNAVAILABLE, ABORTED...)
+    FIRESTORE_BREAKER_THRESHOLD: int = 5  # Consecutive transient failures that open the circuit breaker
+    FIRESTORE_BREAKER_RESET: float = 30.0  # Seconds the breaker fails calls fast before trying Firestore again
+    
+    # Look phones up in the derived phones array instead of an OR over both number fields;
+    # enable after POST /api/data/reindex has run
+    USE_SEARCH_KEYS: bool = False
+    BULK_WRITE_MAX_CONCURRENCY: int = 4  # Parallel batch commits for backfills and bulk deletes
+    ATTENDANCE_ARCHIVE_HORIZON_DAYS: int = 730  # POST /api/data/archive moves older attendance out of members
+    JOBS_MAX_CONCURRENCY: int = 1  # Background admin jobs (import, export, dedup, reindex) run at once; others queue
+    JOBS_OUTPUT_DIR: str = ""  # Where job output files (exports) are written, "" = system temp dir
+    JOBS_MAX_HISTORY: int = 100  # Finished jobs kept in memory (and their output files) per instance
+    
+    # Readiness probe settings
+    READINESS_PROBE_INTERVAL: float = 10.0  # Seconds between Firestore probes (cached in between)
+    READINESS_PROBE_TIMEOUT: float = 2.0
+    READINESS_MAX_SATURATION: float = 0.9  # Report not-ready above this executor saturation
     
     # Admin settings
     AUTHORIZED_ADMIN_EMAILS: List[str] = os.getenv(
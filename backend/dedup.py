@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Find (and optionally merge) duplicate member registrations
+
+    python dedup.py                  # report only
+    python dedup.py --merge          # merge attendance and delete duplicates
+"""
+import argparse
+import asyncio
+import json
+
+from config import settings
+from services.firebase_service import FirebaseService
+from services.dedup_service import DedupService
+
+async def run(threshold: float, merge: bool) -> None:
+    firebase_service = FirebaseService(
+        project_id=settings.FIREBASE_PROJECT_ID,
+        private_key_path=settings.FIREBASE_PRIVATE_KEY_PATH
+    )
+    try:
+        result = await DedupService(firebase_service).find_duplicates(threshold=threshold, merge=merge)
+        print(json.dumps(result, indent=2, default=str))
+    finally:
+        firebase_service.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find duplicate member registrations")
+    parser.add_argument("--threshold", type=float, default=0.88, help="Minimum name similarity (0-1)")
+    parser.add_argument("--merge", action="store_true", help="Merge attendance and delete duplicates")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.threshold, args.merge))
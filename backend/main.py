@@ -3,15 +3,18 @@
 Main FastAPI application for Lubowa Morph Registration Backend
 """
 
+import asyncio
 import os
+import shutil
 import sys
+import tempfile
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Query, Header, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 from contextlib import asynccontextmanager
-import uvicorn
 from typing import List, Optional, Dict, Any
 import logging
 
@@ -22,6 +25,8 @@ sys.path.insert(0, str(backend_dir))
 from config import settings
 from models import (
     MemberSearchRequest, 
+    HouseholdSearchRequest,
+    MemberBatchGetRequest,
     MemberCreateRequest, 
     MemberUpdateRequest, 
     MemberResponse,
@@ -35,8 +40,19 @@ from services.firebase_service import FirebaseService
 from services.auth_service import AuthService
 from services.member_service import MemberService
 from services.data_service import DataService
+from utils.snapshot import SNAPSHOT_FORMATS, check_snapshot_format, detect_snapshot_format
+from services.health_service import HealthService
+from services.dedup_service import DedupService
+from services.analytics_service import AnalyticsService
+from services.archive_service import ArchiveService
+from services.version_service import VersionService, make_etag, etag_matches
+from services.live_service import LiveService
+from services.job_service import JobService, Job
+from services.events import EventBus
 from utils.validation import PhoneValidator
-from utils.exceptions import ValidationError, AuthenticationError, NotFoundError
+from utils.exceptions import ValidationError, AuthenticationError, NotFoundError, PayloadTooLargeError
+from utils.responses import ExcludingGZipMiddleware, FastJSONResponse
+from utils.admission import AdmissionMiddleware, BodySizeLimitMiddleware, RateLimiter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -47,18 +63,44 @@ firebase_service = None
 auth_service = None
 member_service = None
 data_service = None
+health_service = None
+dedup_service = None
+analytics_service = None
+archive_service = None
+live_service = None
+job_service = None
+events = EventBus()
+version_service = VersionService(events, ttl=settings.HTTP_CACHE_TTL)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize services on startup"""
-    global firebase_service, auth_service, member_service, data_service
+    global firebase_service, auth_service, member_service, data_service, health_service, dedup_service, analytics_service, archive_service, live_service, job_service
     
     try:
-        # Initialize Firebase service
+        # Initialize Firebase service (in the background in fast-startup mode)
         firebase_service = FirebaseService(
             project_id=settings.FIREBASE_PROJECT_ID,
-            private_key_path=settings.FIREBASE_PRIVATE_KEY_PATH
+            private_key_path=settings.FIREBASE_PRIVATE_KEY_PATH,
+            defer_init=settings.FAST_STARTUP,
+            max_workers=settings.FIRESTORE_MAX_WORKERS or None,
+            use_search_keys=settings.USE_SEARCH_KEYS,
+            max_queue=settings.FIRESTORE_MAX_QUEUE,
+            queue_timeout=settings.FIRESTORE_QUEUE_TIMEOUT,
+            call_timeout=settings.FIRESTORE_CALL_TIMEOUT,
+            scan_timeout=settings.FIRESTORE_SCAN_TIMEOUT,
+            retry_attempts=settings.FIRESTORE_RETRY_ATTEMPTS,
+            breaker_threshold=settings.FIRESTORE_BREAKER_THRESHOLD,
+            breaker_reset=settings.FIRESTORE_BREAKER_RESET
         )
+        health_service = HealthService(
+            firebase_service,
+            probe_interval=settings.READINESS_PROBE_INTERVAL,
+            probe_timeout=settings.READINESS_PROBE_TIMEOUT,
+            max_saturation=settings.READINESS_MAX_SATURATION
+        )
+        if settings.FAST_STARTUP:
+            firebase_service.start_background_init()
         
         # Initialize other services
         auth_service = AuthService(
@@ -66,9 +108,36 @@ async def lifespan(app: FastAPI):
             authorized_emails=settings.AUTHORIZED_ADMIN_EMAILS
         )
         
-        member_service = MemberService(firebase_service)
-        data_service = DataService(firebase_service)
+        member_service = MemberService(firebase_service, events=events)
+        data_service = DataService(
+            firebase_service,
+            max_write_concurrency=settings.BULK_WRITE_MAX_CONCURRENCY,
+            events=events
+        )
+        dedup_service = DedupService(firebase_service, events=events)
+        analytics_service = AnalyticsService(firebase_service, events=events)
+        archive_service = ArchiveService(
+            firebase_service,
+            horizon_days=settings.ATTENDANCE_ARCHIVE_HORIZON_DAYS,
+            max_concurrency=settings.BULK_WRITE_MAX_CONCURRENCY,
+            events=events
+        )
+        live_service = LiveService(
+            analytics_service,
+            events,
+            buffer_size=settings.LIVE_FEED_CLIENT_BUFFER,
+            keepalive=settings.LIVE_FEED_KEEPALIVE
+        )
+        job_service = JobService(
+            firebase_service,
+            max_concurrency=settings.JOBS_MAX_CONCURRENCY,
+            output_dir=settings.JOBS_OUTPUT_DIR or None,
+            max_history=settings.JOBS_MAX_HISTORY
+        )
+        # Waits for Firebase in the background, so it doesn't delay startup
+        asyncio.ensure_future(job_service.recover_interrupted())
         
+        health_service.startup_complete = True
         logger.info("✅ All services initialized successfully")
         yield
         
@@ -78,6 +147,12 @@ async def lifespan(app: FastAPI):
     finally:
         # Cleanup if needed
         logger.info("🧹 Cleaning up services...")
+        if health_service:
+            health_service.startup_complete = False
+        if job_service:
+            await job_service.shutdown()
+        if firebase_service:
+            firebase_service.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -86,7 +161,31 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
+)
+
+# Admission control: rate limit per client (429) and report shed Firestore calls as 503.
+# Added before CORS so rejections still carry CORS headers
+rate_limiter = RateLimiter(
+    settings.RATE_LIMIT_RATE,
+    settings.RATE_LIMIT_BURST,
+    route_limits=settings.RATE_LIMIT_ROUTES
+) if settings.RATE_LIMIT_ENABLED else None
+app.add_middleware(
+    AdmissionMiddleware,
+    limiter=rate_limiter,
+    exempt_paths=("/health", "/docs", "/redoc", "/openapi.json"),
+    trust_forwarded_for=settings.RATE_LIMIT_TRUST_FORWARDED_FOR
+)
+
+# Uploads over IMPORT_MAX_BYTES get a 413 while they arrive, before they are spooled in full
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "POST /api/data/import": settings.IMPORT_MAX_BYTES,
+        "POST /api/data/restore": settings.IMPORT_MAX_BYTES
+    }
 )
 
 # Configure CORS
@@ -98,6 +197,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses above the size threshold; Brotli when installed, gzip otherwise.
+# The live feed is excluded either way: compression would buffer its events
+UNCOMPRESSED_PATHS = [r"^/api/attendance/stream$"]
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        BrotliMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_fallback=True,
+        excluded_handlers=UNCOMPRESSED_PATHS
+    )
+except ImportError:
+    app.add_middleware(
+        ExcludingGZipMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        excluded_handlers=UNCOMPRESSED_PATHS
+    )
+
 # Security
 security = HTTPBearer()
 
@@ -114,11 +231,96 @@ def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(securi
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def get_stream_admin(
+    token: Optional[str] = Query(None, description="Access token, for clients that can't set headers (EventSource)"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+) -> Dict[str, Any]:
+    """Like get_current_admin, but also accepts the token as a query parameter"""
+    token = credentials.credentials if credentials else token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return get_current_admin(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+# Conditional GETs: clients may store responses but must revalidate with If-None-Match
+CACHE_CONTROL = "private, no-cache"
+
+def not_modified(etag: str) -> Response:
+    """304 response for a matching If-None-Match"""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
+
+def job_accepted(response: Response, job: Job) -> APIResponse:
+    """202 pointing at a queued background job"""
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return APIResponse(
+        success=True,
+        message=f"{job.type.capitalize()} job queued",
+        data={"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}
+    )
+
+def api_response(message: str, data: Any = None, etag: Optional[str] = None) -> FastJSONResponse:
+    """
+    Successful APIResponse rendered straight to orjson for the hot read routes.
+    A returned Response skips response_model validation and jsonable_encoder;
+    the route keeps response_model=APIResponse for the OpenAPI schema.
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL} if etag else None
+    return FastJSONResponse(
+        content={"success": True, "message": message, "data": data, "error": None},
+        headers=headers
+    )
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "Lubowa Morph Registration API is running"}
+    firebase_status = firebase_service.status if firebase_service else "not_initialized"
+    
+    return {
+        "status": "healthy",
+        "message": "Lubowa Morph Registration API is running",
+        "ready": firebase_status == "ready",
+        "firebase": firebase_status
+    }
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and the event loop is responding"""
+    return {"status": "alive"}
+
+@app.get("/health/limits")
+async def limits_check():
+    """Rate limiter, Firestore admission counters and circuit breaker state"""
+    return {
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        "firestore": firebase_service.limiter.stats() if firebase_service else None,
+        "firestore_circuit": firebase_service.breaker.stats() if firebase_service else None,
+        "jobs": {"running": job_service.running_count(), "max_concurrency": job_service.max_concurrency} if job_service else None,
+        "uploads": {"max_bytes": settings.IMPORT_MAX_BYTES, "max_rows": settings.IMPORT_MAX_ROWS}
+    }
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: startup finished, Firestore reachable and executor not saturated"""
+    if not health_service:
+        return FastJSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"ready": False, "startup_complete": False}
+        )
+    
+    readiness = await health_service.check_readiness()
+    
+    return FastJSONResponse(
+        status_code=status.HTTP_200_OK if readiness["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=readiness
+    )
 
 # Root endpoint
 @app.get("/")
@@ -128,7 +330,9 @@ async def root():
         "message": "Lubowa Morph Registration API",
         "version": "1.0.0",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "liveness": "/health/live",
+        "readiness": "/health/ready"
     }
 
 # =======================
@@ -150,17 +354,9 @@ async def search_members(request: MemberSearchRequest):
         )
         
         if member:
-            return APIResponse(
-                success=True,
-                message="Member found",
-                data={"member": member, "found": True}
-            )
+            return api_response("Member found", {"member": member, "found": True})
         else:
-            return APIResponse(
-                success=True,
-                message="No member found",
-                data={"member": None, "found": False}
-            )
+            return api_response("No member found", {"member": None, "found": False})
     
     except ValidationError as e:
         raise HTTPException(
@@ -174,6 +370,35 @@ async def search_members(request: MemberSearchRequest):
             detail="Internal server error during search"
         )
 
+@app.post("/api/members/search/household", response_model=APIResponse)
+async def search_household(request: HouseholdSearchRequest):
+    """Find every member sharing a phone number, ranked by an optional first name"""
+    try:
+        if not PhoneValidator.validate_phone_number(request.phone_number):
+            raise ValidationError("Invalid phone number format")
+        
+        members = await member_service.search_household(
+            phone_number=request.phone_number,
+            first_name=request.first_name
+        )
+        
+        return api_response(
+            f"Found {len(members)} member(s)" if members else "No members found",
+            {"members": members, "count": len(members)}
+        )
+    
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Household search error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error during search"
+        )
+
 @app.post("/api/members", response_model=APIResponse)
 async def create_member(request: MemberCreateRequest):
     """Create a new member"""
@@ -209,10 +434,38 @@ async def create_member(request: MemberCreateRequest):
             detail="Failed to create member"
         )
 
+@app.post("/api/members/batch-get", response_model=APIResponse)
+async def batch_get_members(request: MemberBatchGetRequest):
+    """Get several members by ID in one Firestore round trip"""
+    try:
+        members, missing = await member_service.get_members(request.member_ids)
+        
+        # Seed the versions so follow-up conditional GETs skip the read
+        for member in members:
+            if member.get("last_updated"):
+                version_service.remember_member(member["id"], member["last_updated"])
+        
+        return api_response(
+            f"Retrieved {len(members)} of {len(members) + len(missing)} members",
+            {"members": members, "missing": missing}
+        )
+    
+    except Exception as e:
+        logger.error(f"Batch get members error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve members"
+        )
+
 @app.get("/api/members/{member_id}", response_model=APIResponse)
-async def get_member(member_id: str):
-    """Get member by ID"""
+async def get_member(member_id: str, if_none_match: Optional[str] = Header(None)):
+    """Get member by ID; supports If-None-Match"""
     try:
+        # A recently seen version answers a matching revalidation without a Firestore read
+        cached_version = version_service.cached_member_version(member_id)
+        if cached_version and etag_matches(if_none_match, make_etag("member", member_id, cached_version)):
+            return not_modified(make_etag("member", member_id, cached_version))
+        
         member = await member_service.get_member(member_id)
         
         if not member:
@@ -221,12 +474,17 @@ async def get_member(member_id: str):
                 detail="Member not found"
             )
         
-        return APIResponse(
-            success=True,
-            message="Member retrieved successfully",
-            data={"member": member}
-        )
+        etag = None
+        if member.get("last_updated"):
+            version = version_service.remember_member(member_id, member["last_updated"])
+            etag = make_etag("member", member_id, version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+        
+        return api_response("Member retrieved successfully", {"member": member}, etag)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get member error: {e}")
         raise HTTPException(
@@ -260,6 +518,8 @@ async def update_member(member_id: str, request: MemberUpdateRequest):
             data={"member_id": member_id}
         )
     
+    except HTTPException:
+        raise
     except ValidationError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -290,6 +550,8 @@ async def delete_member(member_id: str, current_admin: Dict = Depends(get_curren
             data={"member_id": member_id}
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Delete member error: {e}")
         raise HTTPException(
@@ -323,6 +585,8 @@ async def add_attendance(member_id: str, request: AttendanceRequest):
             data={"member_id": member_id, "date": request.date, "service": request.service}
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Add attendance error: {e}")
         raise HTTPException(
@@ -330,18 +594,64 @@ async def add_attendance(member_id: str, request: AttendanceRequest):
             detail="Failed to add attendance"
         )
 
+@app.get("/api/attendance/stream")
+async def stream_attendance(
+    request: Request,
+    date: Optional[str] = Query(None, description="Date to follow (YYYY-MM-DD), today by default"),
+    current_admin: Dict = Depends(get_stream_admin)
+):
+    """Server-Sent Events feed of check-ins and per-service counters for a date (admin only)"""
+    from datetime import date as date_type
+    
+    try:
+        day = date_type.fromisoformat(date) if date else date_type.today()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date must be in YYYY-MM-DD format"
+        )
+    
+    return StreamingResponse(
+        live_service.stream(day.strftime('%d_%m_%Y'), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/attendance/{member_id}", response_model=APIResponse)
-async def get_attendance(member_id: str):
-    """Get attendance records for a member"""
+async def get_attendance(
+    member_id: str,
+    since: Optional[str] = Query(None, description="Include archived records from this date (YYYY-MM-DD)"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get attendance records for a member; since reaches into archived history. Supports If-None-Match"""
     try:
-        attendance = await member_service.get_attendance(member_id)
+        from datetime import date
         
-        return APIResponse(
-            success=True,
-            message="Attendance retrieved successfully",
-            data={"member_id": member_id, "attendance": attendance}
-        )
+        try:
+            since_date = date.fromisoformat(since) if since else None
+        except ValueError:
+            raise ValidationError("since must be a date in YYYY-MM-DD format")
+        
+        cached_version = version_service.cached_member_version(member_id)
+        if cached_version and etag_matches(if_none_match, make_etag("attendance", member_id, cached_version, since_date)):
+            return not_modified(make_etag("attendance", member_id, cached_version, since_date))
+        
+        attendance, last_updated = await member_service.get_attendance_with_version(member_id, since=since_date)
+        
+        etag = None
+        if last_updated:
+            version = version_service.remember_member(member_id, last_updated)
+            etag = make_etag("attendance", member_id, version, since_date)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+        
+        return api_response("Attendance retrieved successfully", {"member_id": member_id, "attendance": attendance}, etag)
     
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Get attendance error: {e}")
         raise HTTPException(
@@ -367,6 +677,8 @@ async def remove_attendance(member_id: str, date: str):
             data={"member_id": member_id, "date": date}
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Remove attendance error: {e}")
         raise HTTPException(
@@ -378,10 +690,41 @@ async def remove_attendance(member_id: str, date: str):
 # DATA MANAGEMENT ENDPOINTS
 # =======================
 
+EXPORT_FORMATS = ("csv",) + tuple(SNAPSHOT_FORMATS)
+
+def check_export_format(export_format: str) -> None:
+    """400 for an unknown export format, or a snapshot format this server can't write"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown export format '{export_format}'; expected one of {', '.join(EXPORT_FORMATS)}"
+        )
+    if export_format != "csv":
+        try:
+            check_snapshot_format(export_format)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @app.get("/api/data/export", response_model=None)
-async def export_data(current_admin: Dict = Depends(get_current_admin)):
-    """Export all data as CSV (admin only)"""
+async def export_data(
+    export_format: str = Query("csv", alias="format", description="csv, ndjson (gzipped, nested attendance) or parquet"),
+    current_admin: Dict = Depends(get_current_admin)
+):
+    """Export all data as CSV or as an NDJSON/Parquet snapshot (admin only)"""
+    check_export_format(export_format)
     try:
+        if export_format != "csv":
+            suffix, media_type = SNAPSHOT_FORMATS[export_format]
+            handle, path = tempfile.mkstemp(suffix=suffix)
+            os.close(handle)
+            await data_service.export_snapshot(path, export_format)
+            return FileResponse(
+                path,
+                media_type=media_type,
+                filename=f"morphers-snapshot{suffix}",
+                background=BackgroundTask(os.remove, path)
+            )
+        
         csv_content = await data_service.export_all_data()
         
         # Create streaming response
@@ -401,12 +744,60 @@ async def export_data(current_admin: Dict = Depends(get_current_admin)):
             detail="Failed to export data"
         )
 
+@app.post("/api/data/export", response_model=APIResponse, status_code=status.HTTP_202_ACCEPTED)
+async def export_data_job(
+    response: Response,
+    export_format: str = Query("csv", alias="format", description="csv, ndjson (gzipped, nested attendance) or parquet"),
+    current_admin: Dict = Depends(get_current_admin)
+):
+    """Export all data in a background job; download it from /api/jobs/{job_id}/download (admin only)"""
+    check_export_format(export_format)
+    try:
+        async def run(job: Job) -> Dict[str, Any]:
+            if export_format != "csv":
+                suffix, media_type = SNAPSHOT_FORMATS[export_format]
+                path = job_service.output_path(job, suffix)
+                result = await data_service.export_snapshot(path, export_format, progress=job.report)
+                job.set_output(path, f"morphers-snapshot{suffix}", media_type)
+                return result
+            
+            csv_content = await data_service.export_all_data(progress=job.report)
+            path = job_service.output_path(job, ".csv")
+            await asyncio.get_event_loop().run_in_executor(None, Path(path).write_bytes, csv_content.encode("utf-8"))
+            job.set_output(path, "morphers-data.csv", "text/csv")
+            return {"bytes": os.path.getsize(path)}
+        
+        job = job_service.submit("export", run, {"format": export_format}, created_by=current_admin.get("email"))
+        return job_accepted(response, job)
+    
+    except Exception as e:
+        logger.error(f"Export job error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start export"
+        )
+
+def save_upload(file: UploadFile, suffix: str = "") -> str:
+    """Copy an uploaded file to a temporary path (blocking; run in an executor)"""
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(handle, "wb") as f:
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
+    return path
+
 @app.post("/api/data/import", response_model=APIResponse)
 async def import_data(
+    response: Response,
     file: UploadFile = File(...),
+    mode: str = "replace",
+    delete_missing: bool = False,
+    wait: bool = False,
     current_admin: Dict = Depends(get_current_admin)
 ):
-    """Import CSV data (admin only)"""
+    """
+    Import CSV data (admin only). mode=upsert writes only new or changed members.
+    
+    Runs as a background job (202 with a job ID) unless wait=true.
+    """
     try:
         if not file.filename.lower().endswith('.csv'):
             raise HTTPException(
@@ -414,10 +805,38 @@ async def import_data(
                 detail="File must be a CSV file"
             )
         
-        content = await file.read()
-        csv_content = content.decode('utf-8')
+        if mode not in ("replace", "upsert"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="mode must be 'replace' or 'upsert'"
+            )
         
-        result = await data_service.import_csv_data(csv_content)
+        # The upload is parsed from disk in chunks, decoded as it is read (utf-8-sig drops a BOM),
+        # rather than read and decoded whole; the copy outlives the request for background jobs
+        path = await asyncio.get_event_loop().run_in_executor(None, save_upload, file, ".csv")
+        
+        async def run(progress=None) -> Dict[str, Any]:
+            with open(path, encoding="utf-8-sig", newline="") as csv_file:
+                return await data_service.import_csv_data(
+                    csv_file, mode=mode, delete_missing=delete_missing,
+                    max_rows=settings.IMPORT_MAX_ROWS, progress=progress
+                )
+        
+        # A background job owns the file from here, deleting it even if cancelled while queued
+        if not wait:
+            job = job_service.submit(
+                "import",
+                lambda job: run(job.report),
+                params={"filename": file.filename, "mode": mode, "delete_missing": delete_missing},
+                created_by=current_admin.get("email"),
+                temp_paths=[path]
+            )
+            return job_accepted(response, job)
+        
+        try:
+            result = await run()
+        finally:
+            os.remove(path)
         
         return APIResponse(
             success=True,
@@ -425,6 +844,18 @@ async def import_data(
             data=result
         )
     
+    except HTTPException:
+        raise
+    except PayloadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Import data error: {e}")
         raise HTTPException(
@@ -432,18 +863,76 @@ async def import_data(
             detail=f"Failed to import data: {str(e)}"
         )
 
-@app.get("/api/data/stats", response_model=APIResponse)
-async def get_stats():
-    """Get system statistics"""
+@app.post("/api/data/restore", response_model=APIResponse)
+async def restore_data(
+    response: Response,
+    file: UploadFile = File(...),
+    wait: bool = False,
+    current_admin: Dict = Depends(get_current_admin)
+):
+    """
+    Replace all data with an exported NDJSON or Parquet snapshot (admin only).
+    
+    Keeps member IDs and timestamps. Runs as a background job (202 with a job ID) unless wait=true.
+    """
     try:
-        stats = await data_service.get_statistics()
+        loop = asyncio.get_event_loop()
+        path = await loop.run_in_executor(None, save_upload, file, ".snapshot")
+        try:
+            await loop.run_in_executor(None, detect_snapshot_format, path)
+        except ValueError as e:
+            os.remove(path)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        if not wait:
+            job = job_service.submit(
+                "restore",
+                lambda job: data_service.restore_snapshot(path, progress=job.report),
+                params={"filename": file.filename},
+                created_by=current_admin.get("email"),
+                temp_paths=[path]
+            )
+            return job_accepted(response, job)
+        
+        try:
+            result = await data_service.restore_snapshot(path)
+        finally:
+            os.remove(path)
         
         return APIResponse(
             success=True,
-            message="Statistics retrieved successfully",
-            data=stats
+            message=f"Restored {result['restored']} members in {result['seconds']}s",
+            data=result
         )
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Restore data error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to restore data: {str(e)}"
+        )
+
+@app.get("/api/data/stats", response_model=APIResponse)
+async def get_stats(if_none_match: Optional[str] = Header(None)):
+    """Get system statistics; supports If-None-Match"""
+    try:
+        version = version_service.stats_version()
+        etag = make_etag("stats", version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        stats = version_service.cached_stats(version)
+        if stats is None:
+            stats = await data_service.get_statistics()
+            version_service.remember_stats(version, stats)
+        
+        return api_response("Statistics retrieved successfully", stats, etag)
+    
     except Exception as e:
         logger.error(f"Get stats error: {e}")
         raise HTTPException(
@@ -451,6 +940,286 @@ async def get_stats():
             detail="Failed to retrieve statistics"
         )
 
+@app.post("/api/data/reindex", response_model=APIResponse)
+async def reindex_data(response: Response, wait: bool = False, current_admin: Dict = Depends(get_current_admin)):
+    """Backfill derived search key fields on existing members (admin only); a background job unless wait=true"""
+    try:
+        if not wait:
+            job = job_service.submit(
+                "reindex",
+                lambda job: data_service.backfill_search_keys(progress=job.report),
+                created_by=current_admin.get("email")
+            )
+            return job_accepted(response, job)
+        
+        result = await data_service.backfill_search_keys()
+        
+        return APIResponse(
+            success=True,
+            message=f"Updated search keys on {result['updated']} members",
+            data=result
+        )
+    
+    except Exception as e:
+        logger.error(f"Reindex data error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reindex data"
+        )
+
+@app.post("/api/data/migrate", response_model=APIResponse)
+async def migrate_data(response: Response, wait: bool = False, current_admin: Dict = Depends(get_current_admin)):
+    """Migrate every member document to the current schema version (admin only); a background job unless wait=true"""
+    try:
+        if not wait:
+            job = job_service.submit(
+                "migrate",
+                lambda job: data_service.migrate_members(progress=job.report),
+                created_by=current_admin.get("email")
+            )
+            return job_accepted(response, job)
+
+        result = await data_service.migrate_members()
+
+        return APIResponse(
+            success=True,
+            message=f"Migrated {result['updated']} members to schema version {result['schema_version']}",
+            data=result
+        )
+
+    except Exception as e:
+        logger.error(f"Migrate data error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to migrate data"
+        )
+
+@app.post("/api/data/dedup", response_model=APIResponse)
+async def dedup_data(
+    response: Response,
+    threshold: float = 0.88,
+    merge: bool = False,
+    wait: bool = False,
+    current_admin: Dict = Depends(get_current_admin)
+):
+    """Find duplicate members sharing a phone number; merge=true merges them (admin only). A background job unless wait=true"""
+    try:
+        if not 0 < threshold <= 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="threshold must be between 0 and 1"
+            )
+        
+        if not wait:
+            job = job_service.submit(
+                "dedup",
+                lambda job: dedup_service.find_duplicates(threshold=threshold, merge=merge, progress=job.report),
+                params={"threshold": threshold, "merge": merge},
+                created_by=current_admin.get("email")
+            )
+            return job_accepted(response, job)
+        
+        result = await dedup_service.find_duplicates(threshold=threshold, merge=merge)
+        
+        return APIResponse(
+            success=True,
+            message=f"Found {result['duplicates']} duplicate members",
+            data=result
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Dedup data error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to find duplicates"
+        )
+
+@app.post("/api/data/archive", response_model=APIResponse)
+async def archive_attendance(
+    horizon_days: Optional[int] = None,
+    current_admin: Dict = Depends(get_current_admin)
+):
+    """Move attendance older than the horizon into per-year archive documents (admin only)"""
+    try:
+        if horizon_days is not None and horizon_days < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="horizon_days must not be negative"
+            )
+        
+        result = await archive_service.archive_attendance(horizon_days=horizon_days)
+        
+        return APIResponse(
+            success=True,
+            message=f"Archived {result['records_archived']} attendance records",
+            data=result
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Archive attendance error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to archive attendance"
+        )
+
+# =======================
+# JOB ENDPOINTS
+# =======================
+
+@app.get("/api/jobs", response_model=APIResponse)
+async def list_jobs(current_admin: Dict = Depends(get_current_admin)):
+    """Recent background jobs on this instance (admin only)"""
+    jobs = job_service.list_jobs()
+    return APIResponse(
+        success=True,
+        message=f"{len(jobs)} jobs",
+        data={"jobs": jobs}
+    )
+
+@app.get("/api/jobs/{job_id}", response_model=APIResponse)
+async def get_job(job_id: str, current_admin: Dict = Depends(get_current_admin)):
+    """Status, progress and result of a background job (admin only)"""
+    try:
+        job = await job_service.get_status(job_id)
+        
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Job not found"
+            )
+        
+        return APIResponse(
+            success=True,
+            message=f"Job {job['status']}",
+            data={"job": job}
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get job error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve job"
+        )
+
+@app.get("/api/jobs/{job_id}/download", response_model=None)
+async def download_job_output(job_id: str, current_admin: Dict = Depends(get_current_admin)):
+    """Download the file a finished job produced (admin only)"""
+    job = job_service.get(job_id)
+    
+    if not job or not job.output_path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No output for this job on this server"
+        )
+    if not os.path.exists(job.output_path):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Job output has been deleted"
+        )
+    
+    return FileResponse(job.output_path, media_type=job.output_media_type, filename=job.output_name)
+
+@app.delete("/api/jobs/{job_id}", response_model=APIResponse)
+async def cancel_job(job_id: str, current_admin: Dict = Depends(get_current_admin)):
+    """Cancel a queued or running job (admin only)"""
+    if not job_service.cancel(job_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job is not running on this server"
+        )
+    
+    return APIResponse(
+        success=True,
+        message="Job cancellation requested",
+        data={"job_id": job_id}
+    )
+
+# =======================
+# ANALYTICS ENDPOINTS
+# =======================
+
+@app.get("/api/analytics/attendance", response_model=APIResponse)
+async def get_attendance_analytics(
+    from_date: Optional[str] = Query(None, alias="from", description="Start date (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, alias="to", description="End date (YYYY-MM-DD)"),
+    group_by: str = "service",
+    interval: str = "day"
+):
+    """Attendance time series grouped by service, cell, school, residence or class"""
+    try:
+        from datetime import date
+        
+        try:
+            start = date.fromisoformat(from_date) if from_date else None
+            end = date.fromisoformat(to_date) if to_date else None
+        except ValueError:
+            raise ValidationError("from and to must be dates in YYYY-MM-DD format")
+        
+        try:
+            series = await analytics_service.get_attendance_series(
+                group_by=group_by, start=start, end=end, interval=interval
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        
+        return api_response("Attendance analytics retrieved successfully", series)
+    
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Get attendance analytics error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve attendance analytics"
+        )
+
+@app.get("/api/analytics/cohorts", response_model=APIResponse)
+async def get_cohort_analytics(
+    weeks: int = 12,
+    cohort_by: str = "first_attendance",
+    from_date: Optional[str] = Query(None, alias="from", description="Earliest cohort week (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, alias="to", description="Latest cohort week (YYYY-MM-DD)")
+):
+    """Weekly retention cohorts by first attendance or registration week"""
+    try:
+        from datetime import date
+        
+        try:
+            start = date.fromisoformat(from_date) if from_date else None
+            end = date.fromisoformat(to_date) if to_date else None
+        except ValueError:
+            raise ValidationError("from and to must be dates in YYYY-MM-DD format")
+        
+        try:
+            cohorts = await analytics_service.get_cohorts(
+                weeks=weeks, cohort_by=cohort_by, start=start, end=end
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        
+        return api_response("Cohort analytics retrieved successfully", cohorts)
+    
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Get cohort analytics error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve cohort analytics"
+        )
+
 # =======================
 # AUTH ENDPOINTS
 # =======================
@@ -576,6 +1345,8 @@ async def get_current_service():
         )
 
 if __name__ == "__main__":
+    import uvicorn
+    
     uvicorn.run(
         "main:app",
         host=settings.HOST,
@@ -31,6 +31,35 @@ class MemberSearchRequest(BaseModel):
             raise ValueError('Invalid phone number format')
         return cleaned
 
+class HouseholdSearchRequest(BaseModel):
+    """Request model for finding every member sharing a phone number"""
+    phone_number: str = Field(..., min_length=7, max_length=15)
+    first_name: Optional[str] = Field(None, max_length=50)
+    
+    @validator('phone_number')
+    def validate_phone_number(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Phone number is required')
+        cleaned = re.sub(r'[\s\-\(\)]', '', v)
+        if not re.match(r'^[\+]?[0-9]{7,15}$', cleaned):
+            raise ValueError('Invalid phone number format')
+        return cleaned
+    
+    @validator('first_name')
+    def validate_first_name(cls, v):
+        return v.strip() if v and v.strip() else None
+
+class MemberBatchGetRequest(BaseModel):
+    """Request model for fetching several members by ID"""
+    member_ids: List[str] = Field(..., min_items=1, max_items=300)
+    
+    @validator('member_ids', each_item=True)
+    def validate_member_id(cls, v):
+        v = v.strip()
+        if not v or '/' in v:
+            raise ValueError('Invalid member ID')
+        return v
+
 class MemberCreateRequest(BaseModel):
     """Request model for creating a new member"""
     name: str = Field(..., min_length=2, max_length=100)
@@ -166,5 +195,6 @@ class MemberFirestoreDoc(BaseModel):
     Residence: str
     Cell: str
     attendance: Dict[str, str] = Field(default_factory=dict)
+    schemaVersion: int = 0  # Layout version (utils.member_schema); documents from before versioning have none
     createdAt: Optional[datetime] = None
     lastUpdated: Optional[datetime] = None
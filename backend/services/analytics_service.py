@@ -0,0 +1,471 @@
+"""
+Analytics service for attendance time series and retention cohorts
+"""
+import asyncio
+import logging
+from datetime import datetime, date
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from services.firebase_service import FirebaseService
+from services.events import (
+    EventBus, ATTENDANCE_ADDED, ATTENDANCE_REMOVED, MEMBER_CREATED, MEMBER_UPDATED, changed_fields
+)
+from services.archive_service import ARCHIVE_SUBCOLLECTION
+from services.member_service import MemberService
+from utils.attendance_bits import AttendanceBits, date_key_to_day, iter_attendance_days, EPOCH
+from utils.member_schema import canonical_cell
+
+logger = logging.getLogger(__name__)
+
+# Member fields the cube can be grouped by
+DIMENSIONS = {
+    'cell': 'Cell',
+    'school': 'School',
+    'residence': 'Residence',
+    'class': 'Class'
+}
+GROUP_BY_OPTIONS = ('service',) + tuple(DIMENSIONS)
+CUBE_FIELDS = set(DIMENSIONS.values()) | {'attendance'}
+COHORT_OPTIONS = ('first_attendance', 'registration')
+
+# Service code 0 holds attendance recorded with an unexpected service value
+SERVICE_CODES = {'1': 1, '2': 2, '3': 3}
+SERVICE_LABELS = ['unknown', '1', '2', '3']
+
+def dimension_label(dimension: str, member: Dict[str, Any]) -> str:
+    """Grouping label for a member, matching the stats endpoint's conventions"""
+    value = member.get(DIMENSIONS[dimension])
+    if dimension == 'cell':
+        # Documents not yet migrated (utils.member_schema) may hold other spellings
+        return 'Yes' if canonical_cell(value) == '1' else 'No'
+    return str(value).strip() if value and str(value).strip() else 'Unknown'
+
+def sunday_on_or_before(day_numbers: np.ndarray) -> np.ndarray:
+    """Day numbers (days since 1970-01-01, a Thursday) of the Sunday starting each week"""
+    return day_numbers - (day_numbers + 4) % 7
+
+def day_number(value: Any) -> Optional[int]:
+    """Days since the epoch for a date, datetime or Firestore timestamp"""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return (value - EPOCH).days
+    return None
+
+class AttendanceCube:
+    """
+    Attendance counts in dense NumPy arrays.
+
+    For each dimension, counts[dimension][d, s, v] is the number of members
+    with dimension value v who attended service s on dates[d].
+    """
+
+    def __init__(self):
+        self.dates = np.array([], dtype='datetime64[D]')
+        self.labels: Dict[str, List[str]] = {dimension: [] for dimension in DIMENSIONS}
+        self.counts: Dict[str, np.ndarray] = {
+            dimension: np.zeros((0, len(SERVICE_LABELS), 0), dtype=np.int32) for dimension in DIMENSIONS
+        }
+        self.member_codes: Dict[str, Dict[str, int]] = {}
+        self._label_codes: Dict[str, Dict[str, int]] = {dimension: {} for dimension in DIMENSIONS}
+
+    @classmethod
+    def from_members(cls, members: List[Dict[str, Any]]) -> 'AttendanceCube':
+        """Build the cube from member documents in one vectorized pass"""
+        cube = cls()
+
+        # One (member row, day number, service code) triple per attendance record
+        rows, days, services = [], [], []
+        for row, member in enumerate(members):
+            cube._register_member(member['id'], member, grow=False)
+            for day, service in iter_attendance_days(member.get('attendance')):
+                rows.append(row)
+                days.append(day)
+                services.append(SERVICE_CODES.get(service, 0))
+
+        rows = np.array(rows, dtype=np.int64)
+        unique_days, slots = np.unique(np.array(days, dtype=np.int64), return_inverse=True)
+        slots = slots.reshape(-1).astype(np.int64)
+        services = np.array(services, dtype=np.int64)
+        cube.dates = unique_days.astype('datetime64[D]')
+
+        for dimension in DIMENSIONS:
+            codes = np.array([cube.member_codes[member['id']][dimension] for member in members], dtype=np.int64)
+            shape = (len(cube.dates), len(SERVICE_LABELS), len(cube.labels[dimension]))
+            flat = (slots * shape[1] + services) * shape[2] + (codes[rows] if len(rows) else rows)
+            cube.counts[dimension] = np.bincount(flat, minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+
+        return cube
+
+    def _register_member(self, member_id: str, member: Dict[str, Any], grow: bool = True) -> Dict[str, int]:
+        """Assign dimension codes to a member, adding new labels as needed"""
+        codes = {}
+        for dimension in DIMENSIONS:
+            label = dimension_label(dimension, member)
+            code = self._label_codes[dimension].get(label)
+            if code is None:
+                code = len(self.labels[dimension])
+                self._label_codes[dimension][label] = code
+                self.labels[dimension].append(label)
+                if grow:
+                    self.counts[dimension] = np.pad(self.counts[dimension], ((0, 0), (0, 0), (0, 1)))
+            codes[dimension] = code
+
+        self.member_codes[member_id] = codes
+        return codes
+
+    def _date_slot(self, day: int) -> int:
+        """Index of a day number, inserting it if this is the first attendance on that day"""
+        value = np.datetime64(day, 'D')
+        slot = int(np.searchsorted(self.dates, value))
+        if slot < len(self.dates) and self.dates[slot] == value:
+            return slot
+
+        self.dates = np.insert(self.dates, slot, value)
+        for dimension in DIMENSIONS:
+            self.counts[dimension] = np.insert(self.counts[dimension], slot, 0, axis=0)
+        return slot
+
+    def add_member(self, member_id: str, member: Dict[str, Any]) -> None:
+        """Add a new member and their attendance"""
+        self._register_member(member_id, member)
+        for day, service in iter_attendance_days(member.get('attendance')):
+            self._apply_day(self.member_codes[member_id], day, service, 1)
+
+    def apply(self, member_id: str, date_key: str, service: str, delta: int) -> bool:
+        """Add (delta=1) or remove (delta=-1) one attendance record; False if the member is unknown"""
+        codes = self.member_codes.get(member_id)
+        day = date_key_to_day(date_key)
+        if codes is None or day is None:
+            return codes is not None
+
+        self._apply_day(codes, day, service, delta)
+        return True
+
+    def _apply_day(self, codes: Dict[str, int], day: int, service: str, delta: int) -> None:
+        slot = self._date_slot(day)
+        service_code = SERVICE_CODES.get(service, 0)
+        for dimension, code in codes.items():
+            self.counts[dimension][slot, service_code, code] += delta
+
+    def query(self, group_by: str, start: Optional[date] = None, end: Optional[date] = None,
+              interval: str = 'day') -> Dict[str, Any]:
+        """Attendance series for a date range, grouped by service or a member dimension"""
+        lo = int(np.searchsorted(self.dates, np.datetime64(start), 'left')) if start else 0
+        hi = int(np.searchsorted(self.dates, np.datetime64(end), 'right')) if end else len(self.dates)
+        dates = self.dates[lo:hi]
+
+        if group_by == 'service':
+            series = self.counts['cell'][lo:hi].sum(axis=2)
+            labels = SERVICE_LABELS
+        else:
+            series = self.counts[group_by][lo:hi].sum(axis=1)
+            labels = self.labels[group_by]
+
+        if interval == 'week' and len(dates):
+            # Bucket by the Sunday starting each week
+            weeks = sunday_on_or_before(dates.astype(np.int64)).astype('datetime64[D]')
+            dates, starts = np.unique(weeks, return_index=True)
+            series = np.add.reduceat(series, starts, axis=0)
+
+        totals = series.sum(axis=0)
+        keep = [i for i in range(len(labels)) if totals[i] > 0]
+
+        return {
+            "group_by": group_by,
+            "interval": interval,
+            "dates": [str(day) for day in dates],
+            "series": {labels[i]: series[:, i].tolist() for i in keep},
+            "totals": {labels[i]: int(totals[i]) for i in keep},
+            "total": int(totals.sum())
+        }
+
+class AttendanceMatrix:
+    """
+    Bit-packed members x weeks attendance matrix.
+
+    Bit (m, w) is set when member m attended any service in the week starting
+    on the Sunday first_sunday + 7 * w. Each row takes one bit per week.
+    """
+
+    def __init__(self, first_sunday: int = 0):
+        self.first_sunday = first_sunday
+        self.n_weeks = 0
+        self.member_rows: Dict[str, int] = {}
+        self.bits = np.zeros((0, 0), dtype=np.uint8)
+        self.registered_week = np.zeros(0, dtype=np.int64)  # -1 when createdAt is unknown
+
+    @classmethod
+    def from_members(cls, members: List[Dict[str, Any]]) -> 'AttendanceMatrix':
+        """Build the matrix from member documents"""
+        rows, days = [], []
+        created_days = np.full(len(members), -1, dtype=np.int64)
+        for row, member in enumerate(members):
+            for day, _ in iter_attendance_days(member.get('attendance')):
+                rows.append(row)
+                days.append(day)
+
+            created_day = day_number(member.get('createdAt'))
+            if created_day is not None:
+                created_days[row] = created_day
+
+        days = np.array(days, dtype=np.int64)
+        first_sunday = int(sunday_on_or_before(days.min())) if len(days) else 0
+        matrix = cls(first_sunday)
+        matrix.member_rows = {member['id']: row for row, member in enumerate(members)}
+
+        weeks = (sunday_on_or_before(days) - first_sunday) // 7
+        matrix.n_weeks = int(weeks.max()) + 1 if len(weeks) else 0
+        registered = np.where(created_days >= 0, (sunday_on_or_before(created_days) - first_sunday) // 7, -1)
+
+        dense = np.zeros((len(members), matrix.n_weeks), dtype=bool)
+        dense[np.array(rows, dtype=np.int64), weeks] = True
+        matrix.bits = np.packbits(dense, axis=1)
+        matrix.registered_week = registered
+        return matrix
+
+    def _ensure_weeks(self, n_weeks: int) -> None:
+        """Widen the matrix to hold n_weeks columns"""
+        if n_weeks <= self.n_weeks:
+            return
+        self.n_weeks = n_weeks
+        extra_bytes = -(-n_weeks // 8) - self.bits.shape[1]
+        if extra_bytes > 0:
+            self.bits = np.pad(self.bits, ((0, 0), (0, extra_bytes)))
+
+    def set_member(self, member_id: str, member: Dict[str, Any]) -> bool:
+        """Rewrite a member's row from their attendance; False if it predates the matrix"""
+        weeks = [
+            (int(sunday_on_or_before(day)) - self.first_sunday) // 7
+            for day, _ in iter_attendance_days(member.get('attendance'))
+        ]
+
+        if any(week < 0 for week in weeks):
+            return False
+
+        self._ensure_weeks(max(weeks) + 1 if weeks else 0)
+
+        row = self.member_rows.get(member_id)
+        if row is None:
+            row = len(self.member_rows)
+            self.member_rows[member_id] = row
+            self.bits = np.vstack([self.bits, np.zeros((1, self.bits.shape[1]), dtype=np.uint8)])
+            created_day = day_number(member.get('createdAt')) or day_number(datetime.utcnow())
+            registered = (int(sunday_on_or_before(np.array(created_day))) - self.first_sunday) // 7
+            self.registered_week = np.append(self.registered_week, registered)
+
+        dense = np.zeros(self.bits.shape[1] * 8, dtype=bool)
+        dense[weeks] = True
+        self.bits[row] = np.packbits(dense)
+        return True
+
+    def dense(self) -> np.ndarray:
+        """Unpacked boolean members x weeks view"""
+        return np.unpackbits(self.bits, axis=1, count=self.n_weeks).astype(bool)
+
+    def week_label(self, week: int) -> str:
+        return str(np.datetime64(self.first_sunday + 7 * week, 'D'))
+
+    def cohorts(self, weeks: int = 12, cohort_by: str = 'first_attendance',
+                start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Any]:
+        """N-week retention for each weekly cohort, computed over the whole matrix at once"""
+        attended = self.dense()
+        n_weeks = self.n_weeks
+
+        if cohort_by == 'registration':
+            cohort = self.registered_week
+        else:
+            cohort = np.where(attended.any(axis=1), attended.argmax(axis=1), -1)
+
+        # Restrict to cohorts starting within [start, end]
+        lo = 0
+        hi = n_weeks - 1
+        if start:
+            lo = max(lo, -(-(day_number(start) - self.first_sunday) // 7))
+        if end:
+            hi = min(hi, (day_number(end) - self.first_sunday) // 7)
+
+        rows = np.nonzero((cohort >= lo) & (cohort <= hi) & (cohort < n_weeks))[0]
+        member_cohorts = cohort[rows]
+
+        # Align each member's row on their cohort week, then sum per cohort
+        offsets = member_cohorts[:, None] + np.arange(weeks)[None, :]
+        in_range = offsets < n_weeks
+        if len(rows):
+            aligned = attended[rows[:, None], np.minimum(offsets, n_weeks - 1)] & in_range
+        else:
+            aligned = np.zeros((0, weeks), dtype=bool)
+
+        retained = np.zeros((max(n_weeks, 1), weeks), dtype=np.int64)
+        np.add.at(retained, member_cohorts, aligned)
+        sizes = np.bincount(member_cohorts, minlength=max(n_weeks, 1))
+
+        cohorts = []
+        for week in np.nonzero(sizes)[0]:
+            observed = min(weeks, n_weeks - week)  # Later weeks haven't happened yet
+            counts = retained[week, :observed]
+            cohorts.append({
+                "week": self.week_label(int(week)),
+                "size": int(sizes[week]),
+                "retained": counts.tolist(),
+                "retention": np.round(counts / sizes[week], 4).tolist()
+            })
+
+        return {
+            "cohort_by": cohort_by,
+            "weeks": weeks,
+            "members": len(self.member_rows),
+            "cohorts": cohorts
+        }
+
+class AnalyticsService:
+    """Service for attendance analytics"""
+
+    def __init__(self, firebase_service: FirebaseService, events: Optional[EventBus] = None):
+        self.firebase = firebase_service
+        self.collection_name = "morphers"
+        self.cube: Optional[AttendanceCube] = None
+        self.matrix: Optional[AttendanceMatrix] = None
+        self._cohort_cache: Dict[tuple, Dict[str, Any]] = {}
+        self._stale = True
+        self._build_lock = asyncio.Lock()
+        self._pending_events: Optional[List[tuple]] = None  # Buffered while a build is running
+        self._archived: Dict[str, AttendanceBits] = {}  # Archived attendance of members that have any
+
+        if events:
+            events.subscribe(self._on_event)
+
+    async def _ensure_built(self) -> None:
+        """Build the cube and matrix from one Firestore scan, on first use or after bulk changes"""
+        async with self._build_lock:
+            if self.cube is not None and not self._stale:
+                return
+
+            self._stale = False
+            self._cohort_cache.clear()
+            self._pending_events = []
+            fields = ['attendance', 'attendanceArchive', 'createdAt'] + list(DIMENSIONS.values())
+
+            try:
+                members = []
+                async for page in self.firebase.iter_documents(self.collection_name, fields=fields):
+                    # Keep attendance compact while the whole collection is in memory
+                    for member in page:
+                        member['attendance'] = MemberService.attendance_to_bits(member.get('attendance'))
+                    members.extend(page)
+
+                await self._load_archives(members)
+                self.cube = AttendanceCube.from_members(members)
+                self.matrix = AttendanceMatrix.from_members(members)
+            finally:
+                pending, self._pending_events = self._pending_events, None
+
+            # Writes that landed while pages were being read
+            for event_type, payload in pending:
+                self._on_event(event_type, payload)
+
+            logger.info(
+                f"Built attendance analytics: {len(members)} members, {len(self.cube.dates)} dates, "
+                f"{self.matrix.n_weeks} weeks"
+            )
+
+    async def _load_archives(self, members: List[Dict[str, Any]]) -> None:
+        """Fold archived attendance into the members' history"""
+        self._archived = {}
+        archived = {
+            member['id']: {} for member in members
+            if (member.get('attendanceArchive') or {}).get('count')
+        }
+        if not archived:
+            return
+
+        async for page in self.firebase.iter_documents(ARCHIVE_SUBCOLLECTION, fields=['attendance'], collection_group=True):
+            for doc in page:
+                if doc['parent_id'] in archived:
+                    archived[doc['parent_id']].update(doc.get('attendance') or {})
+
+        for member in members:
+            if member['id'] in archived:
+                self._archived[member['id']] = MemberService.attendance_to_bits(archived[member['id']])
+                member['attendance'] = MemberService.attendance_to_bits({
+                    **archived[member['id']], **MemberService.attendance_from_bits(member['attendance'])
+                })
+
+    def _with_archive(self, member_id: str, member: Dict[str, Any]) -> Dict[str, Any]:
+        """An event's member document with their archived attendance added back"""
+        if member_id not in self._archived:
+            return member
+        attendance = {
+            **MemberService.attendance_from_bits(self._archived[member_id]),
+            **(member.get('attendance') or {})
+        }
+        return {**member, 'attendance': attendance}
+
+    async def get_cube(self) -> AttendanceCube:
+        """Return the attendance cube, building it if needed"""
+        await self._ensure_built()
+        return self.cube
+
+    async def get_attendance_series(self, group_by: str = 'service', start: Optional[date] = None,
+                                    end: Optional[date] = None, interval: str = 'day') -> Dict[str, Any]:
+        """Attendance time series for the analytics endpoint"""
+        if group_by not in GROUP_BY_OPTIONS:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY_OPTIONS)}")
+        if interval not in ('day', 'week'):
+            raise ValueError("interval must be 'day' or 'week'")
+
+        cube = await self.get_cube()
+        return cube.query(group_by, start, end, interval)
+
+    async def get_cohorts(self, weeks: int = 12, cohort_by: str = 'first_attendance',
+                          start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Any]:
+        """Weekly retention cohorts, cached until attendance changes"""
+        if cohort_by not in COHORT_OPTIONS:
+            raise ValueError(f"cohort_by must be one of: {', '.join(COHORT_OPTIONS)}")
+        if not 1 <= weeks <= 104:
+            raise ValueError("weeks must be between 1 and 104")
+
+        await self._ensure_built()
+
+        key = (weeks, cohort_by, start, end)
+        if key not in self._cohort_cache:
+            self._cohort_cache[key] = self.matrix.cohorts(weeks, cohort_by, start, end)
+        return self._cohort_cache[key]
+
+    def _on_event(self, event_type: str, payload: Dict[str, Any]) -> None:
+        """Keep the cube and matrix current from attendance writes; rebuild after anything else"""
+        if self._pending_events is not None:
+            self._pending_events.append((event_type, payload))
+            return
+        if self.cube is None or self._stale:
+            return
+
+        member_id = payload.get('member_id')
+        member = self._with_archive(member_id, payload['member']) if 'member' in payload else None
+
+        if event_type == ATTENDANCE_ADDED:
+            self._cohort_cache.clear()
+            if payload.get('previous_service'):
+                self.cube.apply(member_id, payload['date'], payload['previous_service'], -1)
+            if not self.cube.apply(member_id, payload['date'], payload['service'], 1):
+                self.cube.add_member(member_id, member)
+            if not self.matrix.set_member(member_id, member):
+                self._stale = True
+        elif event_type == ATTENDANCE_REMOVED:
+            self._cohort_cache.clear()
+            if not self.cube.apply(member_id, payload['date'], payload['service'], -1):
+                self._stale = True
+            elif not self.matrix.set_member(member_id, member):
+                self._stale = True
+        elif event_type == MEMBER_CREATED:
+            self._cohort_cache.clear()
+            self.cube.add_member(member_id, member)
+            if not self.matrix.set_member(member_id, member):
+                self._stale = True
+        elif event_type == MEMBER_UPDATED and not changed_fields(payload.get('changes', {})) & CUBE_FIELDS:
+            return
+        else:
+            # Updates can move a member between groups; deletes and imports remove history
+            self._stale = True
@@ -0,0 +1,125 @@
+"""
+Archive service for moving old attendance out of member documents
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Optional
+
+from services.firebase_service import FirebaseService
+from services.events import EventBus, MEMBERS_REPLACED
+from utils.attendance_bits import date_key_to_day, EPOCH
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUBCOLLECTION = "attendance_archive"
+
+def empty_archive_summary() -> Dict[str, Any]:
+    """Summary counters kept on a member as 'attendanceArchive'"""
+    return {"count": 0, "byService": {}, "years": [], "before": None}
+
+class ArchiveService:
+    """Service for attendance archival"""
+
+    def __init__(self, firebase_service: FirebaseService, horizon_days: int = 730,
+                 page_size: int = 500, max_concurrency: int = 4, events: Optional[EventBus] = None):
+        self.firebase = firebase_service
+        self.collection_name = "morphers"
+        self.horizon_days = horizon_days
+        self.page_size = page_size
+        self.max_concurrency = max_concurrency
+        self.events = events or EventBus()
+
+    async def archive_attendance(self, horizon_days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Move attendance older than the horizon into per-year documents.
+
+        Records go to morphers/{id}/attendance_archive/{year}, and the member
+        keeps an 'attendanceArchive' summary (record count, count per service,
+        archived years, and the cutoff date) so totals don't need the archive.
+        Running it again only moves what has aged past the horizon since.
+        """
+        horizon_days = self.horizon_days if horizon_days is None else horizon_days
+        cutoff = date.today() - timedelta(days=horizon_days)
+        cutoff_day = (cutoff - EPOCH).days
+
+        try:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            scanned = 0
+            archived_members = 0
+            archived_records = 0
+
+            async def archive(member: Dict[str, Any]) -> int:
+                async with semaphore:
+                    return await self._archive_member(member, cutoff, cutoff_day)
+
+            fields = ['attendance', 'attendanceArchive']
+            async for page in self.firebase.iter_documents(self.collection_name, page_size=self.page_size, fields=fields):
+                scanned += len(page)
+                counts = await asyncio.gather(*(archive(member) for member in page))
+                archived_members += sum(1 for count in counts if count)
+                archived_records += sum(counts)
+
+            if archived_records:
+                self.events.publish(MEMBERS_REPLACED, source="archive")
+
+            logger.info(
+                f"Archived {archived_records} attendance records before {cutoff.isoformat()} "
+                f"from {archived_members} of {scanned} members"
+            )
+            return {
+                "scanned": scanned,
+                "members_archived": archived_members,
+                "records_archived": archived_records,
+                "cutoff": cutoff.isoformat()
+            }
+
+        except Exception as e:
+            logger.error(f"Error archiving attendance: {e}")
+            raise
+
+    async def _archive_member(self, member: Dict[str, Any], cutoff: date, cutoff_day: int) -> int:
+        """Archive one member's old records; returns how many moved"""
+        by_year = defaultdict(dict)
+        for date_key, service in (member.get('attendance') or {}).items():
+            day = date_key_to_day(date_key)
+            if day is not None and day < cutoff_day:
+                by_year[date_key[6:]][date_key] = service
+
+        if not by_year:
+            return 0
+
+        summary = member.get('attendanceArchive') or empty_archive_summary()
+        summary = {**summary, "byService": dict(summary.get("byService") or {})}
+
+        # Records back-dated before an earlier cutoff may replace ones already archived
+        replaced = {}
+        if summary.get("before") and summary.get("years"):
+            overlapping = [year for year in by_year if year in summary["years"]]
+            if overlapping:
+                existing = await self.firebase.get_subcollection_documents(
+                    self.collection_name, member['id'], ARCHIVE_SUBCOLLECTION, overlapping
+                )
+                for year, doc in existing.items():
+                    for date_key, service in (doc.get('attendance') or {}).items():
+                        if date_key in by_year[year]:
+                            replaced[date_key] = service
+
+        for records in by_year.values():
+            for date_key, service in records.items():
+                if date_key in replaced:
+                    previous = replaced[date_key]
+                    summary["byService"][previous] = summary["byService"].get(previous, 0) - 1
+                else:
+                    summary["count"] += 1
+                summary["byService"][service] = summary["byService"].get(service, 0) + 1
+
+        summary["years"] = sorted(set(summary.get("years") or []) | set(by_year))
+        summary["before"] = max(summary.get("before") or "", cutoff.isoformat())
+
+        await self.firebase.archive_map_entries(
+            self.collection_name, member['id'], 'attendance', ARCHIVE_SUBCOLLECTION,
+            dict(by_year), {"attendanceArchive": summary, "lastUpdated": datetime.utcnow()}
+        )
+        return sum(len(records) for records in by_year.values())
@@ -5,8 +5,6 @@ import logging
 from typing import Dict, Any, List
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from passlib.hash import bcrypt
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +16,15 @@ class AuthService:
         self.authorized_emails = [email.strip().lower() for email in authorized_emails]
         self.algorithm = "HS256"
         self.access_token_expire_minutes = 60 * 24  # 24 hours
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self._pwd_context = None
+    
+    @property
+    def pwd_context(self):
+        """Password hashing context, created on first use since loading bcrypt is slow"""
+        if self._pwd_context is None:
+            from passlib.context import CryptContext
+            self._pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        return self._pwd_context
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
@@ -1,115 +1,376 @@
 """
 Data service for handling bulk data operations
 """
+import asyncio
 import logging
 import csv
 import io
-from typing import Dict, Any, List
-from datetime import datetime
-import pandas as pd
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Callable, TextIO, Tuple, Union
+from datetime import date, datetime, timedelta
 
 from services.firebase_service import FirebaseService
+from services.events import EventBus, MEMBERS_REPLACED
+from services.archive_service import ARCHIVE_SUBCOLLECTION, empty_archive_summary
 from utils.validation import PhoneValidator
+from utils.exceptions import PayloadTooLargeError
+from utils.search_keys import OBSOLETE_SEARCH_KEYS, SEARCH_KEY_SOURCE_FIELDS, normalize_name, search_keys_for_document
+from utils.member_schema import SCHEMA_VERSION, migrate_member, schema_version
+from utils.attendance_bits import AttendanceBits, EPOCH, date_key_to_day
+from utils.snapshot import (
+    MEMBER_FIELDS, detect_snapshot_format, iter_snapshot_records, member_record,
+    open_snapshot_writer, to_date_key, verify_snapshot
+)
 
 logger = logging.getLogger(__name__)
 
 class DataService:
     """Service for data management operations"""
     
-    def __init__(self, firebase_service: FirebaseService):
+    def __init__(self, firebase_service: FirebaseService, max_write_concurrency: int = 4, events: Optional[EventBus] = None):
         self.firebase = firebase_service
         self.collection_name = "morphers"
+        self.max_write_concurrency = max_write_concurrency
+        self.events = events or EventBus()
     
-    async def export_all_data(self) -> str:
-        """Export all member data as CSV"""
+    async def export_all_data(self, progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> str:
+        """Export all member data as CSV; progress(done, total, stage) is called as work proceeds"""
         try:
             # Get all members
+            if progress:
+                progress(0, None, "reading")
             members = await self.firebase.get_all_documents(self.collection_name)
+            archives = await self._load_archives(members)
+            if progress:
+                progress(len(members), len(members), "writing")
             
-            if not members:
-                return ""
+            return self.members_to_csv(members, archives)
             
-            # Flatten the data for CSV export
-            flattened_data = []
+        except Exception as e:
+            logger.error(f"Error exporting data: {e}")
+            raise
+    
+    def members_to_csv(self, members: List[Dict[str, Any]], archives: Optional[Dict[str, Dict[str, str]]] = None) -> str:
+        """
+        CSV with one row per member and one column per attendance date.
+        
+        archives ({member_id: {date_key: service}}) adds archived attendance to
+        the date columns, so a replace-import of the file keeps it; the next
+        archive run moves it out of the member documents again. An upsert
+        import leaves archived dates in the archive.
+        """
+        if not members:
+            return ""
+        
+        # Flatten the data for CSV export
+        flattened_data = []
+        
+        for member in members:
+            flat_record = {
+                'ID': member.get('id', ''),
+                'Name': member.get('Name', ''),
+                'MorphersNumber': member.get('MorphersNumber', ''),
+                'ParentsName': member.get('ParentsName', ''),
+                'ParentsNumber': member.get('ParentsNumber', ''),
+                'School': member.get('School', ''),
+                'Class': member.get('Class', ''),
+                'Residence': member.get('Residence', ''),
+                'Cell': member.get('Cell', ''),
+                'createdAt': self._format_timestamp(member.get('createdAt')),
+                'lastUpdated': self._format_timestamp(member.get('lastUpdated'))
+            }
             
-            for member in members:
-                flat_record = {
-                    'ID': member.get('id', ''),
-                    'Name': member.get('Name', ''),
-                    'MorphersNumber': member.get('MorphersNumber', ''),
-                    'ParentsName': member.get('ParentsName', ''),
-                    'ParentsNumber': member.get('ParentsNumber', ''),
-                    'School': member.get('School', ''),
-                    'Class': member.get('Class', ''),
-                    'Residence': member.get('Residence', ''),
-                    'Cell': member.get('Cell', ''),
-                    'createdAt': self._format_timestamp(member.get('createdAt')),
-                    'lastUpdated': self._format_timestamp(member.get('lastUpdated'))
-                }
-                
-                # Flatten attendance data
-                attendance = member.get('attendance', {})
-                for date, service in attendance.items():
-                    flat_record[f'attendance_{date}'] = service
-                
-                flattened_data.append(flat_record)
+            # Flatten attendance data
+            attendance = {**(archives or {}).get(member.get('id'), {}), **(member.get('attendance') or {})}
+            for date, service in attendance.items():
+                flat_record[f'attendance_{date}'] = service
             
-            # Convert to CSV
-            if not flattened_data:
-                return ""
+            flattened_data.append(flat_record)
+        
+        # Convert to CSV
+        if not flattened_data:
+            return ""
+        
+        # Get all unique column headers
+        all_headers = set()
+        for record in flattened_data:
+            all_headers.update(record.keys())
+        
+        headers = sorted(list(all_headers))
+        
+        # Create CSV content
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(flattened_data)
+        
+        return output.getvalue()
+    
+    async def export_snapshot(self, path: str, fmt: str = "ndjson", page_size: int = 1000,
+                              progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """
+        Write every member, with live and archived attendance, to a snapshot file.
+        
+        Members are streamed a page at a time and each page is encoded and
+        written (one Parquet row group per page) in a worker thread, so memory
+        stays bounded by the page size. Returns the snapshot manifest plus its
+        size in bytes. A failed export removes the partial file.
+        """
+        loop = asyncio.get_event_loop()
+        writer = await loop.run_in_executor(None, open_snapshot_writer, fmt, path)
+        
+        try:
+            async for page in self.firebase.iter_documents(self.collection_name, page_size=page_size):
+                archives = await self._load_archives(page)
+                records = [member_record(member, archives.get(member['id'])) for member in page]
+                await loop.run_in_executor(None, writer.write, records)
+                if progress:
+                    progress(writer.members, None, "writing")
             
-            # Get all unique column headers
-            all_headers = set()
-            for record in flattened_data:
-                all_headers.update(record.keys())
+            manifest = await loop.run_in_executor(None, writer.close)
             
-            headers = sorted(list(all_headers))
+        except BaseException as e:
+            logger.error(f"Error exporting {fmt} snapshot: {e}")
+            await loop.run_in_executor(None, self._discard_snapshot, writer)
+            raise
+        
+        logger.info(f"Exported {manifest['members']} members to a {fmt} snapshot")
+        return {**manifest, "format": fmt, "bytes": os.path.getsize(path)}
+    
+    async def _load_archives(self, page: List[Dict[str, Any]]) -> Dict[str, Dict[str, str]]:
+        """Archived attendance ({date_key: service}) of the members in a page that have any"""
+        semaphore = asyncio.Semaphore(self.max_write_concurrency)
+        
+        async def load(member: Dict[str, Any]) -> Dict[str, str]:
+            async with semaphore:
+                years = (member.get('attendanceArchive') or {}).get('years') or []
+                documents = await self.firebase.get_subcollection_documents(
+                    self.collection_name, member['id'], ARCHIVE_SUBCOLLECTION, years
+                )
+            records = {}
+            for document in documents.values():
+                records.update(document.get('attendance') or {})
+            return records
+        
+        archived = [member for member in page if (member.get('attendanceArchive') or {}).get('years')]
+        results = await asyncio.gather(*(load(member) for member in archived))
+        return {member['id']: records for member, records in zip(archived, results)}
+    
+    def _discard_snapshot(self, writer) -> None:
+        """Close and delete a partially written snapshot"""
+        try:
+            writer.close()
+        except Exception:
+            pass
+        if os.path.exists(writer.path):
+            os.remove(writer.path)
+    
+    async def restore_snapshot(self, path: str, page_size: int = 500,
+                               progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """
+        Replace all members with the contents of a snapshot file.
+        
+        Document IDs, createdAt and lastUpdated are kept, and archived
+        attendance goes back into the per-year archive documents. The file is
+        read through once and checked against its manifest before anything
+        is deleted: a valid snapshot is written as is, otherwise every record
+        is revalidated like a CSV row and invalid ones are skipped. Pages are
+        written with parallel batch commits while the next page is decoded.
+        """
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        pages = None
+        pending = None
+        
+        try:
+            fmt = await loop.run_in_executor(None, detect_snapshot_format, path)
+            if progress:
+                progress(0, None, "verifying")
+            manifest, verified = await loop.run_in_executor(None, verify_snapshot, path, fmt)
+            if not verified:
+                logger.warning("Snapshot checksum is missing or doesn't match; revalidating every record")
+            total = manifest['members'] if verified else None
             
-            # Create CSV content
-            output = io.StringIO()
-            writer = csv.DictWriter(output, fieldnames=headers)
-            writer.writeheader()
-            writer.writerows(flattened_data)
+            logger.info("Deleting existing data...")
+            deleted_count = await self.firebase.batch_delete_collection(
+                self.collection_name, max_concurrency=self.max_write_concurrency,
+                progress_callback=(lambda count: progress(count, None, "deleting")) if progress else None
+            )
+            await self.firebase.batch_delete_collection(
+                ARCHIVE_SUBCOLLECTION, max_concurrency=self.max_write_concurrency, collection_group=True
+            )
             
-            return output.getvalue()
+            writing_started = time.perf_counter()
+            restored = 0
+            written = 0
+            attendance = 0
+            errors = []
             
-        except Exception as e:
-            logger.error(f"Error exporting data: {e}")
+            pages = iter_snapshot_records(path, fmt, page_size)
+            while True:
+                page = await loop.run_in_executor(None, next, pages, None)
+                if page is None:
+                    break
+                
+                writes = []
+                for record in page:
+                    try:
+                        writes += self._snapshot_writes(record, validate=not verified)
+                    except Exception as e:
+                        errors.append(f"Member {record.get('id')}: {str(e)}")
+                        continue
+                    restored += 1
+                    attendance += len(record.get('attendance') or [])
+                
+                # One page commits while the next is decoded
+                if pending:
+                    await pending
+                    if progress:
+                        progress(written, total, "restoring")
+                pending = asyncio.ensure_future(self.firebase.batch_set_documents(
+                    writes, max_concurrency=self.max_write_concurrency
+                ))
+                written = restored
+            
+            if pending:
+                await pending
+                pending = None
+            if progress:
+                progress(written, total, "restoring")
+            
+            finished = time.perf_counter()
+            result = {
+                "restored": restored,
+                "attendance": attendance,
+                "deleted": deleted_count,
+                "format": fmt,
+                "verified": verified,
+                "errors": errors,
+                "seconds": round(finished - started, 2),
+                "members_per_second": round(restored / max(finished - writing_started, 1e-6)),
+                "success": True
+            }
+            
+            logger.info(f"Restore completed: {restored} members in {result['seconds']}s "
+                        f"({result['members_per_second']} members/s, verified={verified})")
+            self.events.publish(MEMBERS_REPLACED, source="restore")
+            return result
+            
+        except BaseException as e:
+            if pending and not pending.done():
+                pending.cancel()
+            logger.error(f"Error restoring snapshot: {e}")
             raise
+        finally:
+            if pages:
+                pages.close()
     
-    async def import_csv_data(self, csv_content: str) -> Dict[str, Any]:
-        """Import data from CSV content"""
-        try:
-            # Parse CSV
-            csv_file = io.StringIO(csv_content)
-            reader = csv.DictReader(csv_file)
+    def _snapshot_writes(self, record: Dict[str, Any], validate: bool) -> List[tuple]:
+        """Firestore writes restoring one snapshot record: the member and its archived years"""
+        member_id = record.get('id')
+        if not member_id or '/' in member_id:
+            raise ValueError("Invalid member ID")
+        
+        if validate:
+            member = self._parse_csv_row({field: record.get(field) or '' for field in MEMBER_FIELDS})
+        else:
+            member = {field: record.get(field) or '' for field in MEMBER_FIELDS}
+        
+        now = datetime.utcnow()
+        member['createdAt'] = record.get('createdAt') or now
+        member['lastUpdated'] = record.get('lastUpdated') or now
+        
+        live = {}
+        archived = defaultdict(dict)
+        summary = empty_archive_summary()
+        latest = None
+        for entry in record.get('attendance') or []:
+            day, service = entry.get('date'), entry.get('service')
+            if validate and service not in ('1', '2', '3'):
+                continue
+            date_key = to_date_key(day) if day else entry.get('key')
+            if not date_key:
+                continue
             
-            rows = list(reader)
-            if not rows:
-                raise ValueError("No data rows found in CSV")
+            if entry.get('archived') and day:
+                archived[str(day.year)][date_key] = service
+                summary["count"] += 1
+                summary["byService"][service] = summary["byService"].get(service, 0) + 1
+                latest = max(latest or day, day)
+            else:
+                live[date_key] = service
+        
+        member['attendance'] = live
+        # Snapshots keep the fields as they were stored; bring them to the current layout
+        migrate_member(member)
+        if archived:
+            summary["years"] = sorted(archived)
+            summary["before"] = (latest + timedelta(days=1)).isoformat()
+            member['attendanceArchive'] = summary
+        
+        member_path = f"{self.collection_name}/{member_id}"
+        return [(member_path, member)] + [
+            (f"{member_path}/{ARCHIVE_SUBCOLLECTION}/{year}", {"attendance": records})
+            for year, records in archived.items()
+        ]
+    
+    async def import_csv_data(self, csv_content: Union[str, TextIO], mode: str = "replace", delete_missing: bool = False,
+                              max_rows: Optional[int] = None,
+                              progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """
+        Import data from CSV content, or a seekable text file read in chunks.
+        
+        mode="replace" deletes the collection and recreates every member.
+        mode="upsert" matches rows to existing members by ID (or phone + name)
+        and only writes rows that changed; with delete_missing, members absent
+        from the CSV are deleted. progress(done, total, stage) is called as
+        each stage advances. More than max_rows data rows raise
+        PayloadTooLargeError before anything is written.
+        """
+        try:
+            if mode not in ("replace", "upsert"):
+                raise ValueError(f"Unknown import mode: {mode}")
             
-            # Convert CSV rows to member documents
-            members = []
-            errors = []
+            csv_file = io.StringIO(csv_content) if isinstance(csv_content, str) else csv_content
             
-            for i, row in enumerate(rows, 1):
-                try:
-                    member = self._parse_csv_row(row)
-                    if member:
-                        members.append(member)
-                except Exception as e:
-                    errors.append(f"Row {i}: {str(e)}")
+            # Parse and validate CSV rows into member documents, off the event loop
+            members, row_ids, errors = await asyncio.get_event_loop().run_in_executor(
+                None, self._parse_csv, csv_file, max_rows
+            )
             
             if not members:
                 raise ValueError("No valid member records found in CSV")
             
+            if mode == "upsert":
+                result = await self._upsert_members(list(zip(row_ids, members)), delete_missing, progress)
+                result.update({
+                    "imported": result["created"] + result["updated"],
+                    "errors": errors,
+                    "success": True
+                })
+                
+                logger.info(f"Upsert import completed: {result}")
+                self.events.publish(MEMBERS_REPLACED, source="import")
+                return result
+            
             # Clear existing data if requested
             logger.info("Deleting existing data...")
-            deleted_count = await self.firebase.batch_delete_collection(self.collection_name)
+            deleted_count = await self.firebase.batch_delete_collection(
+                self.collection_name, max_concurrency=self.max_write_concurrency,
+                progress_callback=(lambda count: progress(count, None, "deleting")) if progress else None
+            )
+            await self.firebase.batch_delete_collection(
+                ARCHIVE_SUBCOLLECTION, max_concurrency=self.max_write_concurrency, collection_group=True
+            )
             
             # Import new data
             logger.info(f"Importing {len(members)} members...")
-            doc_ids = await self.firebase.batch_create_documents(self.collection_name, members)
+            doc_ids = await self.firebase.batch_create_documents(
+                self.collection_name, members,
+                progress_callback=(lambda count: progress(count, len(members), "creating")) if progress else None
+            )
             
             result = {
                 "imported": len(members),
@@ -119,23 +380,194 @@ class DataService:
             }
             
             logger.info(f"Import completed: {result}")
+            self.events.publish(MEMBERS_REPLACED, source="import")
             return result
             
         except Exception as e:
             logger.error(f"Error importing CSV data: {e}")
             raise
     
-    async def get_statistics(self) -> Dict[str, Any]:
-        """Get system statistics"""
+    async def _upsert_members(self, rows: List[tuple], delete_missing: bool,
+                              progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """Write only new or changed members, matching rows by ID or phone + name"""
+        if progress:
+            progress(0, len(rows), "matching")
+        existing = await self.firebase.get_all_documents(self.collection_name)
+        by_id = {member['id']: member for member in existing}
+        by_key = {self._member_match_key(member): member for member in existing}
+        
+        creates = []
+        updates = {}
+        matched_ids = set()
+        unchanged = 0
+        now = datetime.utcnow()
+        
+        for row_id, member in rows:
+            current = by_id.get(row_id) if row_id else None
+            if current is None:
+                current = by_key.get(self._member_match_key(member))
+            
+            if current is None:
+                creates.append(member)
+                continue
+            
+            matched_ids.add(current['id'])
+            if 'attendance' in member:
+                member = {**member, 'attendance': self._without_archived(member['attendance'], current)}
+            
+            # Per-field diff against the stored document
+            changes = {field: value for field, value in member.items() if current.get(field) != value}
+            if changes:
+                changes['lastUpdated'] = now
+                updates.setdefault(current['id'], {}).update(changes)
+            else:
+                unchanged += 1
+        
+        deletes = [member_id for member_id in by_id if member_id not in matched_ids] if delete_missing else []
+        
+        if creates:
+            if progress:
+                progress(0, len(creates), "creating")
+            await self.firebase.batch_create_documents(
+                self.collection_name, creates,
+                progress_callback=(lambda count: progress(count, len(creates), "creating")) if progress else None
+            )
+        if updates:
+            await self.firebase.batch_update_documents(
+                self.collection_name, updates, max_concurrency=self.max_write_concurrency,
+                progress_callback=(lambda count: progress(count, len(updates), "updating")) if progress else None
+            )
+        if deletes:
+            if progress:
+                progress(0, len(deletes), "deleting")
+            await self.firebase.batch_delete_documents(
+                self.collection_name, deletes, subcollections=(ARCHIVE_SUBCOLLECTION,)
+            )
+        
+        return {
+            "created": len(creates),
+            "updated": len(updates),
+            "unchanged": unchanged,
+            "deleted": len(deletes)
+        }
+    
+    def _without_archived(self, attendance: Dict[str, str], current: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Row attendance without the dates the member's archive holds.
+        
+        Exports include archived dates in the date columns; comparing them with
+        the live map would move them back onto the member while the archive
+        still counts them. Dates before the archive cutoff that are live
+        (recorded back-dated since the last archive run) are kept.
+        """
+        before = (current.get('attendanceArchive') or {}).get('before')
+        if not before:
+            return attendance
+        
+        cutoff_day = (date.fromisoformat(before[:10]) - EPOCH).days
+        live = current.get('attendance') or {}
+        kept = {}
+        for date_key, service in attendance.items():
+            day = date_key_to_day(date_key)
+            if date_key in live or day is None or day >= cutoff_day:
+                kept[date_key] = service
+        return kept
+    
+    def _member_match_key(self, member: Dict[str, Any]) -> str:
+        """Natural key for matching CSV rows without an ID: normalized phone + lower-cased name"""
+        phone = PhoneValidator.normalize_phone_number(member.get('MorphersNumber', ''))
+        return f"{phone}|{normalize_name(member.get('Name', ''))}"
+    
+    async def backfill_search_keys(self, batch_size: int = 500,
+                                   progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """One-time migration: add phones to existing members and drop the name keys earlier versions stored"""
         try:
-            # Get all members
-            members = await self.firebase.get_all_documents(self.collection_name)
+            if progress:
+                progress(0, None, "reading")
+            fields = list(SEARCH_KEY_SOURCE_FIELDS) + ['phones'] + list(OBSOLETE_SEARCH_KEYS)
+            members = await self.firebase.get_all_documents(self.collection_name, fields=fields)
             
-            total_members = len(members)
+            # Only write members whose keys are missing or stale
+            updates = {}
+            for member in members:
+                keys = search_keys_for_document(member)
+                if any(member.get(field) != value for field, value in keys.items()):
+                    updates[member['id']] = keys
+                # A one-element tuple key is a top-level field path; None deletes the field
+                obsolete = {(field,): None for field in OBSOLETE_SEARCH_KEYS if field in member}
+                if obsolete:
+                    updates[member['id']] = {**keys, **obsolete}
             
-            # Calculate statistics
+            logger.info(f"Backfilling search keys for {len(updates)} of {len(members)} members...")
+            updated = await self.firebase.batch_update_documents(
+                self.collection_name, updates, batch_size=batch_size, max_concurrency=self.max_write_concurrency,
+                progress_callback=(lambda count: progress(count, len(updates), "updating")) if progress else None
+            )
+            
+            result = {
+                "scanned": len(members),
+                "updated": updated,
+                "unchanged": len(members) - updated
+            }
+            
+            logger.info(f"Search key backfill completed: {result}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error backfilling search keys: {e}")
+            raise
+    
+    async def migrate_members(self, page_size: int = 1000,
+                              progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """
+        Bring every member document to the current schema version.
+        
+        Members are streamed a page at a time and only the fields a migration
+        changed are written, attendance one entry at a time, so attendance
+        recorded meanwhile isn't overwritten. Reports how many
+        members were at each version before the run.
+        """
+        try:
+            scanned = 0
+            updated = 0
+            versions = defaultdict(int)
+            
+            async for page in self.firebase.iter_documents(self.collection_name, page_size=page_size):
+                updates = {}
+                for member in page:
+                    versions[str(schema_version(member))] += 1
+                    changes = migrate_member(member)
+                    if changes:
+                        updates[member['id']] = changes
+                
+                if updates:
+                    updated += await self.firebase.batch_update_documents(
+                        self.collection_name, updates, max_concurrency=self.max_write_concurrency
+                    )
+                scanned += len(page)
+                if progress:
+                    progress(scanned, None, "migrating")
+            
+            result = {
+                "schema_version": SCHEMA_VERSION,
+                "scanned": scanned,
+                "updated": updated,
+                "unchanged": scanned - updated,
+                "versions": dict(versions)
+            }
+            
+            logger.info(f"Schema migration completed: {result}")
+            return result
+        
+        except Exception as e:
+            logger.error(f"Error migrating members: {e}")
+            raise
+    
+    async def get_statistics(self) -> Dict[str, Any]:
+        """Get system statistics"""
+        try:
             stats = {
-                "total_members": total_members,
+                "total_members": 0,
                 "active_members": 0,
                 "recent_registrations": 0,
                 "by_cell": {"Yes": 0, "No": 0},
@@ -145,45 +577,15 @@ class DataService:
                 "by_residence": {}
             }
             
-            if not members:
-                return stats
-            
             # Calculate recent registrations (last 30 days)
             thirty_days_ago = datetime.now().timestamp() - (30 * 24 * 60 * 60)
             
-            for member in members:
-                # Cell statistics
-                cell = member.get('Cell', '0')
-                if cell == '1':
-                    stats["by_cell"]["Yes"] += 1
-                else:
-                    stats["by_cell"]["No"] += 1
-                
-                # Recent registrations
-                created_at = member.get('createdAt')
-                if created_at and hasattr(created_at, 'timestamp'):
-                    if created_at.timestamp() > thirty_days_ago:
-                        stats["recent_registrations"] += 1
-                
-                # Attendance statistics
-                attendance = member.get('attendance', {})
-                if attendance:
-                    stats["active_members"] += 1
-                    
-                    # Count by service
-                    for date, service in attendance.items():
-                        if service in stats["by_service"]:
-                            stats["by_service"][service] += 1
-                
-                # School statistics
-                school = member.get('School', '').strip()
-                if school:
-                    stats["by_school"][school] = stats["by_school"].get(school, 0) + 1
-                
-                # Residence statistics
-                residence = member.get('Residence', '').strip()
-                if residence:
-                    stats["by_residence"][residence] = stats["by_residence"].get(residence, 0) + 1
+            # Stream members page by page, reading only the fields counted here
+            fields = ['Cell', 'createdAt', 'attendance', 'attendanceArchive', 'School', 'Residence', 'schemaVersion']
+            async for page in self.firebase.iter_documents(self.collection_name, fields=fields):
+                for member in page:
+                    stats["total_members"] += 1
+                    self._count_member(stats, member, thirty_days_ago)
             
             return stats
             
@@ -191,6 +593,218 @@ class DataService:
             logger.error(f"Error getting statistics: {e}")
             raise
     
+    def _count_member(self, stats: Dict[str, Any], member: Dict[str, Any], thirty_days_ago: float) -> None:
+        """Add one member to the running statistics"""
+        migrate_member(member)
+        
+        # Cell statistics
+        if member['Cell'] == '1':
+            stats["by_cell"]["Yes"] += 1
+        else:
+            stats["by_cell"]["No"] += 1
+        
+        # Recent registrations
+        created_at = member.get('createdAt')
+        if created_at and hasattr(created_at, 'timestamp'):
+            if created_at.timestamp() > thirty_days_ago:
+                stats["recent_registrations"] += 1
+        
+        # Attendance statistics, counted on the bitset rather than per record;
+        # archived history is counted from the member's summary counters
+        attendance = AttendanceBits.from_dict(member['attendance'])
+        archive = member.get('attendanceArchive') or {}
+        if attendance or archive.get('count'):
+            stats["active_members"] += 1
+            
+            for service, count in attendance.service_counts().items():
+                stats["by_service"][service] += count
+            for service, count in (archive.get('byService') or {}).items():
+                if service in stats["by_service"]:
+                    stats["by_service"][service] += count
+        
+        # School statistics
+        school = member['School']
+        if school:
+            stats["by_school"][school] = stats["by_school"].get(school, 0) + 1
+        
+        # Residence statistics
+        residence = member['Residence']
+        if residence:
+            stats["by_residence"][residence] = stats["by_residence"].get(residence, 0) + 1
+    
+    def _parse_csv(self, csv_file: TextIO, max_rows: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """Parse a CSV file into (members, their CSV IDs, row errors)"""
+        import pandas as pd
+        
+        # pandas renames duplicate columns (Name.1) where csv.DictReader keeps the last one
+        header = next(csv.reader(csv_file), [])
+        csv_file.seek(0)
+        if len(set(header)) != len(header):
+            return self._parse_csv_rows(csv_file, max_rows)
+        
+        try:
+            return self._parse_csv_frames(csv_file, max_rows)
+        except pd.errors.ParserError as e:
+            # Malformed rows (e.g. extra fields) stop pandas; the row parser reports them per row
+            logger.warning(f"Parsing CSV row by row: {e}")
+            csv_file.seek(0)
+            return self._parse_csv_rows(csv_file, max_rows)
+    
+    def _parse_csv_rows(self, csv_file: TextIO, max_rows: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """Parse and validate a CSV file one row at a time"""
+        members = []
+        row_ids = []
+        errors = []
+        
+        i = 0
+        # Short rows read as empty fields, as in the pandas parser
+        for i, row in enumerate(csv.DictReader(csv_file, restval=''), 1):
+            if max_rows is not None and i > max_rows:
+                raise PayloadTooLargeError(f"CSV has more than {max_rows} data rows")
+            try:
+                member = self._parse_csv_row(row)
+                if member:
+                    members.append(member)
+                    row_ids.append((row.get('ID') or '').strip())
+            except Exception as e:
+                errors.append(f"Row {i}: {str(e)}")
+        
+        if not i:
+            raise ValueError("No data rows found in CSV")
+        
+        return members, row_ids, errors
+    
+    def _parse_csv_frames(self, csv_file: TextIO, max_rows: Optional[int] = None,
+                          chunk_rows: int = 10000) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """
+        Parse and validate a CSV file column-wise with pandas, chunk_rows at a time.
+        
+        Only one chunk of raw rows is held at once, the file is decoded as it
+        is read, and a file over max_rows data rows fails as soon as the
+        chunk crossing the limit is read.
+        """
+        import pandas as pd
+        
+        members = []
+        row_ids = []
+        errors = []
+        phones: Dict[str, Optional[str]] = {}
+        rows = 0
+        
+        try:
+            # index_col=False: rows with a trailing delimiter mustn't turn the first column into the index
+            chunks = pd.read_csv(
+                csv_file, dtype=object, keep_default_na=False, na_values=[''], index_col=False, chunksize=chunk_rows
+            )
+            for frame in chunks:
+                rows += len(frame)
+                if max_rows is not None and rows > max_rows:
+                    raise PayloadTooLargeError(f"CSV has more than {max_rows} data rows")
+                if frame.empty:
+                    continue
+                chunk_members, chunk_ids, chunk_errors = self._parse_csv_frame(frame, phones)
+                members += chunk_members
+                row_ids += chunk_ids
+                errors += chunk_errors
+        except pd.errors.EmptyDataError:
+            pass
+        
+        if not rows:
+            raise ValueError("No data rows found in CSV")
+        
+        return members, row_ids, errors
+    
+    def _parse_csv_frame(self, frame: 'pd.DataFrame',
+                         phones: Dict[str, Optional[str]]) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """
+        Parse and validate a chunk of CSV rows column-wise.
+        
+        Gives the same members and errors as _parse_csv_rows: fields are
+        stripped and checked a column at a time, each distinct phone number is
+        validated once (phones maps it to its normalized form, or None if
+        invalid, across chunks), and the attendance_* columns are melted into
+        (row, date, service) entries in one step, skipping empty cells.
+        """
+        import numpy as np
+        import pandas as pd
+        
+        def column(name: str, default: str = '') -> 'pd.Series':
+            if name not in frame.columns:
+                return pd.Series(default, index=frame.index, dtype=object)
+            return frame[name].fillna('').str.strip()
+        
+        name = column('Name')
+        morphers_number = column('MorphersNumber')
+        parents_number = column('ParentsNumber')
+        school = column('School')
+        class_level = column('Class')
+        residence = column('Residence')
+        cell = column('Cell', '0')
+        
+        # libphonenumber is slow, so each distinct number is validated and normalized once
+        for number in pd.unique(pd.concat([morphers_number, parents_number])):
+            if number and number not in phones:
+                phones[number] = (
+                    self._normalize_phone_number(number) if PhoneValidator.validate_phone_number(number) else None
+                )
+        morphers_normalized = morphers_number.map(phones)
+        
+        # The first failed check is the row's error, as in _parse_csv_row
+        checks = [
+            (name.str.len() < 2, "Invalid or missing name"),
+            (morphers_number == '', "Missing morphers number"),
+            (morphers_normalized.isna(), "Invalid morphers number: " + morphers_number),
+            (school == '', "Missing school"),
+            (class_level == '', "Missing class"),
+            (residence == '', "Missing residence")
+        ]
+        reason = pd.Series('', index=frame.index, dtype=object)
+        for failed, message in reversed(checks):
+            reason = reason.mask(failed, message)
+        
+        parents_normalized = parents_number.map(phones).fillna('')
+        cell = cell.where(cell.isin(['0', '1']), '0')
+        
+        # Melt the attendance columns to long format, keeping only non-empty cells
+        attendance = [{} for _ in range(len(frame))]
+        attendance_columns = [column_name for column_name in frame.columns if column_name.startswith('attendance_')]
+        if attendance_columns:
+            values = frame[attendance_columns].to_numpy()
+            rows, columns = np.nonzero(pd.notna(values))
+            services = pd.Series(values[rows, columns], dtype=object)
+            # Nearly every cell is an exact service number; only the rest need stripping
+            padded = ~services.isin(['1', '2', '3'])
+            services[padded] = services[padded].str.strip()
+            keep = services.isin(['1', '2', '3']).to_numpy()
+            date_keys = [column_name.replace('attendance_', '') for column_name in attendance_columns]
+            for row, position, service in zip(rows[keep].tolist(), columns[keep].tolist(), services[keep].tolist()):
+                attendance[row][date_keys[position]] = service
+        
+        # Chunks keep counting the index, so it numbers rows across the whole file
+        errors = [f"Row {i}: {message}" for i, message in zip((frame.index + 1).tolist(), reason.tolist()) if message]
+        
+        fields = zip(
+            column('ID').tolist(), name.tolist(), morphers_normalized.tolist(), column('ParentsName').tolist(),
+            parents_normalized.tolist(), school.tolist(), class_level.tolist(), residence.tolist(),
+            cell.tolist(), attendance, (reason == '').tolist()
+        )
+        members = []
+        row_ids = []
+        for row_id, *member_fields, row_attendance, valid in fields:
+            if not valid:
+                continue
+            member = dict(zip(
+                ('Name', 'MorphersNumber', 'ParentsName', 'ParentsNumber', 'School', 'Class', 'Residence', 'Cell'),
+                member_fields
+            ))
+            member['attendance'] = row_attendance
+            member['schemaVersion'] = SCHEMA_VERSION
+            member.update(search_keys_for_document(member))
+            members.append(member)
+            row_ids.append(row_id)
+        
+        return members, row_ids, errors
+    
     def _parse_csv_row(self, row: Dict[str, str]) -> Dict[str, Any]:
         """Parse a CSV row into a member document"""
         # Required fields
@@ -231,7 +845,8 @@ class DataService:
         # Parse attendance data
         attendance = {}
         for key, value in row.items():
-            if key.startswith('attendance_') and value and value.strip():
+            # Fields beyond the header (a trailing delimiter) come under the key None
+            if key and key.startswith('attendance_') and value and value.strip():
                 date_key = key.replace('attendance_', '')
                 service = value.strip()
                 if service in ['1', '2', '3']:
@@ -247,8 +862,10 @@ class DataService:
             'Class': class_level,
             'Residence': residence,
             'Cell': cell,
-            'attendance': attendance
+            'attendance': attendance,
+            'schemaVersion': SCHEMA_VERSION
         }
+        member.update(search_keys_for_document(member))
         
         return member
     
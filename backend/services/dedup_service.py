@@ -0,0 +1,244 @@
+"""
+Dedup service for finding and merging duplicate member registrations
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Callable
+from datetime import datetime
+
+from services.firebase_service import FirebaseService
+from services.events import EventBus, MEMBERS_REPLACED
+from services.archive_service import ARCHIVE_SUBCOLLECTION, empty_archive_summary
+from services.member_service import MemberService
+from utils.name_matching import name_similarity
+from utils.search_keys import search_keys_for_document
+
+logger = logging.getLogger(__name__)
+
+class DedupService:
+    """Service for duplicate member detection"""
+
+    def __init__(self, firebase_service: FirebaseService, page_size: int = 1000, events: Optional[EventBus] = None):
+        self.firebase = firebase_service
+        self.collection_name = "morphers"
+        self.page_size = page_size
+        self.events = events or EventBus()
+
+    async def find_duplicates(self, threshold: float = 0.88, merge: bool = False,
+                              progress: Optional[Callable[[int, Optional[int], str], None]] = None) -> Dict[str, Any]:
+        """
+        Find members that are likely the same person registered twice.
+
+        Members are blocked by normalized phone number and only pairs within a
+        block are compared, so the cost stays near-linear in collection size.
+        Each cluster keeps the member that registered first, and every duplicate
+        in it scores at least threshold against that member: matches aren't
+        chained through a third registration. With merge=True, each cluster's
+        attendance, live and archived, is merged into the kept member and the
+        duplicates are deleted with their archives. progress(done,
+        total, stage) reports members scanned, then clusters merged.
+        """
+        try:
+            members = {}
+            blocks = defaultdict(list)
+
+            # Stream the collection, keeping only what scoring needs
+            fields = ['Name', 'MorphersNumber', 'ParentsNumber', 'attendance', 'attendanceArchive', 'createdAt']
+            async for page in self.firebase.iter_documents(self.collection_name, page_size=self.page_size, fields=fields):
+                for member in page:
+                    member['attendance'] = MemberService.attendance_to_bits(member.get('attendance'))
+                    members[member['id']] = member
+                    for phone in search_keys_for_document(member)['phones']:
+                        blocks[phone].append(member['id'])
+                if progress:
+                    progress(len(members), None, "scanning")
+
+            # Score pairs within each block and union matches into candidate groups
+            parent = {}
+
+            def find(member_id: str) -> str:
+                while parent.get(member_id, member_id) != member_id:
+                    member_id = parent[member_id]
+                return member_id
+
+            pair_scores = {}
+            pairs_compared = 0
+            for member_ids in blocks.values():
+                for i, id_a in enumerate(member_ids):
+                    for id_b in member_ids[i + 1:]:
+                        pair = (id_a, id_b) if id_a < id_b else (id_b, id_a)
+                        if pair in pair_scores:
+                            continue  # Already compared through another shared phone
+
+                        pairs_compared += 1
+                        score = name_similarity(members[id_a].get('Name', ''), members[id_b].get('Name', ''))
+                        pair_scores[pair] = score
+                        if score >= threshold:
+                            parent[find(id_a)] = find(id_b)
+
+            groups = defaultdict(list)
+            for member_id in parent:
+                groups[find(member_id)].append(member_id)
+            for root in list(groups):
+                if root not in groups[root]:
+                    groups[root].append(root)
+
+            report = [
+                cluster for member_ids in groups.values()
+                for cluster in self._cluster_reports(members, member_ids, pair_scores, threshold)
+            ]
+            report.sort(key=lambda cluster: cluster['keep']['name'].lower())
+
+            merged = 0
+            if merge:
+                for i, cluster in enumerate(report, 1):
+                    merged += await self._merge_cluster(members, cluster)
+                    if progress:
+                        progress(i, len(report), "merging")
+                if merged:
+                    self.events.publish(MEMBERS_REPLACED, source="dedup")
+
+            result = {
+                "scanned": len(members),
+                "blocks": sum(1 for member_ids in blocks.values() if len(member_ids) > 1),
+                "pairs_compared": pairs_compared,
+                "clusters": report,
+                "duplicates": sum(len(cluster['duplicates']) for cluster in report),
+                "merged": merged
+            }
+
+            logger.info(
+                f"Dedup scanned {result['scanned']} members, found {result['duplicates']} duplicates "
+                f"in {len(report)} clusters ({pairs_compared} pairs compared)"
+            )
+            return result
+
+        except Exception as e:
+            logger.error(f"Error finding duplicates: {e}")
+            raise
+
+    def _cluster_reports(self, members: Dict[str, Dict[str, Any]], member_ids: List[str],
+                         pair_scores: Dict[tuple, float], threshold: float) -> List[Dict[str, Any]]:
+        """
+        Split a group of chained matches into clusters and describe them.
+
+        The earliest registration not yet clustered is kept, with every
+        remaining member that matches it directly as its duplicates, until
+        nobody left matches anyone.
+        """
+        remaining = sorted(
+            member_ids,
+            key=lambda member_id: (self._created_at_key(members[member_id]), member_id)
+        )
+
+        def score(id_a: str, id_b: str) -> Optional[float]:
+            return pair_scores.get((id_a, id_b) if id_a < id_b else (id_b, id_a))
+
+        def summary(member_id: str) -> Dict[str, Any]:
+            member = members[member_id]
+            return {
+                "id": member_id,
+                "name": member.get('Name', ''),
+                "morphers_number": member.get('MorphersNumber', ''),
+                "attendance_count": len(member['attendance'])
+            }
+
+        reports = []
+        while remaining:
+            keep_id, candidates = remaining[0], remaining[1:]
+            duplicate_ids = [member_id for member_id in candidates if (score(keep_id, member_id) or 0) >= threshold]
+            if duplicate_ids:
+                reports.append({
+                    "keep": summary(keep_id),
+                    "duplicates": [{**summary(member_id), "score": score(keep_id, member_id)} for member_id in duplicate_ids]
+                })
+            remaining = [member_id for member_id in candidates if member_id not in duplicate_ids]
+        return reports
+
+    async def _merge_cluster(self, members: Dict[str, Dict[str, Any]], cluster: Dict[str, Any]) -> int:
+        """
+        Merge duplicates' attendance into the kept member and delete the duplicates.
+
+        Only dates missing on the kept member are written, one map entry each,
+        so check-ins since the scan are kept. Nothing is deleted if the kept
+        member no longer exists.
+        """
+        keep_id = cluster['keep']['id']
+        duplicate_ids = [duplicate['id'] for duplicate in cluster['duplicates']]
+
+        # The kept member's record wins when two registrations disagree on a date
+        kept = MemberService.attendance_from_bits(members[keep_id]['attendance'])
+        missing = {}
+        for member_id in duplicate_ids:
+            for date_key, service in MemberService.attendance_from_bits(members[member_id]['attendance']).items():
+                if date_key not in kept:
+                    missing.setdefault(date_key, service)
+
+        # Even with nothing to add, the update confirms the kept member still exists
+        updates = {('attendance', date_key): service for date_key, service in missing.items()}
+        if not await self.firebase.update_document(self.collection_name, keep_id, updates):
+            logger.warning(f"Kept member {keep_id} no longer exists; left its {len(duplicate_ids)} duplicates in place")
+            return 0
+        await self._merge_archives(members, keep_id, duplicate_ids, set(kept) | set(missing))
+
+        await self.firebase.batch_delete_documents(
+            self.collection_name, duplicate_ids, subcollections=(ARCHIVE_SUBCOLLECTION,)
+        )
+        logger.info(f"Merged {len(duplicate_ids)} duplicates into member {keep_id}")
+        return len(duplicate_ids)
+
+    async def _merge_archives(self, members: Dict[str, Dict[str, Any]], keep_id: str, duplicate_ids: List[str],
+                              live_keys: set) -> None:
+        """Move the duplicates' archived attendance into the kept member's archive, keeping its own records"""
+        archived = {}
+        before = None
+        for member_id in duplicate_ids:
+            summary = members[member_id].get('attendanceArchive') or {}
+            if not summary.get('years'):
+                continue
+            documents = await self.firebase.get_subcollection_documents(
+                self.collection_name, member_id, ARCHIVE_SUBCOLLECTION, summary['years']
+            )
+            for document in documents.values():
+                archived.update(document.get('attendance') or {})
+            before = max(before or '', summary.get('before') or '') or None
+
+        # Dates the kept member already has, live or archived, keep its record
+        by_year = defaultdict(dict)
+        for date_key, service in archived.items():
+            if date_key not in live_keys:
+                by_year[date_key[6:]][date_key] = service
+
+        summary = members[keep_id].get('attendanceArchive') or empty_archive_summary()
+        overlapping = [year for year in by_year if year in (summary.get('years') or [])]
+        if overlapping:
+            existing = await self.firebase.get_subcollection_documents(
+                self.collection_name, keep_id, ARCHIVE_SUBCOLLECTION, overlapping
+            )
+            for year, document in existing.items():
+                for date_key in document.get('attendance') or {}:
+                    by_year[year].pop(date_key, None)
+        by_year = {year: records for year, records in by_year.items() if records}
+        if not by_year:
+            return
+
+        summary = {**summary, "byService": dict(summary.get("byService") or {})}
+        for records in by_year.values():
+            summary["count"] += len(records)
+            for service in records.values():
+                summary["byService"][service] = summary["byService"].get(service, 0) + 1
+        summary["years"] = sorted(set(summary.get("years") or []) | set(by_year))
+        summary["before"] = max(summary.get("before") or '', before or '') or None
+
+        # None of these dates is live on the kept member, so archiving them there deletes nothing
+        await self.firebase.archive_map_entries(
+            self.collection_name, keep_id, 'attendance', ARCHIVE_SUBCOLLECTION,
+            by_year, {"attendanceArchive": summary, "lastUpdated": datetime.utcnow()}
+        )
+
+    def _created_at_key(self, member: Dict[str, Any]) -> float:
+        """Sort key for registration time; members without one sort last"""
+        created_at = member.get('createdAt')
+        if created_at and hasattr(created_at, 'timestamp'):
+            return created_at.timestamp()
+        return float('inf')
@@ -0,0 +1,41 @@
+"""
+In-process event bus for member and attendance changes
+"""
+import logging
+from typing import Callable, Dict, Any, List, Set
+
+logger = logging.getLogger(__name__)
+
+# Event types published by the services
+ATTENDANCE_ADDED = "attendance_added"
+ATTENDANCE_REMOVED = "attendance_removed"
+MEMBER_CREATED = "member_created"
+MEMBER_UPDATED = "member_updated"
+MEMBER_DELETED = "member_deleted"
+MEMBERS_REPLACED = "members_replaced"  # Bulk imports, merges and migrations
+
+def changed_fields(changes: Dict[Any, Any]) -> Set[str]:
+    """Fields a MEMBER_UPDATED changes payload touches; a (field, key) key updates one entry of a map field"""
+    return {key[0] if isinstance(key, tuple) else key for key in changes}
+
+class EventBus:
+    """Synchronous publish/subscribe so caches can follow writes without re-reading Firestore"""
+
+    def __init__(self):
+        self._subscribers: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def subscribe(self, callback: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Register a callback(event_type, payload); callbacks must not block"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, Dict[str, Any]], None]) -> None:
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def publish(self, event_type: str, **payload: Any) -> None:
+        """Deliver an event to every subscriber; a failing subscriber doesn't affect the others"""
+        for callback in list(self._subscribers):
+            try:
+                callback(event_type, payload)
+            except Exception as e:
+                logger.error(f"Event subscriber failed on {event_type}: {e}")
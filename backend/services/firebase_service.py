@@ -2,27 +2,63 @@
 Firebase service for interacting with Firestore database
 """
 import asyncio
+import functools
 import logging
-from typing import Optional, Dict, Any, List
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable, AsyncIterator, Sequence
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud.firestore_v1 import DocumentReference, DocumentSnapshot
+
+from services.query_planner import MemberQueryPlanner
+from utils.admission import ConcurrencyLimiter, note_unavailable
+from utils.exceptions import CircuitOpenError, DeadlineExceededError, OverloadedError
+from utils.resilience import CircuitBreaker, RetryPolicy, is_transient
 
 logger = logging.getLogger(__name__)
 
 class FirebaseService:
     """Service for Firebase Firestore operations"""
     
-    def __init__(self, project_id: str, private_key_path: str):
+    def __init__(self, project_id: str, private_key_path: str, defer_init: bool = False,
+                 max_workers: Optional[int] = None, use_search_keys: bool = False,
+                 max_queue: int = 100, queue_timeout: float = 2.0, call_timeout: float = 10.0,
+                 scan_timeout: float = 60.0, retry_attempts: int = 3, breaker_threshold: int = 5,
+                 breaker_reset: float = 30.0):
         self.project_id = project_id
         self.private_key_path = private_key_path
         self.db = None
         self._initialized = False
-        self._initialize_firebase()
+        self._init_task: Optional[asyncio.Future] = None
+        self._init_error: Optional[Exception] = None
+        
+        # Dedicated thread pool for blocking Firestore calls (same default size as asyncio's)
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="firestore")
+        self._in_flight = 0
+        self._warm = False
+        
+        # Calls beyond the pool wait in a bounded queue and are shed when it's full or slow
+        self.limiter = ConcurrencyLimiter(self.max_workers, max_queue=max_queue, queue_timeout=queue_timeout)
+        
+        # Every call gets a deadline (scans of a whole collection a longer one), transient
+        # failures are retried, and the breaker fails calls fast while Firestore is down
+        self.call_timeout = call_timeout
+        self.scan_timeout = scan_timeout
+        self.retry_policy = RetryPolicy(attempts=retry_attempts)
+        self.breaker = CircuitBreaker("Firestore", failure_threshold=breaker_threshold, reset_timeout=breaker_reset)
+        
+        self.query_planner = MemberQueryPlanner(use_search_keys=use_search_keys)
+        
+        if not defer_init:
+            self._initialize_firebase()
     
     def _initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
+        # Imported here so firebase_admin and grpc load on first use, not at app import
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        
         try:
             if not firebase_admin._apps:
                 # Initialize Firebase Admin SDK
@@ -42,21 +78,141 @@ class FirebaseService:
             logger.info(f"✅ Firebase initialized for project: {self.project_id}")
             
         except Exception as e:
+            self._init_error = e
             logger.error(f"❌ Failed to initialize Firebase: {e}")
             raise
     
-    def _ensure_initialized(self):
-        """Ensure Firebase is initialized"""
+    def start_background_init(self) -> None:
+        """Initialize Firebase in a worker thread without blocking startup"""
+        if self._init_task is not None or self._initialized:
+            return
+        
+        self._init_task = asyncio.get_event_loop().run_in_executor(self._executor, self._initialize_firebase)
+        # The error is recorded in _init_error; retrieve it so asyncio doesn't warn
+        self._init_task.add_done_callback(lambda task: task.exception())
+    
+    @property
+    def status(self) -> str:
+        """Initialization status: ready, initializing, failed or not_initialized"""
+        if self._initialized:
+            return "ready"
+        if self._init_error is not None:
+            return "failed"
+        if self._init_task is not None:
+            return "initializing"
+        return "not_initialized"
+    
+    def close(self) -> None:
+        """Release the Firestore thread pool"""
+        self._executor.shutdown(wait=False)
+    
+    async def _run_in_executor(self, func: Callable, *args, timeout: Optional[float] = None, retry: bool = True) -> Any:
+        """
+        Run a blocking Firestore call on the service's thread pool, within a deadline.
+        
+        func is called as func(*args, timeout=..., retry=None) with the time
+        left before the deadline, so the RPC itself gives up and frees its
+        thread; lambdas must pass those keyword arguments on to the Firestore
+        call. Transient errors are retried with jittered backoff while time
+        remains; pass retry=False for writes that aren't safe to replay.
+        Raises OverloadedError when shed, CircuitOpenError while the breaker
+        is open, and DeadlineExceededError when the deadline passes.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + (timeout or self.call_timeout)
+        attempt = 0
+        
+        while True:
+            try:
+                self.breaker.before_call()
+                result = await self._call_once(func, args, deadline)
+            except CircuitOpenError as e:
+                note_unavailable(e.retry_after)
+                raise
+            except OverloadedError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_success()  # Firestore answered; the call itself was rejected
+                    raise
+                
+                self.breaker.record_failure()
+                delay = self.retry_policy.delay(attempt)
+                attempt += 1
+                if (not retry or attempt >= self.retry_policy.attempts or loop.time() + delay >= deadline
+                        or self.breaker.state == CircuitBreaker.OPEN):
+                    logger.warning(f"Firestore call failed after {attempt} attempt(s): {type(e).__name__}: {e}")
+                    note_unavailable(self.breaker.retry_after() if self.breaker.state == CircuitBreaker.OPEN else 1)
+                    raise
+                
+                logger.info(f"Retrying Firestore call in {delay:.2f}s after {type(e).__name__}")
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.breaker.abandon()  # Cancelled; don't leave a half-open trial outstanding
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+    
+    async def _call_once(self, func: Callable, args: tuple, deadline: float) -> Any:
+        """One attempt on the thread pool, bounded by the deadline"""
+        loop = asyncio.get_event_loop()
+        
+        async with self.limiter:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise DeadlineExceededError("Firestore call deadline passed while queued")
+            
+            self._in_flight += 1
+            try:
+                call = functools.partial(func, *args, timeout=remaining, retry=None)
+                # The RPC deadline normally fires first; this bounds calls that ignore it
+                result = await asyncio.wait_for(loop.run_in_executor(self._executor, call), remaining + 1.0)
+                self._warm = True
+                return result
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError(f"Firestore call exceeded its {remaining:.1f}s deadline")
+            finally:
+                self._in_flight -= 1
+    
+    def executor_stats(self) -> Dict[str, Any]:
+        """Current load on the Firestore thread pool"""
+        return {
+            "in_flight": self._in_flight,
+            "max_workers": self.max_workers,
+            "saturation": round(self._in_flight / self.max_workers, 3),
+            "warm": self._warm,
+            "circuit": self.breaker.state
+        }
+    
+    async def probe(self, collection_name: str = 'morphers', timeout: float = 2.0) -> float:
+        """Run a lightweight limit(1) read and return its latency in seconds"""
+        await self._ensure_initialized()
+        
+        query = self.db.collection(collection_name).limit(1)
+        start = time.perf_counter()
+        await self._run_in_executor(lambda **rpc: list(query.stream(**rpc)), timeout=timeout, retry=False)
+        return time.perf_counter() - start
+    
+    async def _ensure_initialized(self):
+        """Ensure Firebase is initialized, waiting for a background init if one is running"""
+        if self._init_task is not None and not self._init_task.done():
+            try:
+                await asyncio.shield(self._init_task)
+            except Exception:
+                pass  # Reported below
+        
         if not self._initialized or not self.db:
             raise RuntimeError("Firebase service not initialized")
     
     async def get_document(self, collection_name: str, document_id: str) -> Optional[Dict[str, Any]]:
         """Get a document from Firestore"""
-        self._ensure_initialized()
+        await self._ensure_initialized()
         
         try:
             doc_ref = self.db.collection(collection_name).document(document_id)
-            doc = await asyncio.get_event_loop().run_in_executor(None, doc_ref.get)
+            doc = await self._run_in_executor(doc_ref.get)
             
             if doc.exists:
                 data = doc.to_dict()
@@ -68,9 +224,32 @@ class FirebaseService:
             logger.error(f"Error getting document {document_id}: {e}")
             raise
     
+    async def get_documents(self, collection_name: str, document_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Get many documents in one round trip; results follow document_ids, with None for missing ones"""
+        await self._ensure_initialized()
+        
+        try:
+            collection_ref = self.db.collection(collection_name)
+            refs = [collection_ref.document(document_id) for document_id in dict.fromkeys(document_ids)]
+            docs = await self._run_in_executor(lambda **rpc: list(self.db.get_all(refs, **rpc)))
+            
+            # get_all returns documents in no particular order
+            found = {}
+            for doc in docs:
+                if doc.exists:
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    found[doc.id] = data
+            
+            return [found.get(document_id) for document_id in document_ids]
+            
+        except Exception as e:
+            logger.error(f"Error getting {len(document_ids)} documents: {e}")
+            raise
+    
     async def create_document(self, collection_name: str, data: Dict[str, Any], document_id: Optional[str] = None) -> str:
         """Create a new document in Firestore"""
-        self._ensure_initialized()
+        await self._ensure_initialized()
         
         try:
             # Add timestamps
@@ -80,50 +259,105 @@ class FirebaseService:
             
             if document_id:
                 doc_ref = self.db.collection(collection_name).document(document_id)
-                await asyncio.get_event_loop().run_in_executor(None, doc_ref.set, data)
+                await self._run_in_executor(doc_ref.set, data)
                 return document_id
             else:
                 # Auto-generate document ID
                 doc_ref = self.db.collection(collection_name).document()
-                await asyncio.get_event_loop().run_in_executor(None, doc_ref.set, data)
+                await self._run_in_executor(doc_ref.set, data)
                 return doc_ref.id
                 
         except Exception as e:
             logger.error(f"Error creating document: {e}")
             raise
     
-    async def update_document(self, collection_name: str, document_id: str, data: Dict[str, Any]) -> bool:
-        """Update a document in Firestore"""
-        self._ensure_initialized()
+    @staticmethod
+    def _field_paths(data: Dict[Any, Any]) -> Dict[str, Any]:
+        """
+        Update data with tuple keys turned into field paths.
+        
+        A key like ('attendance', '07_01_2024') sets that one entry of a map
+        field, leaving concurrent writes to its other entries alone; None
+        under such a key deletes the entry (or, for a one-element key like
+        ('name_lc',), the whole field).
+        """
+        if not any(isinstance(key, tuple) for key in data):
+            return data
+        
+        from google.cloud.firestore_v1 import DELETE_FIELD
+        from google.cloud.firestore_v1.field_path import FieldPath
+        
+        return {
+            FieldPath(*key).to_api_repr() if isinstance(key, tuple) else key:
+                DELETE_FIELD if isinstance(key, tuple) and value is None else value
+            for key, value in data.items()
+        }
+    
+    async def update_document(self, collection_name: str, document_id: str, data: Dict[Any, Any]) -> bool:
+        """
+        Update a document in Firestore; False if it doesn't exist, other failures raise.
+        
+        Tuple keys update single map entries (see _field_paths).
+        """
+        await self._ensure_initialized()
+        
+        from google.api_core.exceptions import NotFound
         
         try:
             # Add update timestamp
             data['lastUpdated'] = datetime.utcnow()
             
             doc_ref = self.db.collection(collection_name).document(document_id)
-            await asyncio.get_event_loop().run_in_executor(None, doc_ref.update, data)
+            await self._run_in_executor(doc_ref.update, self._field_paths(data))
             return True
             
+        except NotFound:
+            return False
         except Exception as e:
             logger.error(f"Error updating document {document_id}: {e}")
-            return False
+            raise
+    
+    async def _with_subcollections(self, refs: List[Any], subcollections: Sequence[str]) -> List[Any]:
+        """Every document in the named subcollections of refs, followed by refs themselves"""
+        if not subcollections:
+            return list(refs)
+        
+        children = await self._run_in_executor(lambda **rpc: [
+            child for ref in refs for name in subcollections
+            for child in ref.collection(name).list_documents(**rpc)
+        ])
+        return children + list(refs)
     
-    async def delete_document(self, collection_name: str, document_id: str) -> bool:
-        """Delete a document from Firestore"""
-        self._ensure_initialized()
+    async def delete_document(self, collection_name: str, document_id: str, subcollections: Sequence[str] = ()) -> bool:
+        """
+        Delete a document from Firestore; False if it doesn't exist, other failures raise.
+        
+        Firestore keeps subcollections of deleted documents, so the documents
+        in the named subcollections are deleted in the same batch.
+        """
+        await self._ensure_initialized()
+        
+        from google.api_core.exceptions import NotFound
         
         try:
             doc_ref = self.db.collection(collection_name).document(document_id)
-            await asyncio.get_event_loop().run_in_executor(None, doc_ref.delete)
+            batch = self.db.batch()
+            for ref in await self._with_subcollections([doc_ref], subcollections):
+                # Without the precondition Firestore reports success for missing documents
+                batch.delete(ref, option=self.db.write_option(exists=True) if ref is doc_ref else None)
+            # Not retried: a replay of a commit that landed would fail the precondition
+            await self._run_in_executor(batch.commit, retry=False)
             return True
             
+        except NotFound:
+            return False
         except Exception as e:
             logger.error(f"Error deleting document {document_id}: {e}")
-            return False
+            raise
     
     async def query_documents(self, collection_name: str, filters: List[tuple] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Query documents from Firestore"""
-        self._ensure_initialized()
+        await self._ensure_initialized()
         
         try:
             query = self.db.collection(collection_name)
@@ -138,7 +372,7 @@ class FirebaseService:
                 query = query.limit(limit)
             
             # Execute query
-            docs = await asyncio.get_event_loop().run_in_executor(None, query.stream)
+            docs = await self._run_in_executor(lambda **rpc: list(query.stream(**rpc)))
             
             results = []
             for doc in docs:
@@ -154,80 +388,32 @@ class FirebaseService:
     
     async def search_members_by_phone(self, phone_number: str) -> List[Dict[str, Any]]:
         """Search members by phone number (morphers or parents)"""
-        self._ensure_initialized()
-        
-        try:
-            # Search in both MorphersNumber and ParentsNumber fields
-            morphers_query = self.db.collection('morphers').where('MorphersNumber', '==', phone_number)
-            parents_query = self.db.collection('morphers').where('ParentsNumber', '==', phone_number)
-            
-            # Execute queries
-            morphers_docs = await asyncio.get_event_loop().run_in_executor(None, morphers_query.stream)
-            parents_docs = await asyncio.get_event_loop().run_in_executor(None, parents_query.stream)
-            
-            # Combine results
-            results = []
-            doc_ids = set()  # To avoid duplicates
-            
-            for doc in morphers_docs:
-                if doc.id not in doc_ids:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    results.append(data)
-                    doc_ids.add(doc.id)
-            
-            for doc in parents_docs:
-                if doc.id not in doc_ids:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    results.append(data)
-                    doc_ids.add(doc.id)
-            
-            return results
-            
-        except Exception as e:
-            logger.error(f"Error searching members by phone: {e}")
-            raise
-    
-    async def search_members_by_name_prefix(self, name_prefix: str, phone_number: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Search members by name prefix, optionally filtered by phone number"""
-        self._ensure_initialized()
+        await self._ensure_initialized()
         
         try:
-            # Start with base query for name range
-            query = self.db.collection('morphers')
-            query = query.where('Name', '>=', name_prefix)
-            query = query.where('Name', '<=', name_prefix + '\uf8ff')
-            
-            # Execute query
-            docs = await asyncio.get_event_loop().run_in_executor(None, query.stream)
+            # One request: MorphersNumber == phone OR ParentsNumber == phone
+            query = self.query_planner.phone_query(self.db.collection('morphers'), phone_number)
+            docs = await self._run_in_executor(lambda **rpc: list(query.stream(**rpc)))
             
             results = []
             for doc in docs:
                 data = doc.to_dict()
                 data['id'] = doc.id
-                
-                # If phone number is provided, filter by it
-                if phone_number:
-                    if (data.get('MorphersNumber') == phone_number or 
-                        data.get('ParentsNumber') == phone_number):
-                        results.append(data)
-                else:
-                    results.append(data)
+                results.append(data)
             
             return results
             
         except Exception as e:
-            logger.error(f"Error searching members by name prefix: {e}")
+            logger.error(f"Error searching members by phone: {e}")
             raise
     
     async def get_collection_count(self, collection_name: str) -> int:
         """Get count of documents in a collection"""
-        self._ensure_initialized()
+        await self._ensure_initialized()
         
         try:
             collection_ref = self.db.collection(collection_name)
-            docs = await asyncio.get_event_loop().run_in_executor(None, collection_ref.stream)
+            docs = await self._run_in_executor(lambda **rpc: list(collection_ref.stream(**rpc)), timeout=self.scan_timeout)
             
             count = 0
             for _ in docs:
@@ -239,13 +425,15 @@ class FirebaseService:
             logger.error(f"Error getting collection count: {e}")
             return 0
     
-    async def get_all_documents(self, collection_name: str) -> List[Dict[str, Any]]:
-        """Get all documents from a collection"""
-        self._ensure_initialized()
+    async def get_all_documents(self, collection_name: str, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get all documents from a collection, optionally fetching only some fields"""
+        await self._ensure_initialized()
         
         try:
             collection_ref = self.db.collection(collection_name)
-            docs = await asyncio.get_event_loop().run_in_executor(None, collection_ref.stream)
+            if fields:
+                collection_ref = collection_ref.select(fields)
+            docs = await self._run_in_executor(lambda **rpc: list(collection_ref.stream(**rpc)), timeout=self.scan_timeout)
             
             results = []
             for doc in docs:
@@ -259,26 +447,127 @@ class FirebaseService:
             logger.error(f"Error getting all documents: {e}")
             raise
     
-    async def batch_create_documents(self, collection_name: str, documents: List[Dict[str, Any]]) -> List[str]:
-        """Create multiple documents in a batch"""
-        self._ensure_initialized()
+    async def iter_documents(self, collection_name: str, page_size: int = 1000,
+                             fields: Optional[List[str]] = None,
+                             collection_group: bool = False) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Stream a collection page by page (ordered by document ID) without loading it all.
+        
+        With collection_group=True, streams every subcollection with that name
+        and adds each document's parent document ID as 'parent_id'.
+        """
+        await self._ensure_initialized()
+        
+        from google.cloud.firestore_v1.field_path import FieldPath
+        
+        try:
+            if collection_group:
+                query = self.db.collection_group(collection_name)
+            else:
+                query = self.db.collection(collection_name)
+            if fields:
+                query = query.select(fields)
+            query = query.order_by(FieldPath.document_id()).limit(page_size)
+            
+            last_doc = None
+            while True:
+                page_query = query.start_after(last_doc) if last_doc else query
+                docs = await self._run_in_executor(lambda **rpc: list(page_query.stream(**rpc)))
+                
+                if not docs:
+                    return
+                
+                page = []
+                for doc in docs:
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    if collection_group:
+                        data['parent_id'] = doc.reference.parent.parent.id
+                    page.append(data)
+                
+                yield page
+                
+                if len(docs) < page_size:
+                    return
+                last_doc = docs[-1]
+                
+        except Exception as e:
+            logger.error(f"Error iterating documents: {e}")
+            raise
+    
+    async def get_subcollection_documents(self, collection_name: str, document_id: str, subcollection: str,
+                                          subdocument_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch specific documents of a subcollection in one round trip; missing ones are omitted"""
+        await self._ensure_initialized()
         
         try:
+            parent = self.db.collection(collection_name).document(document_id)
+            refs = [parent.collection(subcollection).document(subdocument_id) for subdocument_id in subdocument_ids]
+            docs = await self._run_in_executor(lambda **rpc: list(self.db.get_all(refs, **rpc)))
+            
+            return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+            
+        except Exception as e:
+            logger.error(f"Error getting {subcollection} documents of {document_id}: {e}")
+            raise
+    
+    async def archive_map_entries(self, collection_name: str, document_id: str, field: str, subcollection: str,
+                                  archive: Dict[str, Dict[str, Any]], updates: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Move entries of a map field into subcollection documents in one atomic batch.
+        
+        archive maps subcollection document IDs to the entries they receive;
+        entries are merged into those documents and deleted from the parent's
+        map, so a failure never leaves an entry in both places or neither.
+        updates are applied to the parent in the same batch.
+        """
+        await self._ensure_initialized()
+        
+        from google.cloud.firestore_v1 import DELETE_FIELD
+        from google.cloud.firestore_v1.field_path import FieldPath
+        
+        try:
+            parent = self.db.collection(collection_name).document(document_id)
             batch = self.db.batch()
+            
+            parent_update = dict(updates or {})
+            for subdocument_id, entries in archive.items():
+                batch.set(parent.collection(subcollection).document(subdocument_id), {field: entries}, merge=True)
+                for key in entries:
+                    parent_update[FieldPath(field, key).to_api_repr()] = DELETE_FIELD
+            batch.update(parent, parent_update)
+            
+            await self._run_in_executor(batch.commit)
+            
+        except Exception as e:
+            logger.error(f"Error archiving {field} of {document_id}: {e}")
+            raise
+    
+    async def batch_create_documents(self, collection_name: str, documents: List[Dict[str, Any]], batch_size: int = 500,
+                                     progress_callback: Optional[Callable[[int], None]] = None) -> List[str]:
+        """Create multiple documents in batches (Firestore allows 500 writes per batch)"""
+        await self._ensure_initialized()
+        
+        try:
             doc_ids = []
             
             # Add timestamp to all documents
             now = datetime.utcnow()
-            for doc_data in documents:
-                doc_data['createdAt'] = now
-                doc_data['lastUpdated'] = now
+            for start in range(0, len(documents), batch_size):
+                batch = self.db.batch()
                 
-                doc_ref = self.db.collection(collection_name).document()
-                batch.set(doc_ref, doc_data)
-                doc_ids.append(doc_ref.id)
-            
-            # Commit batch
-            await asyncio.get_event_loop().run_in_executor(None, batch.commit)
+                for doc_data in documents[start:start + batch_size]:
+                    doc_data['createdAt'] = now
+                    doc_data['lastUpdated'] = now
+                    
+                    doc_ref = self.db.collection(collection_name).document()
+                    batch.set(doc_ref, doc_data)
+                    doc_ids.append(doc_ref.id)
+                
+                # Commit batch
+                await self._run_in_executor(batch.commit)
+                if progress_callback:
+                    progress_callback(len(doc_ids))
             
             return doc_ids
             
@@ -286,32 +575,165 @@ class FirebaseService:
             logger.error(f"Error in batch create: {e}")
             raise
     
-    async def batch_delete_collection(self, collection_name: str, batch_size: int = 500) -> int:
-        """Delete all documents in a collection in batches"""
-        self._ensure_initialized()
+    async def batch_update_documents(self, collection_name: str, updates: Dict[str, Dict[str, Any]],
+                                     batch_size: int = 500, max_concurrency: int = 4,
+                                     progress_callback: Optional[Callable[[int], None]] = None) -> int:
+        """Apply partial updates to many documents, committing batches in parallel (tuple keys as in update_document)"""
+        await self._ensure_initialized()
         
         try:
+            items = list(updates.items())
+            semaphore = asyncio.Semaphore(max_concurrency)
+            committed = 0
+            
+            async def commit_chunk(chunk: List[tuple]) -> int:
+                nonlocal committed
+                batch = self.db.batch()
+                for document_id, data in chunk:
+                    batch.update(self.db.collection(collection_name).document(document_id), self._field_paths(data))
+                
+                async with semaphore:
+                    await self._run_in_executor(batch.commit)
+                committed += len(chunk)
+                if progress_callback:
+                    progress_callback(committed)
+                return len(chunk)
+            
+            counts = await asyncio.gather(*(
+                commit_chunk(items[i:i + batch_size]) for i in range(0, len(items), batch_size)
+            ))
+            
+            return sum(counts)
+            
+        except Exception as e:
+            logger.error(f"Error in batch update: {e}")
+            raise
+    
+    async def batch_set_documents(self, documents: List[tuple], batch_size: int = 500, max_concurrency: int = 4,
+                                  progress_callback: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Write (document path, data) pairs as given, committing batches in parallel.
+        
+        Paths may point into subcollections ("morphers/{id}/attendance_archive/2023").
+        Existing documents are overwritten, so a retried or repeated write is harmless.
+        """
+        await self._ensure_initialized()
+        
+        try:
+            semaphore = asyncio.Semaphore(max_concurrency)
+            committed = 0
+            
+            async def commit_chunk(chunk: List[tuple]) -> int:
+                nonlocal committed
+                batch = self.db.batch()
+                for path, data in chunk:
+                    batch.set(self.db.document(path), data)
+                
+                async with semaphore:
+                    await self._run_in_executor(batch.commit)
+                committed += len(chunk)
+                if progress_callback:
+                    progress_callback(committed)
+                return len(chunk)
+            
+            counts = await asyncio.gather(*(
+                commit_chunk(documents[i:i + batch_size]) for i in range(0, len(documents), batch_size)
+            ))
+            
+            return sum(counts)
+            
+        except Exception as e:
+            logger.error(f"Error in batch set: {e}")
+            raise
+    
+    async def batch_delete_documents(self, collection_name: str, document_ids: List[str], batch_size: int = 500,
+                                     subcollections: Sequence[str] = ()) -> int:
+        """Delete specific documents in batches, with the documents in their named subcollections"""
+        await self._ensure_initialized()
+        
+        try:
+            collection_ref = self.db.collection(collection_name)
+            refs = await self._with_subcollections(
+                [collection_ref.document(document_id) for document_id in document_ids], subcollections
+            )
+            for start in range(0, len(refs), batch_size):
+                batch = self.db.batch()
+                for ref in refs[start:start + batch_size]:
+                    batch.delete(ref)
+                
+                await self._run_in_executor(batch.commit)
+            
+            return len(document_ids)
+            
+        except Exception as e:
+            logger.error(f"Error in batch delete: {e}")
+            raise
+    
+    async def batch_delete_collection(self, collection_name: str, batch_size: int = 500, max_concurrency: int = 4,
+                                      progress_callback: Optional[Callable[[int], None]] = None,
+                                      collection_group: bool = False) -> int:
+        """
+        Delete all documents in a collection in batches.
+        
+        Pages are fetched key-only (no field data) and by cursor, so the next
+        page is read while up to max_concurrency earlier pages are committing.
+        With collection_group=True, deletes every subcollection with that name.
+        """
+        await self._ensure_initialized()
+        
+        from google.cloud.firestore_v1.field_path import FieldPath
+        
+        try:
+            collection = self.db.collection_group(collection_name) if collection_group else self.db.collection(collection_name)
+            base_query = (
+                collection
+                .select([FieldPath.document_id()])
+                .order_by(FieldPath.document_id())
+                .limit(batch_size)
+            )
+            semaphore = asyncio.Semaphore(max_concurrency)
+            pending = set()
             deleted_count = 0
             
+            async def commit_page(docs: List[Any]) -> None:
+                nonlocal deleted_count
+                try:
+                    batch = self.db.batch()
+                    for doc in docs:
+                        batch.delete(doc.reference)
+                    
+                    await self._run_in_executor(batch.commit)
+                finally:
+                    semaphore.release()
+                
+                deleted_count += len(docs)
+                logger.info(f"Deleted {deleted_count} documents so far...")
+                if progress_callback:
+                    progress_callback(deleted_count)
+            
+            last_doc = None
             while True:
-                # Get a batch of documents
-                docs = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: list(self.db.collection(collection_name).limit(batch_size).stream())
-                )
+                # Get the next page of keys
+                query = base_query.start_after(last_doc) if last_doc else base_query
+                docs = await self._run_in_executor(lambda **rpc: list(query.stream(**rpc)))
                 
                 if not docs:
                     break
                 
-                # Delete batch
-                batch = self.db.batch()
-                for doc in docs:
-                    batch.delete(doc.reference)
+                # Wait for a commit slot, surfacing any failed commits
+                await semaphore.acquire()
+                for task in [task for task in pending if task.done()]:
+                    pending.discard(task)
+                    task.result()
                 
-                await asyncio.get_event_loop().run_in_executor(None, batch.commit)
-                deleted_count += len(docs)
+                pending.add(asyncio.ensure_future(commit_page(docs)))
+                last_doc = docs[-1]
                 
-                logger.info(f"Deleted {deleted_count} documents so far...")
+                if len(docs) < batch_size:
+                    break
+            
+            if pending:
+                await asyncio.gather(*pending)
             
             return deleted_count
             
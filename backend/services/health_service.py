@@ -0,0 +1,71 @@
+"""
+Health service for liveness and readiness checks
+"""
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any
+
+from services.firebase_service import FirebaseService
+from utils.exceptions import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+class HealthService:
+    """Service for liveness/readiness probes"""
+
+    def __init__(self, firebase_service: FirebaseService, probe_interval: float = 10.0,
+                 probe_timeout: float = 2.0, max_saturation: float = 0.9):
+        self.firebase = firebase_service
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.max_saturation = max_saturation
+        self.startup_complete = False
+
+        self._last_probe: Optional[Dict[str, Any]] = None
+        self._last_probe_at = 0.0
+        self._probe_lock = asyncio.Lock()
+
+    async def check_readiness(self) -> Dict[str, Any]:
+        """Check whether this instance should receive traffic"""
+        firebase_status = self.firebase.status
+        executor = self.firebase.executor_stats()
+
+        # Only probe Firestore once the client exists; the probe would just wait on init otherwise
+        probe = await self._get_probe() if firebase_status == "ready" else None
+
+        ready = (
+            self.startup_complete
+            and firebase_status == "ready"
+            and probe is not None and probe["ok"]
+            and executor["saturation"] < self.max_saturation
+        )
+
+        return {
+            "ready": ready,
+            "startup_complete": self.startup_complete,
+            "firebase": firebase_status,
+            "firestore_probe": probe,
+            "executor": executor
+        }
+
+    async def _get_probe(self) -> Dict[str, Any]:
+        """Return the cached Firestore probe, refreshing it at most once per interval"""
+        async with self._probe_lock:
+            if self._last_probe is None or time.monotonic() - self._last_probe_at >= self.probe_interval:
+                self._last_probe = await self._run_probe()
+                self._last_probe_at = time.monotonic()
+
+            return {**self._last_probe, "age_seconds": round(time.monotonic() - self._last_probe_at, 3)}
+
+    async def _run_probe(self) -> Dict[str, Any]:
+        """Time a limit(1) read against Firestore"""
+        try:
+            latency = await self.firebase.probe(timeout=self.probe_timeout)
+            return {"ok": True, "latency_ms": round(latency * 1000, 1), "error": None}
+        except (asyncio.TimeoutError, DeadlineExceededError):
+            logger.warning(f"Firestore readiness probe timed out after {self.probe_timeout}s")
+            return {"ok": False, "latency_ms": None, "error": "timeout"}
+        except Exception as e:
+            logger.warning(f"Firestore readiness probe failed: {e}")
+            return {"ok": False, "latency_ms": None, "error": str(e)}
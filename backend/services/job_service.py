@@ -0,0 +1,293 @@
+"""
+Job service for running long admin operations in the background
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.firebase_service import FirebaseService
+from utils.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Firestore documents are capped at 1 MiB; larger results are only kept in memory
+MAX_PERSISTED_RESULT_BYTES = 512 * 1024
+
+class Job:
+    """One background operation and its progress"""
+
+    def __init__(self, job_type: str, params: Optional[Dict[str, Any]] = None, created_by: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.params = params or {}
+        self.created_by = created_by
+        self.status = QUEUED
+        self.progress: Dict[str, Any] = {"done": 0, "total": None, "stage": None}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.output_path: Optional[str] = None
+        self.output_name: Optional[str] = None
+        self.output_media_type: Optional[str] = None
+        self.temp_paths: List[str] = []  # Input files the job owns, deleted once it finishes or is cancelled
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._persist_lock = asyncio.Lock()
+        self._on_progress: Optional[Callable[['Job'], None]] = None
+
+    def report(self, done: int, total: Optional[int] = None, stage: Optional[str] = None) -> None:
+        """Progress callback handed to services: done out of total (if known) in the current stage"""
+        self.progress = {"done": done, "total": total, "stage": stage or self.progress.get("stage")}
+        if self._on_progress:
+            self._on_progress(self)
+
+    def set_output(self, path: str, filename: str, media_type: str) -> None:
+        """Attach a file produced by the job, served by GET /api/jobs/{id}/download"""
+        self.output_path = path
+        self.output_name = filename
+        self.output_media_type = media_type
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "status": self.status,
+            "params": self.params,
+            "created_by": self.created_by,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "output": {"filename": self.output_name, "media_type": self.output_media_type} if self.output_name else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class JobService:
+    """
+    Runs admin jobs (import, export, dedup, reindex) as asyncio tasks.
+
+    At most max_concurrency jobs run at once and the rest wait queued, so a
+    burst of admin work can't take over the Firestore thread pool that
+    check-ins share. Each job is mirrored to the 'jobs' collection (progress
+    at most every persist_interval seconds), so its status survives a
+    restart and can be read from other instances. Unfinished jobs, queued
+    or running, are rewritten as a heartbeat, so ones not written for
+    stale_after seconds (their instance stopped) are marked failed at
+    startup. A job's temp_paths are deleted when it finishes,
+    including when it is cancelled before it starts, or when it is found
+    interrupted.
+    """
+
+    def __init__(self, firebase_service: FirebaseService, max_concurrency: int = 1, output_dir: Optional[str] = None,
+                 max_history: int = 100, persist_interval: float = 2.0, stale_after: float = 900.0):
+        self.firebase = firebase_service
+        self.collection_name = "jobs"
+        self.max_concurrency = max_concurrency
+        self.output_dir = output_dir or os.path.join(tempfile.gettempdir(), "morphers-jobs")
+        self.max_history = max_history
+        self.persist_interval = persist_interval
+        self.stale_after = stale_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._last_persisted: Dict[str, float] = {}
+
+    def submit(self, job_type: str, run: Callable[[Job], Awaitable[Any]], params: Optional[Dict[str, Any]] = None,
+               created_by: Optional[str] = None, temp_paths: Optional[List[str]] = None) -> Job:
+        """
+        Queue a job; run(job) does the work, reports through job.report and returns the result.
+
+        The job takes ownership of temp_paths (such as a saved upload) and deletes them when it ends.
+        """
+        job = Job(job_type, params, created_by)
+        job._on_progress = self._progress_changed
+        job.temp_paths = list(temp_paths or [])
+        self._jobs[job.id] = job
+        self._trim_history()
+
+        job.task = asyncio.ensure_future(self._run(job, run))
+        job.task.add_done_callback(lambda _: self._task_done(job))
+        logger.info(f"Queued {job_type} job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's status from this instance, else from the jobs collection"""
+        job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+
+        document = await self.firebase.get_document(self.collection_name, job_id)
+        if document:
+            document.pop('createdAt', None)
+            document.pop('lastUpdated', None)
+            document.pop('temp_paths', None)
+        return document
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Jobs known to this instance, newest first, without their results"""
+        return [{**job.to_dict(), "result": None} for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if it isn't running on this instance"""
+        job = self._jobs.get(job_id)
+        if not job or job.status in FINISHED or not job.task:
+            return False
+        job.task.cancel()
+        return True
+
+    def running_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == RUNNING)
+
+    async def recover_interrupted(self) -> int:
+        """Mark jobs left queued or running by a stopped instance as failed"""
+        try:
+            unfinished = []
+            for status in (QUEUED, RUNNING):
+                unfinished += await self.firebase.query_documents(self.collection_name, [("status", "==", status)])
+
+            # Jobs on other live instances keep writing progress; only silent ones are stale
+            cutoff = time.time() - self.stale_after
+            stale = [
+                document for document in unfinished
+                if document['id'] not in self._jobs
+                and (not document.get('lastUpdated') or document['lastUpdated'].timestamp() < cutoff)
+            ]
+
+            for document in stale:
+                # Files of a job from this host's previous run are still here; others' are skipped
+                self._remove_files(document.get('temp_paths') or [])
+                await self.firebase.update_document(self.collection_name, document['id'], {
+                    "status": FAILED,
+                    "error": "Interrupted by a server restart",
+                    "finished_at": datetime.utcnow()
+                })
+
+            if stale:
+                logger.warning(f"Marked {len(stale)} interrupted jobs as failed")
+            return len(stale)
+
+        except Exception as e:
+            logger.error(f"Error recovering interrupted jobs: {e}")
+            return 0
+
+    async def shutdown(self) -> None:
+        """Cancel unfinished jobs (they are recorded as cancelled)"""
+        tasks = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[Any]]) -> None:
+        heartbeat = None
+        try:
+            await self._persist(job, create=True)
+            heartbeat = asyncio.ensure_future(self._heartbeat(job))
+
+            async with self._semaphore:
+                job.status = RUNNING
+                job.started_at = datetime.utcnow()
+                await self._persist(job)
+                logger.info(f"Started {job.type} job {job.id}")
+
+                job.result = await run(job)
+                job.status = SUCCEEDED
+
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            logger.info(f"Cancelled {job.type} job {job.id}")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logger.error(f"{job.type} job {job.id} failed: {e}")
+        finally:
+            if heartbeat:
+                heartbeat.cancel()
+
+        job.finished_at = datetime.utcnow()
+        if job.status == SUCCEEDED:
+            logger.info(f"Finished {job.type} job {job.id}")
+        await self._persist(job)
+        self._last_persisted.pop(job.id, None)
+
+    async def _heartbeat(self, job: Job) -> None:
+        """
+        Persist an unfinished job every third of stale_after, so instances
+        starting meanwhile don't take it for interrupted while it waits
+        queued or runs a long step without reporting progress.
+        """
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            await self._persist(job)
+
+    def _progress_changed(self, job: Job) -> None:
+        """Persist progress, at most once per persist_interval per job"""
+        now = time.monotonic()
+        if now - self._last_persisted.get(job.id, 0.0) >= self.persist_interval and not job._persist_lock.locked():
+            self._last_persisted[job.id] = now
+            asyncio.ensure_future(self._persist(job))
+
+    async def _persist(self, job: Job, create: bool = False) -> None:
+        """Mirror a job to Firestore; failures are logged, never fail the job"""
+        # One write at a time per job, so a slow progress write can't land after the final one
+        async with job._persist_lock:
+            data = job.to_dict()
+            data.pop('id')
+            data['temp_paths'] = job.temp_paths
+            if data['result'] is not None and len(dumps(data['result'])) > MAX_PERSISTED_RESULT_BYTES:
+                data['result'] = {"truncated": True}
+
+            try:
+                if create:
+                    await self.firebase.create_document(self.collection_name, data, document_id=job.id)
+                else:
+                    await self.firebase.update_document(self.collection_name, job.id, data)
+            except Exception as e:
+                logger.warning(f"Could not persist job {job.id}: {e}")
+
+    def _trim_history(self) -> None:
+        """Forget the oldest finished jobs beyond max_history, deleting their output files"""
+        finished = [job for job in self._jobs.values() if job.status in FINISHED]
+        for job in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job.id]
+            if job.output_path and os.path.exists(job.output_path):
+                os.remove(job.output_path)
+
+    def _task_done(self, job: Job) -> None:
+        """Clean up after a job's task, including one cancelled before _run got to start"""
+        if job.status not in FINISHED:
+            job.status = CANCELLED
+            job.finished_at = datetime.utcnow()
+        self._remove_files(job.temp_paths)
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove job file {path}: {e}")
+
+    def output_path(self, job: Job, suffix: str) -> str:
+        """Where a job should write its output file"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f"{job.id}{suffix}")
@@ -0,0 +1,142 @@
+"""
+Live check-in feed for admin dashboards (Server-Sent Events)
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from services.analytics_service import AnalyticsService
+from services.events import (
+    EventBus, ATTENDANCE_ADDED, ATTENDANCE_REMOVED, MEMBER_DELETED, MEMBER_UPDATED, MEMBERS_REPLACED, changed_fields
+)
+from utils.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+SERVICES = ('1', '2', '3')
+RESYNC = object()  # Queue marker: counters changed in a way events don't describe, send a fresh snapshot
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+class StreamClient:
+    """One connected dashboard with a bounded message buffer"""
+
+    def __init__(self, date_key: str, buffer_size: int):
+        self.date_key = date_key
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def push(self, message: Any) -> None:
+        """Queue a message; a client that falls behind is reset to a snapshot instead of growing"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+class LiveService:
+    """
+    Broadcasts check-ins for a date to every connected dashboard.
+
+    Per-service counters are seeded once per date from the analytics cube
+    and then kept current from attendance events, so connected clients
+    cost no Firestore reads. Only writes made through this instance are seen.
+    """
+
+    def __init__(self, analytics_service: AnalyticsService, events: EventBus,
+                 buffer_size: int = 100, keepalive: float = 15.0):
+        self.analytics = analytics_service
+        self.buffer_size = buffer_size
+        self.keepalive = keepalive
+        self._clients: Dict[str, Set[StreamClient]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self.messages_sent = 0
+
+        events.subscribe(self._on_event)
+
+    async def snapshot(self, date_key: str) -> Dict[str, Any]:
+        """Current counters for a date, seeding them from the analytics cube on first use"""
+        if date_key not in self._counters:
+            day = datetime.strptime(date_key, '%d_%m_%Y').date()
+            series = await self.analytics.get_attendance_series(group_by='service', start=day, end=day)
+            self._counters[date_key] = {service: series['totals'].get(service, 0) for service in SERVICES}
+        return self._payload(date_key)
+
+    async def stream(self, date_key: str, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+        """SSE messages for one client: a snapshot, then check-ins and removals as they happen"""
+        client = StreamClient(date_key, self.buffer_size)
+        self._clients.setdefault(date_key, set()).add(client)
+        logger.info(f"Live feed client connected for {date_key} ({self.client_count()} connected)")
+
+        try:
+            yield format_sse("snapshot", await self.snapshot(date_key))
+
+            while not await is_disconnected():
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if message is RESYNC:
+                    yield format_sse("snapshot", await self.snapshot(date_key))
+                else:
+                    yield format_sse(message["type"], message)
+        finally:
+            self._clients[date_key].discard(client)
+            if not self._clients[date_key]:
+                del self._clients[date_key]
+            logger.info(f"Live feed client disconnected for {date_key} ({self.client_count()} connected)")
+
+    def client_count(self) -> int:
+        return sum(len(clients) for clients in self._clients.values())
+
+    def _payload(self, date_key: str, **extra: Any) -> Dict[str, Any]:
+        counters = dict(self._counters[date_key])
+        return {"date": date_key, "counters": counters, "total": sum(counters.values()), **extra}
+
+    def _broadcast(self, date_key: str, message: Any) -> None:
+        for client in self._clients.get(date_key, ()):
+            client.push(message)
+            self.messages_sent += 1
+
+    def _on_event(self, event_type: str, payload: Dict[str, Any]) -> None:
+        """Apply attendance writes to the counters and fan them out"""
+        if event_type in (ATTENDANCE_ADDED, ATTENDANCE_REMOVED):
+            date_key = payload.get('date')
+            counters = self._counters.get(date_key)
+            if counters is None:
+                return  # Nobody is watching this date
+
+            member = payload.get('member') or {}
+            service = payload.get('service')
+            if event_type == ATTENDANCE_ADDED:
+                previous = payload.get('previous_service')
+                if previous in counters:
+                    counters[previous] -= 1
+                if service in counters:
+                    counters[service] += 1
+                message = self._payload(
+                    date_key, type="checkin", member_id=payload.get('member_id'),
+                    name=member.get('Name', ''), service=service, previous_service=previous
+                )
+            else:
+                if service in counters:
+                    counters[service] -= 1
+                message = self._payload(
+                    date_key, type="removal", member_id=payload.get('member_id'),
+                    name=member.get('Name', ''), service=service
+                )
+            self._broadcast(date_key, message)
+
+        elif event_type in (MEMBER_DELETED, MEMBERS_REPLACED) or (
+                event_type == MEMBER_UPDATED and 'attendance' in changed_fields(payload.get('changes', {}))):
+            # Counters can't be adjusted from these payloads; re-seed on the next snapshot
+            self._counters.clear()
+            for date_key in list(self._clients):
+                self._broadcast(date_key, RESYNC)
@@ -2,127 +2,87 @@
 Member service for handling member-related operations
 """
 import logging
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, date
 
 from services.firebase_service import FirebaseService
+from services.events import (
+    EventBus, ATTENDANCE_ADDED, ATTENDANCE_REMOVED, MEMBER_CREATED, MEMBER_UPDATED, MEMBER_DELETED
+)
 from models import MemberCreateRequest, MemberUpdateRequest
-from utils.validation import PhoneValidator, NameValidator, SchoolValidator
+from utils.validation import PhoneValidator
+from utils.name_matching import best_first_name_match, first_name_similarity
+from utils.search_keys import build_search_keys, search_keys_for_document, SEARCH_KEY_SOURCE_FIELDS
+from utils.attendance_bits import AttendanceBits, date_key_to_day, EPOCH
+from utils.member_schema import SCHEMA_VERSION, migrate_member
+from services.archive_service import ARCHIVE_SUBCOLLECTION
+from services.query_planner import PHONE_FIELDS
 
 logger = logging.getLogger(__name__)
 
 class MemberService:
     """Service for member operations"""
     
-    def __init__(self, firebase_service: FirebaseService):
+    def __init__(self, firebase_service: FirebaseService, events: Optional[EventBus] = None):
         self.firebase = firebase_service
         self.collection_name = "morphers"
+        self.events = events or EventBus()
     
     async def search_member(self, first_name: str, phone_number: str) -> Optional[Dict[str, Any]]:
-        """Search for a member by first name and phone number"""
+        """
+        Search for a member by first name and phone number.
+        
+        Members with the phone (as their own or their parent's number) are
+        fetched with one query and scored in a single pass: a longer prefix
+        of the first name wins, and at the same length a name starting with
+        it beats one containing it. The result carries a "match" with the
+        rule and a confidence in (0, 1].
+        """
         try:
-            # Normalize phone number
             normalized_phone = PhoneValidator.normalize_phone_number(phone_number)
+            candidates = await self.firebase.search_members_by_phone(normalized_phone)
             
-            # Search by phone number first (more specific)
-            phone_matches = await self.firebase.search_members_by_phone(normalized_phone)
+            best = best_first_name_match(first_name, candidates)
+            if not best:
+                return None
             
-            if phone_matches:
-                # Filter by name if we have phone matches
-                for member in phone_matches:
-                    member_name = member.get('Name', '').lower()
-                    if member_name.startswith(first_name.lower()):
-                        return self._convert_firestore_to_response(member)
-                
-                # If no exact name match, check if first name appears anywhere in full name
-                for member in phone_matches:
-                    member_name = member.get('Name', '').lower()
-                    if first_name.lower() in member_name:
-                        return self._convert_firestore_to_response(member)
-            
-            # Progressive search by name with phone filter
-            for i in range(len(first_name), 2, -1):  # Start from full name, go down to 3 chars
-                name_prefix = first_name[:i]
-                name_matches = await self.firebase.search_members_by_name_prefix(
-                    name_prefix, normalized_phone
-                )
-                
-                if name_matches:
-                    # Return the first match
-                    return self._convert_firestore_to_response(name_matches[0])
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error searching for member: {e}")
-            raise
-    
-    async def create_member(self, request: MemberCreateRequest) -> str:
-        """Create a new member"""
-        try:
-            # Validate full name
-            if not NameValidator.validate_full_name(request.name):
-                raise ValueError("Please provide full name (first and last name)")
-            
-            # Validate school name
-            school_validation = SchoolValidator.validate_and_normalize_school_name(request.school)
-            if not school_validation['is_valid']:
-                raise ValueError(school_validation['suggestion'])
-            
-            # Normalize phone numbers
-            morphers_number = PhoneValidator.normalize_phone_number(request.morphers_number)
-            parents_number = PhoneValidator.normalize_phone_number(request.parents_number) if request.parents_number else ""
-            
-            # Create member document
-            member_data = {
-                'Name': request.name.strip(),
-                'MorphersNumber': morphers_number,
-                'ParentsName': request.parents_name.strip() if request.parents_name else '',
-                'ParentsNumber': parents_number,
-                'School': school_validation['normalized_name'],
-                'Class': request.class_level.strip(),
-                'Residence': request.residence.strip(),
-                'Cell': request.cell,
-                'attendance': request.attendance or {}
-            }
-            
-            # Create document in Firebase
-            member_id = await self.firebase.create_document(self.collection_name, member_data)
-            
-            logger.info(f"Created member: {member_id}")
-            return member_id
+            member, rule, confidence = best
+            response = self._format_member_response(member)
+            response["match"] = {"rule": rule, "confidence": confidence}
+            return response
             
         except Exception as e:
-            logger.error(f"Error creating member: {e}")
+            logger.error(f"Error searching member: {e}")
             raise
     
-    async def search_member(self, first_name: str, phone_number: str) -> Optional[Dict[str, Any]]:
-        """Search for a member by first name and phone number"""
+    async def search_household(self, phone_number: str, first_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Every member with this phone as their own or their parent's number.
+        
+        One indexed phone query. Results are ranked by first-name similarity
+        when a first name is given, otherwise by name; each carries a "match"
+        with the phone fields that matched and the name score.
+        """
         try:
-            normalized_phone = self._normalize_phone_number(phone_number)
-            
-            # Progressive search: start with full first name, then shorten
-            for i in range(len(first_name), 2, -1):  # From full name down to 3 characters
-                search_name = first_name[:i]
-                
-                # Search by phone number first
-                phone_results = await self.firebase.search_members_by_phone(normalized_phone)
-                
-                for member in phone_results:
-                    member_name = member.get('Name', '')
-                    if member_name.lower().startswith(search_name.lower()):
-                        return self._format_member_response(member)
-                
-                # If no "starts with" match, try "contains"
-                for member in phone_results:
-                    member_name = member.get('Name', '')
-                    if search_name.lower() in member_name.lower():
-                        return self._format_member_response(member)
-            
-            return None
+            normalized_phone = PhoneValidator.normalize_phone_number(phone_number)
+            matches = await self.firebase.search_members_by_phone(normalized_phone)
+            
+            household = []
+            for member in matches:
+                name = member.get('Name', '')
+                score = first_name_similarity(first_name, name) if first_name else None
+                response = self._format_member_response(member)
+                response["match"] = {
+                    "phone_fields": [field for field in PHONE_FIELDS if member.get(field) == normalized_phone],
+                    "name_score": score
+                }
+                household.append((-(score or 0.0), name.lower(), response))
+            
+            household.sort(key=lambda entry: entry[:2])
+            return [response for _, _, response in household]
             
         except Exception as e:
-            logger.error(f"Error searching member: {e}")
+            logger.error(f"Error searching household: {e}")
             raise
     
     async def get_member(self, member_id: str) -> Optional[Dict[str, Any]]:
@@ -138,26 +98,43 @@ class MemberService:
             logger.error(f"Error getting member {member_id}: {e}")
             raise
     
+    async def get_members(self, member_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Get several members by ID in one read; returns them in request order, and the IDs not found"""
+        try:
+            member_ids = list(dict.fromkeys(member_ids))
+            documents = await self.firebase.get_documents(self.collection_name, member_ids)
+            
+            members = [self._format_member_response(doc) for doc in documents if doc]
+            missing = [member_id for member_id, doc in zip(member_ids, documents) if not doc]
+            return members, missing
+            
+        except Exception as e:
+            logger.error(f"Error getting {len(member_ids)} members: {e}")
+            raise
+    
     async def create_member(self, request: MemberCreateRequest) -> str:
         """Create a new member"""
         try:
             # Prepare member data
             member_data = {
                 "Name": request.name.strip(),
-                "MorphersNumber": self._normalize_phone_number(request.morphers_number),
+                "MorphersNumber": PhoneValidator.normalize_phone_number(request.morphers_number),
                 "ParentsName": request.parents_name.strip() if request.parents_name else "",
-                "ParentsNumber": self._normalize_phone_number(request.parents_number) if request.parents_number else "",
+                "ParentsNumber": PhoneValidator.normalize_phone_number(request.parents_number) if request.parents_number else "",
                 "School": request.school.strip(),
                 "Class": request.class_level.strip(),
                 "Residence": request.residence.strip(),
                 "Cell": request.cell,
-                "attendance": request.attendance or {}
+                "attendance": request.attendance or {},
+                "schemaVersion": SCHEMA_VERSION
             }
+            member_data.update(build_search_keys(member_data["MorphersNumber"], member_data["ParentsNumber"]))
             
             # Create document
             member_id = await self.firebase.create_document(self.collection_name, member_data)
             
             logger.info(f"Created member: {member_id}")
+            self.events.publish(MEMBER_CREATED, member_id=member_id, member=member_data)
             return member_id
             
         except Exception as e:
@@ -174,13 +151,13 @@ class MemberService:
                 update_data["Name"] = request.name.strip()
             
             if request.morphers_number is not None:
-                update_data["MorphersNumber"] = self._normalize_phone_number(request.morphers_number)
+                update_data["MorphersNumber"] = PhoneValidator.normalize_phone_number(request.morphers_number)
             
             if request.parents_name is not None:
                 update_data["ParentsName"] = request.parents_name.strip() if request.parents_name else ""
             
             if request.parents_number is not None:
-                update_data["ParentsNumber"] = self._normalize_phone_number(request.parents_number) if request.parents_number else ""
+                update_data["ParentsNumber"] = PhoneValidator.normalize_phone_number(request.parents_number) if request.parents_number else ""
             
             if request.school is not None:
                 update_data["School"] = request.school.strip()
@@ -200,11 +177,25 @@ class MemberService:
             if not update_data:
                 return True  # No updates needed
             
+            # Keep the derived search keys in sync when a field they're built from changes,
+            # writing back the migrated document since it has been read anyway
+            if any(field in update_data for field in SEARCH_KEY_SOURCE_FIELDS):
+                current = await self.firebase.get_document(self.collection_name, member_id)
+                if not current:
+                    return False
+                changes = migrate_member(current)
+                if 'attendance' in update_data:
+                    # The new map replaces the whole field, entries the migration changed included
+                    changes = {key: value for key, value in changes.items() if not isinstance(key, tuple)}
+                update_data = {**changes, **update_data}
+                update_data.update(search_keys_for_document({**current, **update_data}))
+            
             # Update document
             success = await self.firebase.update_document(self.collection_name, member_id, update_data)
             
             if success:
                 logger.info(f"Updated member: {member_id}")
+                self.events.publish(MEMBER_UPDATED, member_id=member_id, changes=update_data)
             
             return success
             
@@ -215,10 +206,13 @@ class MemberService:
     async def delete_member(self, member_id: str) -> bool:
         """Delete a member"""
         try:
-            success = await self.firebase.delete_document(self.collection_name, member_id)
+            success = await self.firebase.delete_document(
+                self.collection_name, member_id, subcollections=(ARCHIVE_SUBCOLLECTION,)
+            )
             
             if success:
                 logger.info(f"Deleted member: {member_id}")
+                self.events.publish(MEMBER_DELETED, member_id=member_id)
             
             return success
             
@@ -234,19 +228,26 @@ class MemberService:
             if not member:
                 return False
             
-            # Update attendance
-            attendance = member.get('attendance', {})
+            # Update attendance, writing back the migrated document if it was outdated
+            changes = migrate_member(member)
+            attendance = member['attendance']
+            previous_service = attendance.get(date)
             attendance[date] = service
             
-            # Update document
+            # Update document: only this date's entry, so a concurrent check-in or
+            # archive run isn't undone by writing back the whole map read above
             success = await self.firebase.update_document(
                 self.collection_name, 
                 member_id, 
-                {"attendance": attendance}
+                self._with_attendance_entry(changes, date, service)
             )
             
             if success:
                 logger.info(f"Added attendance for member {member_id}: {date} -> {service}")
+                self.events.publish(
+                    ATTENDANCE_ADDED, member_id=member_id, member=member,
+                    date=date, service=service, previous_service=previous_service
+                )
             
             return success
             
@@ -254,14 +255,47 @@ class MemberService:
             logger.error(f"Error adding attendance for member {member_id}: {e}")
             raise
     
-    async def get_attendance(self, member_id: str) -> Dict[str, str]:
-        """Get attendance records for a member"""
+    async def get_attendance(self, member_id: str, since: Optional[date] = None) -> Dict[str, str]:
+        """
+        Get attendance records for a member.
+        
+        Without since, returns the records kept on the member (those newer than
+        the archive horizon). With since, returns every record on or after that
+        date, reading only the archive years it reaches into.
+        """
+        attendance, _ = await self.get_attendance_with_version(member_id, since)
+        return attendance
+    
+    async def get_attendance_with_version(self, member_id: str, since: Optional[date] = None) -> Tuple[Dict[str, str], Any]:
+        """get_attendance, plus the member's lastUpdated (None if unknown) for caching"""
         try:
             member = await self.firebase.get_document(self.collection_name, member_id)
             
-            if member:
-                return member.get('attendance', {})
-            return {}
+            if not member:
+                return {}, None
+            
+            migrate_member(member)
+            attendance = member['attendance']
+            if since is None:
+                return attendance, member.get('lastUpdated')
+            
+            since_day = (since - EPOCH).days
+            records = {}
+            
+            archive = member.get('attendanceArchive') or {}
+            if archive.get('before') and since.isoformat() < archive['before']:
+                years = [year for year in archive.get('years', []) if int(year) >= since.year]
+                archived = await self.firebase.get_subcollection_documents(
+                    self.collection_name, member_id, ARCHIVE_SUBCOLLECTION, years
+                )
+                for doc in archived.values():
+                    records.update(doc.get('attendance') or {})
+            
+            records.update(attendance)
+            return {
+                date_key: service for date_key, service in records.items()
+                if (date_key_to_day(date_key) or 0) >= since_day
+            }, member.get('lastUpdated')
             
         except Exception as e:
             logger.error(f"Error getting attendance for member {member_id}: {e}")
@@ -275,20 +309,24 @@ class MemberService:
             if not member:
                 return False
             
-            # Remove attendance entry
-            attendance = member.get('attendance', {})
+            # Remove attendance entry, writing back the migrated document if it was outdated
+            changes = migrate_member(member)
+            attendance = member['attendance']
             if date in attendance:
-                del attendance[date]
+                service = attendance.pop(date)
                 
-                # Update document
+                # Update document: delete only this date's entry
                 success = await self.firebase.update_document(
                     self.collection_name, 
                     member_id, 
-                    {"attendance": attendance}
+                    self._with_attendance_entry(changes, date, None)
                 )
                 
                 if success:
                     logger.info(f"Removed attendance for member {member_id}: {date}")
+                    self.events.publish(
+                        ATTENDANCE_REMOVED, member_id=member_id, member=member, date=date, service=service
+                    )
                 
                 return success
             
@@ -298,37 +336,41 @@ class MemberService:
             logger.error(f"Error removing attendance for member {member_id}: {e}")
             raise
     
+    def _with_attendance_entry(self, changes: Dict[Any, Any], date: str, service: Optional[str]) -> Dict[Any, Any]:
+        """Update data setting (or, with None, deleting) one attendance entry along with the migration's changes"""
+        if 'attendance' in changes:
+            # The migration replaced the whole map, which already holds this entry's change
+            return changes
+        return {**changes, ('attendance', date): service}
+    
     def _convert_firestore_to_response(self, firestore_doc: Dict[str, Any]) -> Dict[str, Any]:
-        """Convert Firestore document to API response format"""
+        """Convert Firestore document to API response format, migrating it to the current schema first"""
+        migrate_member(firestore_doc)
         return {
             'id': firestore_doc.get('id', ''),
-            'name': firestore_doc.get('Name', ''),
-            'morphers_number': firestore_doc.get('MorphersNumber', ''),
-            'parents_name': firestore_doc.get('ParentsName', ''),
-            'parents_number': firestore_doc.get('ParentsNumber', ''),
-            'school': firestore_doc.get('School', ''),
-            'class': firestore_doc.get('Class', ''),
-            'residence': firestore_doc.get('Residence', ''),
-            'cell': firestore_doc.get('Cell', ''),
-            'attendance': firestore_doc.get('attendance', {}),
+            'name': firestore_doc['Name'],
+            'morphers_number': firestore_doc['MorphersNumber'],
+            'parents_name': firestore_doc['ParentsName'],
+            'parents_number': firestore_doc['ParentsNumber'],
+            'school': firestore_doc['School'],
+            'class': firestore_doc['Class'],
+            'residence': firestore_doc['Residence'],
+            'cell': firestore_doc['Cell'],
+            'attendance': firestore_doc['attendance'],
             'created_at': firestore_doc.get('createdAt'),
             'last_updated': firestore_doc.get('lastUpdated')
         }
     
+    @staticmethod
+    def attendance_to_bits(attendance: Optional[Dict[str, str]]) -> AttendanceBits:
+        """Compact in-memory form of a stored {DD_MM_YYYY: service} attendance map"""
+        return AttendanceBits.from_dict(attendance)
+    
+    @staticmethod
+    def attendance_from_bits(attendance: AttendanceBits) -> Dict[str, str]:
+        """The {DD_MM_YYYY: service} map Firestore stores and the API returns"""
+        return attendance.to_dict()
+    
     def _format_member_response(self, member_doc: Dict[str, Any]) -> Dict[str, Any]:
         """Format member document for API response (alias for _convert_firestore_to_response)"""
         return self._convert_firestore_to_response(member_doc)
-        return {
-            "id": member.get("id"),
-            "name": member.get("Name", ""),
-            "morphers_number": member.get("MorphersNumber", ""),
-            "parents_name": member.get("ParentsName", ""),
-            "parents_number": member.get("ParentsNumber", ""),
-            "school": member.get("School", ""),
-            "class": member.get("Class", ""),
-            "residence": member.get("Residence", ""),
-            "cell": member.get("Cell", ""),
-            "attendance": member.get("attendance", {}),
-            "created_at": member.get("createdAt"),
-            "last_updated": member.get("lastUpdated")
-        }
@@ -0,0 +1,26 @@
+"""
+Query planner for member phone lookups
+"""
+PHONE_FIELDS = ('MorphersNumber', 'ParentsNumber')
+
+class MemberQueryPlanner:
+    """Builds single-request member phone queries served by Firestore's automatic single-field indexes"""
+
+    def __init__(self, use_search_keys: bool = False):
+        # Query the derived phones field (see utils.search_keys); enable once backfilled
+        self.use_search_keys = use_search_keys
+
+    def phone_filter(self, phone_number: str):
+        """OR filter matching the phone in either the morpher's or the parent's number"""
+        from google.cloud.firestore_v1.base_query import FieldFilter, Or
+
+        return Or([FieldFilter(field, '==', phone_number) for field in PHONE_FIELDS])
+
+    def phone_query(self, collection_ref, phone_number: str):
+        """Single-request query for members with this phone as either number"""
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        if self.use_search_keys:
+            return collection_ref.where(filter=FieldFilter('phones', 'array_contains', phone_number))
+
+        return collection_ref.where(filter=self.phone_filter(phone_number))
@@ -0,0 +1,89 @@
+"""
+Version service for HTTP caching (ETags and conditional GETs)
+"""
+import hashlib
+import logging
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from services.events import EventBus, MEMBERS_REPLACED
+
+logger = logging.getLogger(__name__)
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from the parts that identify a representation"""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return etag in (candidate[2:] if candidate.startswith('W/') else candidate for candidate in candidates)
+
+class VersionService:
+    """
+    Tracks representation versions so conditional GETs can skip work.
+
+    Member versions are their lastUpdated timestamps. Versions seen on reads
+    are remembered for ttl seconds and dropped when this instance writes the
+    member, so a matching If-None-Match can be answered without a Firestore
+    read. The ttl bounds staleness from writes made by other instances.
+    Statistics are versioned by a counter bumped on every write event and
+    cached per version for the same ttl.
+    """
+
+    def __init__(self, events: Optional[EventBus] = None, ttl: float = 30.0):
+        self.ttl = ttl
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._member_versions: Dict[str, Tuple[str, float]] = {}
+        self._stats_version = 0
+        self._stats: Optional[Tuple[str, float, Dict[str, Any]]] = None
+
+        if events:
+            events.subscribe(self._on_event)
+
+    def remember_member(self, member_id: str, last_updated: Any) -> str:
+        """Record the version just read for a member and return it"""
+        version = last_updated.isoformat() if hasattr(last_updated, 'isoformat') else str(last_updated)
+        if self.ttl > 0:
+            self._member_versions[member_id] = (version, time.monotonic() + self.ttl)
+        return version
+
+    def cached_member_version(self, member_id: str) -> Optional[str]:
+        """A recently read member version, if still trusted"""
+        cached = self._member_versions.get(member_id)
+        if not cached:
+            return None
+        if cached[1] < time.monotonic():
+            del self._member_versions[member_id]
+            return None
+        return cached[0]
+
+    def stats_version(self) -> str:
+        """Current statistics version; also rolls over every ttl to pick up other instances' writes"""
+        window = int(time.time() // self.ttl) if self.ttl > 0 else time.time()
+        return f"{self.instance_id}-{self._stats_version}-{window}"
+
+    def cached_stats(self, version: str) -> Optional[Dict[str, Any]]:
+        if self._stats and self._stats[0] == version and self._stats[1] >= time.monotonic():
+            return self._stats[2]
+        return None
+
+    def remember_stats(self, version: str, stats: Dict[str, Any]) -> None:
+        if self.ttl > 0:
+            self._stats = (version, time.monotonic() + self.ttl, stats)
+
+    def _on_event(self, event_type: str, payload: Dict[str, Any]) -> None:
+        """Any write changes the statistics; member writes invalidate that member's version"""
+        self._stats_version += 1
+        self._stats = None
+
+        if event_type == MEMBERS_REPLACED:
+            self._member_versions.clear()
+        elif payload.get('member_id'):
+            self._member_versions.pop(payload['member_id'], None)
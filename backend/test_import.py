@@ -0,0 +1,151 @@
+"""
+CSV import checks
+
+Checks that the chunked pandas parser (_parse_csv_frames) and the row
+parser (_parse_csv_rows) agree on awkward files, and that _parse_csv
+falls back to the row parser where pandas can't match it. Then exports
+members, one with archived attendance, to CSV with
+DataService.export_all_data and upsert-imports the unchanged file, which
+must write nothing. Run directly or with pytest.
+"""
+import asyncio
+import copy
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from services.archive_service import ARCHIVE_SUBCOLLECTION
+from services.data_service import DataService
+from utils.member_schema import migrate_member
+
+HEADER = "ID,Name,MorphersNumber,ParentsName,ParentsNumber,School,Class,Residence,Cell,attendance_07_01_2024,attendance_14_01_2024"
+
+CSV_FILES = {
+    "plain": HEADER + "\n"
+             "a1,Jane Doe,0772123456,,,School,S4,Lubowa,1,1,\n"
+             "a2,John Doe,0772123457,Parent,0701234567,School,S4,Lubowa,0,,2\n",
+    "padded values": HEADER + "\n"
+                     "a1,  Jane Doe , 0772123456 ,,, School ,S4 , Lubowa, 1 , 1 ,  3\n",
+    "short rows": HEADER + "\n"
+                  "a1,Jane Doe,0772123456,,,School,S4,Lubowa\n"
+                  "a2,John Doe,0772123457,,,School\n",
+    "invalid rows": HEADER + "\n"
+                    "a1,J,0772123456,,,School,S4,Lubowa,1,1,\n"
+                    "a2,John Doe,12,,,School,S4,Lubowa,1,1,\n"
+                    "a3,Mary Doe,0772123458,,,,S4,Lubowa,1,1,\n"
+                    "a4,Ann Doe,0772123459,,,School,S4,Lubowa,7,4,2\n",
+    "trailing delimiters": HEADER + "\n"
+                           "a1,Jane Doe,0772123456,,,School,S4,Lubowa,1,1,2,\n"
+                           "a2,John Doe,0772123457,,,School,S4,Lubowa,0,,3,\n",
+    "duplicate headers": HEADER + ",Name,attendance_07_01_2024\n"
+                         "a1,Jane Doe,0772123456,,,School,S4,Lubowa,1,1,,Janet Doe,3\n"
+}
+
+def parse_both(text: str, bom: bool = False):
+    """Parse a CSV file both ways, opened as the import endpoint opens uploads"""
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(handle, "w", encoding="utf-8-sig" if bom else "utf-8", newline="") as f:
+        f.write(text)
+    try:
+        service = DataService(FakeFirebase())
+        results = []
+        for parse in (service._parse_csv_rows, service._parse_csv_frames, service._parse_csv):
+            with open(path, encoding="utf-8-sig", newline="") as csv_file:
+                results.append(parse(csv_file))
+        return results
+    finally:
+        os.remove(path)
+
+def test_frame_parser_matches_row_parser():
+    for label, text in CSV_FILES.items():
+        if label == "duplicate headers":
+            continue
+        for bom in (False, True):
+            rows, frames, chosen = parse_both(text, bom)
+            assert frames == rows, (label, bom, frames, rows)
+            assert chosen == rows, (label, bom)
+
+def test_duplicate_headers_use_the_row_parser():
+    rows, _, chosen = parse_both(CSV_FILES["duplicate headers"], bom=True)
+    assert chosen == rows
+    members = rows[0]
+    assert members[0]["Name"] == "Janet Doe" and members[0]["attendance"] == {"07_01_2024": "3"}
+
+def members() -> dict:
+    created = datetime(2023, 1, 1, 9, 30, tzinfo=timezone.utc)
+    documents = {}
+    for i in range(3):
+        member = {
+            "Name": f"Member {i}", "MorphersNumber": f"77200000{i}", "ParentsName": "", "ParentsNumber": "",
+            "School": "School", "Class": "S4", "Residence": "Residence", "Cell": "1",
+            "createdAt": created, "lastUpdated": created, "attendance": {"07_01_2024": "1", "14_01_2024": "2"}
+        }
+        migrate_member(member)
+        documents[f"member{i}"] = member
+    documents["member0"]["attendanceArchive"] = {
+        "count": 2, "byService": {"3": 2}, "years": ["2020", "2021"], "before": "2022-01-01"
+    }
+    return documents
+
+ARCHIVE = {"2020": {"attendance": {"05_01_2020": "3"}}, "2021": {"attendance": {"03_01_2021": "3"}}}
+
+class FakeFirebase:
+    def __init__(self):
+        self.documents = members()
+        self.writes = []
+
+    async def get_all_documents(self, collection_name, fields=None):
+        return [{**copy.deepcopy(document), "id": member_id} for member_id, document in self.documents.items()]
+
+    async def get_subcollection_documents(self, collection_name, document_id, subcollection, document_ids):
+        assert subcollection == ARCHIVE_SUBCOLLECTION and document_id == "member0"
+        return {year: ARCHIVE[year] for year in document_ids}
+
+    async def batch_create_documents(self, collection_name, documents, progress_callback=None):
+        self.writes.append(("create", documents))
+
+    async def batch_update_documents(self, collection_name, updates, max_concurrency=None, progress_callback=None):
+        self.writes.append(("update", updates))
+        return len(updates)
+
+    async def batch_delete_documents(self, collection_name, document_ids, subcollections=()):
+        self.writes.append(("delete", document_ids))
+
+def test_export_then_upsert_writes_nothing():
+    firebase = FakeFirebase()
+    service = DataService(firebase)
+    exported = asyncio.run(service.export_all_data())
+    assert "attendance_05_01_2020" in exported.splitlines()[0]
+
+    result = asyncio.run(service.import_csv_data(exported, mode="upsert"))
+
+    assert (result["created"], result["updated"], result["unchanged"]) == (0, 0, 3), result
+    assert firebase.writes == []
+
+def test_upsert_keeps_archived_dates_out_of_live_attendance():
+    firebase = FakeFirebase()
+    service = DataService(firebase)
+    exported = asyncio.run(service.export_all_data())
+    header, *rows = exported.splitlines()
+    columns = header.split(",")
+    # A new check-in in the file is written, the archived dates beside it are not
+    changed = [row.split(",") for row in rows]
+    for row in changed:
+        if row[columns.index("ID")] == "member0":
+            row[columns.index("attendance_07_01_2024")] = "3"
+
+    result = asyncio.run(service.import_csv_data(
+        "\n".join([header] + [",".join(row) for row in changed]), mode="upsert"
+    ))
+
+    assert result["updated"] == 1, result
+    (kind, updates), = firebase.writes
+    assert kind == "update"
+    assert updates["member0"]["attendance"] == {"07_01_2024": "3", "14_01_2024": "2"}
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n{len(tests)} import checks passed")
@@ -0,0 +1,77 @@
+"""
+Member search matching checks
+
+Pins the rules POST /api/members/search matches first names by: for each
+prefix of the first name, longest first and down to 3 characters, a name
+starting with it beats a name containing it, and earlier candidates win
+ties. Run directly or with pytest.
+"""
+import asyncio
+
+from utils.name_matching import best_first_name_match, first_name_match
+
+def members(*names: str) -> list:
+    return [{"id": str(i), "Name": name} for i, name in enumerate(names)]
+
+def best_name(first_name: str, *names: str):
+    best = best_first_name_match(first_name, members(*names))
+    return best[0]["Name"] if best else None
+
+def test_prefix_beats_contains_at_same_length():
+    assert best_name("John", "Mary John", "Johnny Doe") == "Johnny Doe"
+
+def test_longer_contains_beats_shorter_prefix():
+    assert best_name("Johnathan", "Johan Doe", "Mary Johnathan") == "Mary Johnathan"
+
+def test_prefix_shortened_to_three_characters():
+    assert best_name("Jonathan", "Jonah Doe") == "Jonah Doe"
+    assert best_name("Jonathan", "Jon Doe") == "Jon Doe"
+    assert best_name("Jonathan", "Jo Doe") is None
+
+def test_first_names_under_three_characters_never_match():
+    assert best_name("Jo", "Jo Doe", "John Doe") is None
+
+def test_case_insensitive():
+    assert best_name("JOHN", "john doe") == "john doe"
+    assert best_name("john", "Mary JOHNSON") == "Mary JOHNSON"
+
+def test_earlier_candidate_wins_ties():
+    assert best_name("Anne", "Anne Nakato", "Anne Akello") == "Anne Nakato"
+
+def test_no_candidates():
+    assert best_first_name_match("John", []) is None
+    assert best_name("John", "Mary Doe") is None
+
+def test_rules_and_confidence():
+    assert first_name_match("John", "Johnny") == ("prefix", 4)
+    assert first_name_match("John", "Mary John") == ("contains", 4)
+    assert first_name_match("Jonathan", "Jonah") == ("prefix", 4)
+
+    _, rule, confidence = best_first_name_match("John", members("John Doe"))
+    assert (rule, confidence) == ("prefix", 1.0)
+    _, rule, confidence = best_first_name_match("John", members("Mary John"))
+    assert rule == "contains" and 0 < confidence < 1
+
+def test_service_queries_firestore_once():
+    from services.member_service import MemberService
+
+    class FakeFirebase:
+        calls = 0
+
+        async def search_members_by_phone(self, phone_number):
+            FakeFirebase.calls += 1
+            return members("Mary Nakato", "Johnny Ssemanda")
+
+    service = MemberService(FakeFirebase())
+    member = asyncio.run(service.search_member("Johnathan", "0772000000"))
+
+    assert FakeFirebase.calls == 1
+    assert member["name"] == "Johnny Ssemanda"
+    assert member["match"]["rule"] == "prefix"
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n{len(tests)} search checks passed")
@@ -0,0 +1,94 @@
+"""
+Snapshot export round-trip checks
+
+Exports a small collection (with archived attendance and a malformed date
+key) in each snapshot format through DataService.export_snapshot, then
+checks the file against its manifest with verify_snapshot and reads it
+back with iter_snapshot_records. Parquet is skipped when pyarrow isn't
+installed. Run directly or with pytest.
+"""
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from services.archive_service import ARCHIVE_SUBCOLLECTION
+from services.data_service import DataService
+from utils.snapshot import (
+    SNAPSHOT_FORMATS, detect_snapshot_format, iter_snapshot_records, member_record, verify_snapshot
+)
+
+def members() -> list:
+    created = datetime(2023, 1, 1, 9, 30, tzinfo=timezone.utc)
+    return [
+        {
+            "id": f"member{i:03d}", "Name": f"Member {i}", "MorphersNumber": "772000000", "ParentsName": "",
+            "ParentsNumber": "", "School": "School", "Class": "S4", "Residence": "Residence", "Cell": str(i % 2),
+            "createdAt": created, "lastUpdated": created,
+            "attendance": {"07_01_2024": "1", "14_01_2024": str(1 + i % 3), **({"bad_key": "2"} if i == 3 else {})},
+            **({"attendanceArchive": {"count": 1, "years": ["2022"]}} if i % 4 == 0 else {})
+        }
+        for i in range(25)
+    ]
+
+ARCHIVED = {"attendance": {"04_12_2022": "3"}}
+
+class FakeFirebase:
+    async def iter_documents(self, collection_name, page_size=1000, fields=None, collection_group=False):
+        documents = members()
+        for start in range(0, len(documents), page_size):
+            yield documents[start:start + page_size]
+
+    async def get_subcollection_documents(self, collection_name, document_id, subcollection, document_ids):
+        assert subcollection == ARCHIVE_SUBCOLLECTION
+        return {year: ARCHIVED for year in document_ids}
+
+def formats() -> list:
+    try:
+        import pyarrow  # noqa: F401
+        return list(SNAPSHOT_FORMATS)
+    except ImportError:
+        return [fmt for fmt in SNAPSHOT_FORMATS if fmt != "parquet"]
+
+def export_and_read(fmt: str):
+    handle, path = tempfile.mkstemp(suffix=SNAPSHOT_FORMATS[fmt][0])
+    os.close(handle)
+    try:
+        service = DataService(FakeFirebase())
+        result = asyncio.run(service.export_snapshot(path, fmt, page_size=10))
+        manifest, valid = verify_snapshot(path, fmt)
+        records = [record for page in iter_snapshot_records(path, fmt, page_size=7) for record in page]
+        return result, detect_snapshot_format(path), manifest, valid, records
+    finally:
+        os.remove(path)
+
+def test_export_verifies_and_reads_back():
+    expected = [
+        member_record(member, ARCHIVED["attendance"] if member.get("attendanceArchive") else None)
+        for member in members()
+    ]
+    for fmt in formats():
+        result, detected, manifest, valid, records = export_and_read(fmt)
+
+        assert detected == fmt
+        assert valid, fmt
+        assert manifest["members"] == result["members"] == len(expected)
+        assert manifest["attendance"] == sum(len(record["attendance"]) for record in expected)
+        assert manifest["sha256"] == result["sha256"]
+        assert records == expected, fmt
+
+def test_malformed_keys_and_archive_flags_survive():
+    for fmt in formats():
+        records = {record["id"]: record for record in export_and_read(fmt)[4]}
+
+        entries = records["member003"]["attendance"]
+        assert {"date": None, "service": "2", "archived": False, "key": "bad_key"} in entries
+        archived = [entry for entry in records["member000"]["attendance"] if entry["archived"]]
+        assert [entry["date"].isoformat() for entry in archived] == ["2022-12-04"]
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"\n{len(tests)} snapshot checks passed ({', '.join(formats())})")
@@ -0,0 +1,81 @@
+"""
+Startup-time budget checks for the fast-startup mode
+
+Measures, in a fresh interpreter, how long it takes to import the app and
+to answer the first request. Run directly or with pytest.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+# Budgets in seconds, overridable for slower CI machines
+IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "1.5"))
+FIRST_REQUEST_BUDGET = float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET", "2.0"))
+
+# Modules that must not be loaded just by importing the app
+HEAVY_MODULES = ["pandas", "firebase_admin", "phonenumbers", "passlib.context", "pyarrow"]
+
+IMPORT_SCRIPT = f"""
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+heavy = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+FIRST_REQUEST_SCRIPT = """
+import time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+import main
+with TestClient(main.app) as client:
+    response = client.get("/health")
+elapsed = time.perf_counter() - start
+print(elapsed, response.status_code)
+"""
+
+def _run(script: str) -> list:
+    """Run a script in a fresh interpreter with fast startup enabled"""
+    env = dict(os.environ, FAST_STARTUP="true")
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout.strip().splitlines()[-1].split(" ")
+
+def measure_import() -> tuple:
+    """Return (seconds to import main, heavy modules loaded by the import)"""
+    elapsed, heavy = (_run(IMPORT_SCRIPT) + [""])[:2]
+    return float(elapsed), [name for name in heavy.split(",") if name]
+
+def measure_first_request() -> tuple:
+    """Return (seconds from cold start to first /health response, status code)"""
+    elapsed, status_code = _run(FIRST_REQUEST_SCRIPT)
+    return float(elapsed), int(status_code)
+
+def test_import_budget():
+    elapsed, heavy = measure_import()
+    assert not heavy, f"Heavy modules imported at startup: {heavy}"
+    assert elapsed < IMPORT_BUDGET, f"Import took {elapsed:.3f}s (budget {IMPORT_BUDGET}s)"
+
+def test_first_request_budget():
+    elapsed, status_code = measure_first_request()
+    assert status_code == 200
+    assert elapsed < FIRST_REQUEST_BUDGET, f"First request took {elapsed:.3f}s (budget {FIRST_REQUEST_BUDGET}s)"
+
+if __name__ == "__main__":
+    print("🚀 Measuring cold start...")
+
+    elapsed, heavy = measure_import()
+    print(f"Import: {elapsed:.3f}s (budget {IMPORT_BUDGET}s), heavy modules loaded: {heavy or 'none'}")
+
+    elapsed, status_code = measure_first_request()
+    print(f"First request: {elapsed:.3f}s (budget {FIRST_REQUEST_BUDGET}s), status {status_code}")
@@ -0,0 +1,287 @@
+"""
+Admission control: per-client rate limiting, a bounded Firestore queue and upload size limits
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from utils.exceptions import OverloadedError, PayloadTooLargeError, ServiceUnavailableError
+from utils.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Set for the duration of each HTTP request so a shed or failed Firestore call can turn its 500 into a 503
+_shed_state: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar('shed_state', default=None)
+
+def note_unavailable(retry_after: int) -> None:
+    """Mark the current request as failed by an unavailable backend, so its 500 is sent as a 503"""
+    state = _shed_state.get()
+    if state is not None:
+        state['retry_after'] = max(state['retry_after'] or 0, retry_after)
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume a token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """
+    Token buckets per client IP, plus per route for routes with their own limit.
+
+    Every request draws from its client's default bucket; requests to a
+    configured "METHOD /path" also draw from that route's bucket. Buckets
+    are kept for the most recently seen max_buckets keys.
+    """
+
+    def __init__(self, rate: float, burst: int, route_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 max_buckets: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.route_limits = route_limits or {}
+        self.max_buckets = max_buckets
+        self._buckets: 'OrderedDict[tuple, TokenBucket]' = OrderedDict()
+        self.allowed = 0
+        self.limited: Dict[str, int] = defaultdict(int)
+
+    def _bucket(self, key: tuple, rate: float, burst: int) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, client: str, route: str) -> float:
+        """0 if the request is allowed, else the seconds to wait before retrying"""
+        wait = self._bucket((client, '*'), self.rate, self.burst).take()
+        if not wait and route in self.route_limits:
+            wait = self._bucket((client, route), *self.route_limits[route]).take()
+
+        if wait:
+            self.limited[route if route in self.route_limits else '*'] += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "allowed": self.allowed,
+            "limited": dict(self.limited),
+            "tracked_buckets": len(self._buckets),
+            "rate": self.rate,
+            "burst": self.burst,
+            "routes": {route: {"rate": rate, "burst": burst} for route, (rate, burst) in self.route_limits.items()}
+        }
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent Firestore calls and the queue waiting for them.
+
+    A call that finds the queue full, or waits longer than queue_timeout,
+    raises OverloadedError instead of adding to the backlog.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int = 100, queue_timeout: float = 2.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    def _shed(self, reason: str) -> OverloadedError:
+        retry_after = max(1, math.ceil(self.queue_timeout))
+        note_unavailable(retry_after)
+        logger.warning(f"Shedding Firestore call: {reason} ({self.active} active, {self.waiting} waiting)")
+        return OverloadedError(f"Firestore is overloaded ({reason})", retry_after=retry_after)
+
+    async def __aenter__(self) -> None:
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.shed_queue_full += 1
+                raise self._shed("queue full")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.shed_timeout += 1
+                raise self._shed("queue timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        self.admitted += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout
+        }
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the rate limiter (429) and reporting shed load (503).
+
+    Endpoints turn unexpected errors into 500s; when a request failed
+    because its Firestore call was shed, timed out or hit an open circuit
+    breaker, the 500 is sent as a 503 with Retry-After instead.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None, exempt_paths: Iterable[str] = (),
+                 trust_forwarded_for: bool = False):
+        self.app = app
+        self.limiter = limiter
+        self.exempt_paths = tuple(exempt_paths)
+        self.trust_forwarded_for = trust_forwarded_for
+
+    def _client_ip(self, scope: Dict[str, Any]) -> str:
+        if self.trust_forwarded_for:
+            for name, value in scope.get('headers', []):
+                if name == b'x-forwarded-for':
+                    return value.decode('latin-1').split(',')[0].strip()
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or scope['path'].startswith(self.exempt_paths):
+            return await self.app(scope, receive, send)
+
+        if self.limiter:
+            wait = self.limiter.check(self._client_ip(scope), f"{scope['method']} {scope['path']}")
+            if wait:
+                return await self._reject(send, 429, "Too many requests", math.ceil(wait))
+
+        state = {'retry_after': None, 'started': False}
+        token = _shed_state.set(state)
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message['type'] == 'http.response.start':
+                state['started'] = True
+            if message['type'] == 'http.response.start' and message['status'] == 500 and state['retry_after']:
+                headers = [(name, value) for name, value in message.get('headers', []) if name != b'content-length']
+                message = {**message, 'status': 503, 'headers': headers + [(b'retry-after', str(state['retry_after']).encode())]}
+                state['replace_body'] = True
+            elif message['type'] == 'http.response.body' and state.get('replace_body'):
+                if message.get('more_body'):
+                    return
+                message = {**message, 'body': dumps({"detail": "Service unavailable, retry later"})}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except ServiceUnavailableError as e:
+            if state['started']:
+                raise
+            await self._reject(send, 503, "Service unavailable, retry later", e.retry_after)
+        finally:
+            _shed_state.reset(token)
+
+    async def _reject(self, send, status: int, detail: str, retry_after: int) -> None:
+        body = dumps({"detail": detail})
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(retry_after).encode())
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware rejecting request bodies over a per-route byte limit (413).
+
+    A request declaring a larger Content-Length is rejected before its body
+    is read. Other bodies are counted as they arrive and cut off once over
+    the limit, so an oversized upload is never spooled in full.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits  # "METHOD /path" -> maximum body bytes
+
+    async def __call__(self, scope, receive, send) -> None:
+        limit = self.limits.get(f"{scope['method']} {scope['path']}") if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope.get('headers', []):
+            if name == b'content-length' and value.isdigit() and int(value) > limit:
+                return await self._reject(send, limit)
+
+        state = {'received': 0, 'exceeded': False, 'started': False}
+
+        async def limited_receive() -> Dict[str, Any]:
+            message = await receive()
+            if message['type'] == 'http.request':
+                state['received'] += len(message.get('body', b''))
+                if state['received'] > limit:
+                    state['exceeded'] = True
+                    raise PayloadTooLargeError(f"Request body over {limit} bytes")
+            return message
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            # Whatever the app makes of the cut-off body (usually a 400) is replaced by the 413
+            if state['exceeded']:
+                return
+            if message['type'] == 'http.response.start':
+                state['started'] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_wrapper)
+        except Exception:
+            if not state['exceeded']:
+                raise
+
+        if state['exceeded'] and not state['started']:
+            await self._reject(send, limit)
+
+    async def _reject(self, send, limit: int) -> None:
+        logger.warning(f"Rejected a request body over {limit} bytes")
+        body = dumps({"detail": f"Request body too large (limit {limit} bytes)"})
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
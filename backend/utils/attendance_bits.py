@@ -0,0 +1,202 @@
+"""
+Compact attendance history
+
+Attendance is stored in Firestore and returned by the API as a
+{DD_MM_YYYY: service} map. In memory the backend keeps it as bitsets over
+Sundays instead: one presence bit per Sunday plus a 2-bit service code,
+held in Python ints. Records that don't fit (non-Sunday dates, service
+values other than 1-3, malformed keys) are kept verbatim alongside.
+"""
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+EPOCH = date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+FIRST_SUNDAY = 3  # 1970-01-04 is the first Sunday after the epoch
+
+SERVICE_CODES = {'1': 1, '2': 2, '3': 3}
+SERVICE_VALUES = {1: '1', 2: '2', 3: '3'}
+
+@lru_cache(maxsize=8192)
+def date_key_to_day(date_key: str) -> Optional[int]:
+    """Days since the epoch for a canonical DD_MM_YYYY key, else None"""
+    if (not isinstance(date_key, str) or len(date_key) != 10 or date_key[2] != '_' or date_key[5] != '_'
+            or not (date_key[:2] + date_key[3:5] + date_key[6:]).isdigit()):
+        return None
+    try:
+        return date(int(date_key[6:]), int(date_key[3:5]), int(date_key[:2])).toordinal() - EPOCH_ORDINAL
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=8192)
+def day_to_date_key(day: int) -> str:
+    """DD_MM_YYYY key for a day number"""
+    return (EPOCH + timedelta(days=day)).strftime('%d_%m_%Y')
+
+def popcount(value: int) -> int:
+    return bin(value).count('1')
+
+class AttendanceBits:
+    """A member's attendance as Sunday bitsets plus verbatim extras"""
+
+    __slots__ = ('origin', 'present', 'code_lo', 'code_hi', 'extras')
+
+    def __init__(self):
+        self.origin = 0    # Sunday index of bit 0
+        self.present = 0   # Bit i set: attended on Sunday origin + i
+        self.code_lo = 0   # Low and high bits of the 2-bit service code
+        self.code_hi = 0
+        self.extras: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def from_dict(cls, attendance: Optional[Dict[str, str]]) -> 'AttendanceBits':
+        """Build from the stored {DD_MM_YYYY: service} map"""
+        bits = cls()
+        slots = []
+        for date_key, service in (attendance or {}).items():
+            day = date_key_to_day(date_key)
+            code = SERVICE_CODES.get(service)
+            if day is None or code is None or (day - FIRST_SUNDAY) % 7:
+                if bits.extras is None:
+                    bits.extras = {}
+                bits.extras[date_key] = service
+            else:
+                slots.append(((day - FIRST_SUNDAY) // 7, code))
+
+        if slots:
+            # Set all bits on small ints first; shifting per record would be quadratic
+            bits.origin = min(slot for slot, _ in slots)
+            present = code_lo = code_hi = 0
+            for slot, code in slots:
+                mask = 1 << (slot - bits.origin)
+                present |= mask
+                if code & 1:
+                    code_lo |= mask
+                if code & 2:
+                    code_hi |= mask
+            bits.present, bits.code_lo, bits.code_hi = present, code_lo, code_hi
+        return bits
+
+    def to_dict(self) -> Dict[str, str]:
+        """The {DD_MM_YYYY: service} map used in Firestore and API responses"""
+        attendance = {day_to_date_key(day): service for day, service in self.items()}
+        if self.extras:
+            attendance.update(self.extras)
+        return attendance
+
+    def _slot(self, date_key: str) -> Optional[int]:
+        """Sunday index for a key, or None when the record belongs in extras"""
+        day = date_key_to_day(date_key)
+        if day is None or (day - FIRST_SUNDAY) % 7:
+            return None
+        return (day - FIRST_SUNDAY) // 7
+
+    def add(self, date_key: str, service: str) -> None:
+        """Record attendance, replacing any existing record for that date"""
+        self.remove(date_key)
+
+        slot = self._slot(date_key)
+        code = SERVICE_CODES.get(service)
+        if slot is None or code is None:
+            if self.extras is None:
+                self.extras = {}
+            self.extras[date_key] = service
+            return
+
+        if not self.present:
+            self.origin = slot
+        elif slot < self.origin:
+            shift = self.origin - slot
+            self.present <<= shift
+            self.code_lo <<= shift
+            self.code_hi <<= shift
+            self.origin = slot
+
+        mask = 1 << (slot - self.origin)
+        self.present |= mask
+        if code & 1:
+            self.code_lo |= mask
+        if code & 2:
+            self.code_hi |= mask
+
+    def remove(self, date_key: str) -> Optional[str]:
+        """Remove the record for a date, returning its service"""
+        if self.extras and date_key in self.extras:
+            return self.extras.pop(date_key)
+
+        service = self.get(date_key)
+        if service is not None:
+            mask = ~(1 << (self._slot(date_key) - self.origin))
+            self.present &= mask
+            self.code_lo &= mask
+            self.code_hi &= mask
+        return service
+
+    def get(self, date_key: str) -> Optional[str]:
+        """Service attended on a date, if any"""
+        if self.extras and date_key in self.extras:
+            return self.extras[date_key]
+
+        slot = self._slot(date_key)
+        if slot is None or slot < self.origin or not (self.present >> (slot - self.origin)) & 1:
+            return None
+        return SERVICE_VALUES[self._code(slot - self.origin)]
+
+    def _code(self, bit: int) -> int:
+        return ((self.code_hi >> bit) & 1) << 1 | (self.code_lo >> bit) & 1
+
+    def sundays(self) -> Iterator[Tuple[int, int]]:
+        """(Sunday index, service code) for each Sunday record, in date order"""
+        present = self.present
+        while present:
+            low = present & -present
+            bit = low.bit_length() - 1
+            yield self.origin + bit, self._code(bit)
+            present ^= low
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        """(day number, service) for each Sunday record, in date order"""
+        for slot, code in self.sundays():
+            yield FIRST_SUNDAY + 7 * slot, SERVICE_VALUES[code]
+
+    def records(self) -> Iterator[Tuple[str, str]]:
+        """(DD_MM_YYYY, service) for every record, including extras"""
+        for day, service in self.items():
+            yield day_to_date_key(day), service
+        if self.extras:
+            yield from self.extras.items()
+
+    def service_counts(self) -> Dict[str, int]:
+        """Number of records per service (1-3)"""
+        counts = {
+            '1': popcount(self.present & self.code_lo & ~self.code_hi),
+            '2': popcount(self.present & self.code_hi & ~self.code_lo),
+            '3': popcount(self.present & self.code_lo & self.code_hi)
+        }
+        for service in (self.extras or {}).values():
+            if service in counts:
+                counts[service] += 1
+        return counts
+
+    def __len__(self) -> int:
+        return popcount(self.present) + len(self.extras or {})
+
+    def __bool__(self) -> bool:
+        return bool(self.present or self.extras)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, AttendanceBits) and self.to_dict() == other.to_dict()
+
+def iter_attendance_days(attendance: Union[AttendanceBits, Dict[str, str], None]) -> Iterator[Tuple[int, str]]:
+    """(day number, service) for every dated record of a bitset or a stored attendance map"""
+    if isinstance(attendance, AttendanceBits):
+        yield from attendance.items()
+        undated = attendance.extras or {}
+    else:
+        undated = attendance or {}
+
+    for date_key, service in undated.items():
+        day = date_key_to_day(date_key)
+        if day is not None:
+            yield day, service
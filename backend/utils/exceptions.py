@@ -21,3 +21,28 @@ class PermissionError(Exception):
 class DatabaseError(Exception):
     """Raised when database operation fails"""
     pass
+
+class PayloadTooLargeError(Exception):
+    """Raised when an upload exceeds a configured size or row limit"""
+    pass
+
+class ServiceUnavailableError(Exception):
+    """Raised when the backend can't serve a request now; clients should retry after retry_after seconds"""
+    
+    def __init__(self, message: str = "Service unavailable", retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class OverloadedError(ServiceUnavailableError):
+    """Raised when a request is shed because the backend is at capacity"""
+    
+    def __init__(self, message: str = "Service overloaded", retry_after: int = 1):
+        super().__init__(message, retry_after)
+
+class CircuitOpenError(ServiceUnavailableError):
+    """Raised without calling the backend while its circuit breaker is open"""
+    pass
+
+class DeadlineExceededError(ServiceUnavailableError):
+    """Raised when a backend call doesn't finish within its deadline"""
+    pass
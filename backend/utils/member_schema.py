@@ -0,0 +1,92 @@
+"""
+Member document schema versions and the migrations between them
+
+Every writer stamps member documents with schemaVersion = SCHEMA_VERSION
+in the canonical layout of that version. Documents written earlier (no
+schemaVersion counts as version 0) are upgraded by the migration
+registered for each later version in turn: lazily when read, persisted
+when the member is next written, or all at once by the migrate job.
+Code reading migrated documents can index the canonical fields directly.
+"""
+from typing import Any, Callable, Dict
+
+from utils.search_keys import search_keys_for_document
+
+SCHEMA_VERSION = 1
+
+MEMBER_FIELDS = ('Name', 'MorphersNumber', 'ParentsName', 'ParentsNumber', 'School', 'Class', 'Residence', 'Cell')
+
+# version -> fn(doc) upgrading a document in place from version - 1
+MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], None]] = {}
+
+_CELL_YES = frozenset({'1', 'yes', 'y', 'true'})
+
+def migration(version: int) -> Callable:
+    """Register the migration producing the given schema version"""
+    def register(fn: Callable[[Dict[str, Any]], None]) -> Callable[[Dict[str, Any]], None]:
+        MIGRATIONS[version] = fn
+        return fn
+    return register
+
+def schema_version(member: Dict[str, Any]) -> int:
+    return member.get('schemaVersion') or 0
+
+def migrate_member(member: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Upgrade a member document in place to SCHEMA_VERSION.
+
+    Returns the fields that changed (empty if it was current), ready to be
+    written back. Changes to an existing attendance map come as one
+    ('attendance', date_key) entry each, None for a removed entry, so
+    writing them back doesn't undo check-ins made since the read. Only
+    write them back for a fully read document: a projection is migrated
+    as if its other fields were empty.
+    """
+    version = schema_version(member)
+    if version >= SCHEMA_VERSION:
+        return {}
+
+    # Migrations replace nested values rather than mutating them, so a shallow copy is enough to diff
+    before = dict(member)
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[target](member)
+    member['schemaVersion'] = SCHEMA_VERSION
+
+    changes = {
+        field: value for field, value in member.items()
+        if field != 'id' and (field not in before or before[field] != value)
+    }
+    if 'attendance' in changes and isinstance(before.get('attendance'), dict):
+        changes.update(_map_entry_changes('attendance', before['attendance'], changes.pop('attendance')))
+    return changes
+
+def _map_entry_changes(field: str, before: Dict[Any, Any], after: Dict[str, Any]) -> Dict[tuple, Any]:
+    """(field, key) updates turning one map into another; None deletes an entry"""
+    changes = {(field, key): None for key in before if key not in after}
+    changes.update({(field, key): value for key, value in after.items() if key not in before or before[key] != value})
+    return changes
+
+def canonical_cell(value: Any) -> str:
+    """'1' for members in a cell ('1', 1, True, 'Yes'), otherwise '0'"""
+    return '1' if str(value).strip().lower() in _CELL_YES else '0'
+
+@migration(1)
+def _canonical_fields(member: Dict[str, Any]) -> None:
+    """
+    Version 1: every member field present as a stripped string, Cell '0' or
+    '1', attendance a {date_key: service} dict of strings, and the search
+    keys rebuilt from the stored phones.
+    """
+    for field in MEMBER_FIELDS:
+        value = member.get(field)
+        member[field] = '' if value is None else str(value).strip()
+    member['Cell'] = canonical_cell(member['Cell'])
+
+    attendance = member.get('attendance')
+    member['attendance'] = {
+        str(date_key): str(service).strip()
+        for date_key, service in (attendance.items() if isinstance(attendance, dict) else ())
+        if service is not None
+    }
+
+    member.update(search_keys_for_document(member))
@@ -0,0 +1,114 @@
+"""
+Name similarity utilities
+"""
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Shortest first-name prefix member search will match on
+MIN_PREFIX = 3
+
+def normalize_name(name: str) -> str:
+    """Lower-case and collapse whitespace"""
+    return ' '.join((name or '').split()).lower()
+
+def name_similarity(name_a: str, name_b: str) -> float:
+    """
+    Similarity between two full names in [0, 1].
+
+    Tolerates typos ("Jon Doe" / "John Doe"), swapped order ("Doe John")
+    and an extra middle or last name ("John Doe" / "John Doe Smith").
+    """
+    a = normalize_name(name_a)
+    b = normalize_name(name_b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+
+    tokens_a = a.split()
+    tokens_b = b.split()
+
+    score = max(
+        SequenceMatcher(None, a, b).ratio(),
+        SequenceMatcher(None, ' '.join(sorted(tokens_a)), ' '.join(sorted(tokens_b))).ratio()
+    )
+
+    # One name contains all parts of the other (at least first and last name)
+    shorter, longer = sorted((set(tokens_a), set(tokens_b)), key=len)
+    if len(shorter) >= 2 and shorter <= longer:
+        score = max(score, 0.9)
+
+    return round(score, 3)
+
+def first_name_similarity(first_name: str, full_name: str) -> float:
+    """
+    How well a typed first name matches any part of a full name, in [0, 1].
+
+    An exact part scores 1, a prefix of a part ("Jo" / "John Doe") 0.9,
+    otherwise the best typo-tolerant ratio against a single part.
+    """
+    query = normalize_name(first_name)
+    tokens = normalize_name(full_name).split()
+    if not query or not tokens:
+        return 0.0
+    if query in tokens:
+        return 1.0
+
+    score = max(SequenceMatcher(None, query, token).ratio() for token in tokens)
+    if any(token.startswith(query) for token in tokens):
+        score = max(score, 0.9)
+
+    return round(score, 3)
+
+def first_name_match(first_name: str, full_name: str) -> Optional[Tuple[str, int]]:
+    """
+    The strongest search rule a name satisfies for a typed first name.
+
+    For each prefix of the first name, from all of it down to MIN_PREFIX
+    characters, "prefix" (the name starts with it) beats "contains" (it
+    appears anywhere), and both beat any shorter prefix. Case-insensitive.
+    Returns (rule, prefix length) or None.
+    """
+    query = (first_name or '').lower()
+    name = (full_name or '').lower()
+
+    # Longest prefix of the query the name starts with
+    starts = 0
+    for a, b in zip(query, name):
+        if a != b:
+            break
+        starts += 1
+    if starts == len(query) and starts >= MIN_PREFIX:
+        return 'prefix', starts
+
+    # A longer contained prefix outranks the starting one; equal length goes to "prefix"
+    for length in range(len(query), max(starts, MIN_PREFIX - 1), -1):
+        if query[:length] in name:
+            return 'contains', length
+
+    return ('prefix', starts) if starts >= MIN_PREFIX else None
+
+def best_first_name_match(first_name: str, candidates: Iterable[Dict[str, Any]],
+                          name_field: str = 'Name') -> Optional[Tuple[Dict[str, Any], str, float]]:
+    """
+    Pick the candidate whose name best matches a first name, in one pass.
+
+    Candidates are ranked by first_name_match (earlier candidates win ties).
+    Returns (candidate, rule, confidence), where confidence is 1.0 for a
+    name starting with the whole first name and falls with the rule and
+    prefix length, or None when nothing matches.
+    """
+    best = None
+    best_rank = 0
+    for candidate in candidates:
+        match = first_name_match(first_name, candidate.get(name_field, ''))
+        if not match:
+            continue
+        rule, length = match
+        rank = 2 * length + (rule == 'prefix')
+        if rank > best_rank:
+            best, best_rank = (candidate, rule), rank
+
+    if best is None:
+        return None
+    return best[0], best[1], round(best_rank / (2 * len(first_name) + 1), 3)
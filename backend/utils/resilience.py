@@ -0,0 +1,116 @@
+"""
+Resilience for backend calls: transient error detection, jittered retry and a circuit breaker
+"""
+import logging
+import math
+import random
+import time
+from typing import Any, Dict
+
+from utils.exceptions import CircuitOpenError, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+# google.api_core exception classes worth retrying (matched by name so grpc isn't imported here)
+TRANSIENT_ERRORS = frozenset({
+    'ServiceUnavailable',   # UNAVAILABLE
+    'DeadlineExceeded',     # DEADLINE_EXCEEDED
+    'InternalServerError',  # INTERNAL
+    'Aborted',              # ABORTED (contention)
+    'TooManyRequests',      # RESOURCE_EXHAUSTED (quota)
+    'GatewayTimeout'
+})
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed call may succeed if retried"""
+    if isinstance(error, DeadlineExceededError):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt n waits uniform(0, min(max_delay, base_delay * 2**n))"""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a backend is down.
+
+    After failure_threshold consecutive transient failures the circuit opens
+    and calls raise CircuitOpenError without reaching the backend. After
+    reset_timeout one trial call is let through (half-open): success closes
+    the circuit, failure opens it for another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        """Seconds until the circuit lets a trial call through"""
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        return max(1, math.ceil(remaining))
+
+    def before_call(self) -> None:
+        """Admit a call or raise CircuitOpenError"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+
+        if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_in_flight):
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open", retry_after=self.retry_after())
+
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"{self.name} circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """A call admitted by before_call ended without reaching the backend"""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+            self.times_opened += 1
+            logger.warning(
+                f"{self.name} circuit opened after {self.failures} consecutive failures; "
+                f"failing fast for {self.reset_timeout}s"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_after": self.retry_after() if self.state == self.OPEN else None,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
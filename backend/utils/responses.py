@@ -0,0 +1,44 @@
+"""
+Fast JSON responses and response compression
+"""
+import re
+from datetime import date, datetime
+from typing import Any, Sequence
+
+import orjson
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+def _default(value: Any) -> Any:
+    """Serialize what orjson doesn't handle natively"""
+    # orjson only accepts exact datetime types; Firestore returns DatetimeWithNanoseconds
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes with orjson"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; the app's default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class ExcludingGZipMiddleware:
+    """GZipMiddleware that passes paths matching excluded_handlers through, like brotli_asgi's option"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, excluded_handlers: Sequence[str] = ()):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.excluded = [re.compile(pattern) for pattern in excluded_handlers]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and any(pattern.search(scope["path"]) for pattern in self.excluded):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
@@ -0,0 +1,35 @@
+"""
+Derived search key fields stored on member documents
+
+Firestore can't OR across fields cheaply, so every member carries an array
+of its normalized phone numbers, looked up with one array_contains query.
+"""
+from typing import Any, Dict
+
+from utils.validation import PhoneValidator
+
+SEARCH_KEY_SOURCE_FIELDS = ('MorphersNumber', 'ParentsNumber')
+
+# Name keys earlier versions stored for a prefix search that no longer exists; the reindex job removes them
+OBSOLETE_SEARCH_KEYS = ('name_lc', 'first_name_lc')
+
+def normalize_name(name: str) -> str:
+    """Lower-cased name with runs of whitespace collapsed, for matching names"""
+    return ' '.join((name or '').split()).lower()
+
+def build_search_keys(morphers_number: str = "", parents_number: str = "") -> Dict[str, Any]:
+    """Build the phones array for a member"""
+    phones = []
+    for number in (morphers_number, parents_number):
+        normalized = PhoneValidator.normalize_phone_number(number) if number else ""
+        if normalized and normalized not in phones:
+            phones.append(normalized)
+
+    return {'phones': phones}
+
+def search_keys_for_document(member_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search keys from a member document's stored fields"""
+    return build_search_keys(
+        member_doc.get('MorphersNumber', ''),
+        member_doc.get('ParentsNumber', '')
+    )
@@ -0,0 +1,299 @@
+"""
+Member snapshots for backups and analytics loads
+
+A snapshot holds one record per member with its attendance (live and
+archived) nested as a list of {date, service, archived, key} entries (key
+holds the original date key only when it isn't a valid DD_MM_YYYY date),
+so a backup is one row per member instead of one sparse column per date
+as in the CSV export. Snapshots are written page by page as gzipped NDJSON or as
+Parquet (one row group per page, needs pyarrow). Each snapshot ends with a
+manifest of counts and a SHA-256 over the records' canonical JSON lines,
+which verify_snapshot checks before a restore.
+"""
+import gzip
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from utils.attendance_bits import EPOCH, date_key_to_day
+from utils.member_schema import MEMBER_FIELDS
+from utils.responses import dumps
+
+SNAPSHOT_VERSION = 1
+
+TIMESTAMP_FIELDS = ('createdAt', 'lastUpdated')
+
+# format -> (file suffix, media type)
+SNAPSHOT_FORMATS = {
+    "ndjson": (".ndjson.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet")
+}
+
+def _utc(value: Any) -> Optional[datetime]:
+    """A plain UTC datetime at microsecond precision (naive values are taken as UTC)"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, value.day, value.hour, value.minute, value.second,
+                     value.microsecond, tzinfo=timezone.utc)
+
+@lru_cache(maxsize=8192)
+def _parse_key(date_key: str) -> Tuple[Optional[date], tuple]:
+    """The date of a DD_MM_YYYY key, and its sort order (chronological, malformed keys last)"""
+    day = date_key_to_day(date_key)
+    if day is None:
+        return None, (1, 0, str(date_key))
+    return EPOCH + timedelta(days=day), (0, day, '')
+
+def member_record(member: Dict[str, Any], archived: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Snapshot record for a member document and its archived attendance ({date_key: service})"""
+    record: Dict[str, Any] = {"id": member['id']}
+    for field in MEMBER_FIELDS:
+        value = member.get(field)
+        record[field] = '' if value is None else str(value)
+    for field in TIMESTAMP_FIELDS:
+        record[field] = _utc(member.get(field))
+
+    entries = [(date_key, service, True) for date_key, service in (archived or {}).items()]
+    entries += [(date_key, service, False) for date_key, service in (member.get('attendance') or {}).items()]
+    entries.sort(key=lambda entry: _parse_key(entry[0])[1])
+
+    attendance = []
+    for date_key, service, is_archived in entries:
+        day = _parse_key(date_key)[0]
+        # The original key is only kept when it isn't a valid date
+        attendance.append({"date": day, "service": str(service), "archived": is_archived,
+                           "key": None if day else str(date_key)})
+    record["attendance"] = attendance
+    return record
+
+def canonical_line(record: Dict[str, Any]) -> bytes:
+    """The record as one JSON line; the snapshot checksum is taken over these"""
+    return dumps(record) + b'\n'
+
+class SnapshotWriter(ABC):
+    """Base writer: counts records and keeps the running checksum"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.members = 0
+        self.attendance = 0
+        self._digest = hashlib.sha256()
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        lines = [canonical_line(record) for record in records]
+        for line in lines:
+            self._digest.update(line)
+        self.members += len(records)
+        self.attendance += sum(len(record["attendance"]) for record in records)
+        self._write(records, lines)
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "members": self.members,
+            "attendance": self.attendance,
+            "sha256": self._digest.hexdigest(),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+
+    @abstractmethod
+    def _write(self, records: List[Dict[str, Any]], lines: List[bytes]) -> None:
+        """Write a page of records (lines are their canonical JSON)"""
+
+    @abstractmethod
+    def close(self) -> Dict[str, Any]:
+        """Finish the file and return its manifest"""
+
+class NdjsonSnapshotWriter(SnapshotWriter):
+    """Gzipped JSON lines, one member per line, then a {"snapshot": manifest} line"""
+
+    def __init__(self, path: str, compresslevel: int = 6):
+        super().__init__(path)
+        self._file = gzip.open(path, 'wb', compresslevel=compresslevel)
+
+    def _write(self, records: List[Dict[str, Any]], lines: List[bytes]) -> None:
+        self._file.write(b''.join(lines))
+
+    def close(self) -> Dict[str, Any]:
+        manifest = self.manifest()
+        self._file.write(dumps({"snapshot": manifest}) + b'\n')
+        self._file.close()
+        return manifest
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [pa.field("id", pa.string(), nullable=False)]
+        + [pa.field(field, pa.string()) for field in MEMBER_FIELDS]
+        + [pa.field(field, pa.timestamp('us', tz='UTC')) for field in TIMESTAMP_FIELDS]
+        + [pa.field("attendance", pa.list_(pa.struct([
+            pa.field("date", pa.date32()),
+            pa.field("service", pa.string()),
+            pa.field("archived", pa.bool_()),
+            pa.field("key", pa.string())
+        ])))]
+    )
+
+class ParquetSnapshotWriter(SnapshotWriter):
+    """Parquet, one row group per write; the manifest goes in the footer metadata under 'snapshot'"""
+
+    def __init__(self, path: str, compression: str = 'zstd'):
+        super().__init__(path)
+        import pyarrow.parquet as pq
+
+        self._schema = parquet_schema()
+        self._writer = pq.ParquetWriter(path, self._schema, compression=compression)
+
+    def _write(self, records: List[Dict[str, Any]], lines: List[bytes]) -> None:
+        import pyarrow as pa
+
+        if records:
+            self._writer.write_table(pa.Table.from_pylist(records, schema=self._schema))
+
+    def close(self) -> Dict[str, Any]:
+        manifest = self.manifest()
+        self._writer.add_key_value_metadata({"snapshot": dumps(manifest).decode()})
+        self._writer.close()
+        return manifest
+
+def check_snapshot_format(fmt: str) -> None:
+    """ValueError unless fmt is a snapshot format that can be written here"""
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format '{fmt}'; expected one of {', '.join(SNAPSHOT_FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet snapshots need pyarrow installed")
+
+def open_snapshot_writer(fmt: str, path: str) -> SnapshotWriter:
+    """A writer for 'ndjson' or 'parquet'"""
+    check_snapshot_format(fmt)
+    if fmt == "parquet":
+        return ParquetSnapshotWriter(path)
+    return NdjsonSnapshotWriter(path)
+
+def detect_snapshot_format(path: str) -> str:
+    """'ndjson' or 'parquet' from the file's magic bytes; ValueError for anything else"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(b'\x1f\x8b'):
+        return "ndjson"
+    if head == b'PAR1':
+        check_snapshot_format("parquet")
+        return "parquet"
+    raise ValueError("Not a snapshot file (expected gzipped NDJSON or Parquet)")
+
+_iso_date = lru_cache(maxsize=8192)(date.fromisoformat)
+
+@lru_cache(maxsize=8192)
+def _day_date(day: int) -> date:
+    return EPOCH + timedelta(days=day)
+
+@lru_cache(maxsize=8192)
+def to_date_key(day: date) -> str:
+    """The DD_MM_YYYY attendance key of a date"""
+    return day.strftime('%d_%m_%Y')
+
+def _from_json(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Restore the date and datetime values of a record parsed from NDJSON"""
+    for field in TIMESTAMP_FIELDS:
+        if record.get(field):
+            record[field] = datetime.fromisoformat(record[field])
+    for entry in record.get("attendance") or []:
+        if entry.get("date"):
+            entry["date"] = _iso_date(entry["date"])
+    return record
+
+def _from_parquet(batch) -> List[Dict[str, Any]]:
+    """Records of a Parquet record batch"""
+    import pyarrow as pa
+
+    # to_pylist is slow on the nested attendance column (dates especially), so it is converted column-wise
+    names = batch.schema.names
+    records = pa.Table.from_batches([batch.select([name for name in names if name != "attendance"])]).to_pylist()
+
+    attendance = batch.column(names.index("attendance"))
+    offsets = attendance.offsets.to_pylist()
+    entries = dict(zip(("date", "service", "archived", "key"), attendance.flatten().flatten()))
+    days = entries["date"].cast(pa.int32()).to_pylist()
+    services = entries["service"].to_pylist()
+    archived = entries["archived"].to_pylist()
+    keys = entries["key"].to_pylist()
+
+    dates = {day: _day_date(day) for day in set(days) if day is not None}
+    flat = [
+        {"date": dates.get(day), "service": service, "archived": is_archived, "key": key}
+        for day, service, is_archived, key in zip(days, services, archived, keys)
+    ]
+    base = offsets[0]
+    for i, record in enumerate(records):
+        record["attendance"] = flat[offsets[i] - base:offsets[i + 1] - base]
+    return records
+
+def _is_manifest_line(line: bytes) -> bool:
+    return line.startswith(b'{"snapshot":')
+
+def iter_snapshot_records(path: str, fmt: str, page_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+    """A snapshot's records, page_size at a time, with dates and timestamps as Python values"""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=page_size):
+            yield _from_parquet(batch)
+        return
+
+    page = []
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            if not line.strip() or _is_manifest_line(line):
+                continue
+            page.append(_from_json(orjson.loads(line)))
+            if len(page) >= page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+def verify_snapshot(path: str, fmt: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Read a snapshot through once and check it against its manifest.
+
+    Returns (manifest, valid): valid when the record count and SHA-256 match.
+    Raises ValueError if the file can't be read to the end (e.g. truncated).
+    """
+    digest = hashlib.sha256()
+    members = 0
+    manifest = None
+    try:
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            metadata = pq.ParquetFile(path).metadata.metadata or {}
+            if b'snapshot' in metadata:
+                manifest = orjson.loads(metadata[b'snapshot'])
+            for page in iter_snapshot_records(path, fmt):
+                for record in page:
+                    digest.update(canonical_line(record))
+                members += len(page)
+        else:
+            # NDJSON lines are already canonical, so they are hashed without parsing
+            with gzip.open(path, 'rb') as f:
+                for line in f:
+                    if _is_manifest_line(line):
+                        manifest = orjson.loads(line)["snapshot"]
+                    elif line.strip():
+                        digest.update(line)
+                        members += 1
+    except Exception as e:
+        raise ValueError(f"Snapshot file is unreadable: {e}")
+
+    valid = bool(manifest) and manifest.get("members") == members and manifest.get("sha256") == digest.hexdigest()
+    return manifest, valid
@@ -2,8 +2,6 @@
 Validation utilities
 """
 import re
-import phonenumbers
-from phonenumbers import NumberParseException
 
 class PhoneValidator:
     """Phone number validation utilities"""
@@ -11,6 +9,10 @@ class PhoneValidator:
     @staticmethod
     def validate_phone_number(phone_number: str, country_code: str = 'UG') -> bool:
         """Validate phone number using libphonenumber"""
+        # phonenumbers loads its metadata tables on import, so defer it to first use
+        import phonenumbers
+        from phonenumbers import NumberParseException
+        
         try:
             if not phone_number or not phone_number.strip():
                 return False